@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark parallel .nii.gz writing and indexed volume reads
+
+Writes a synthetic float32 4D series with nib.save (single-threaded gzip)
+and with micaflow.scripts.util_nifti_io.save_nifti (blocks deflated by
+util_gzip.ParallelGzipWriter) for several thread counts, then reads one
+volume near the end of each file with read_volume(), which decompresses the
+whole file up to the volume for standard gzip and only the needed blocks for
+indexed files. Reports times and file sizes.
+
+Usage:
+    python benchmarks/gzip_io.py [--shape 112 112 70 64] [--threads 1 4 8] [--volume -1]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import nibabel as nib
+import numpy as np
+
+from micaflow.scripts.util_nifti_io import read_volume, save_nifti
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel .nii.gz writing and indexed reads")
+    parser.add_argument("--shape", type=int, nargs=4, default=[112, 112, 70, 64],
+                        help="Series shape (default: 112 112 70 64)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8],
+                        help="Thread counts for the parallel writer (default: 1 4 8)")
+    parser.add_argument("--volume", type=int, default=-1, help="Volume to read back (default: last)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Smooth signal plus noise compresses roughly like real DWI data
+    signal = rng.random(args.shape[:3] + [1]) * 1000
+    data = (signal * rng.uniform(0.2, 1.0, args.shape[3]) + rng.normal(0, 20, args.shape)).astype(np.float32)
+    img = nib.Nifti1Image(data, np.eye(4))
+    volume = args.volume % args.shape[3]
+
+    print(f"\nseries {tuple(args.shape)} float32, {data.nbytes / 1e6:.0f} MB uncompressed")
+    print(f"{'writer':<24} {'write (s)':>9} {'speedup':>7} {'MB':>7} {'read vol (s)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nibabel.nii.gz")
+        start = time.perf_counter()
+        nib.save(img, path)
+        baseline = time.perf_counter() - start
+        start = time.perf_counter()
+        read_volume(path, volume)
+        read_time = time.perf_counter() - start
+        print(f"{'nib.save':<24} {baseline:>9.2f} {1.0:>7.2f} "
+              f"{os.path.getsize(path) / 1e6:>7.1f} {read_time:>12.3f}")
+
+        for threads in args.threads:
+            path = os.path.join(tmp, f"parallel{threads}.nii.gz")
+            start = time.perf_counter()
+            save_nifti(img, path, threads=threads)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            read_back = read_volume(path, volume)
+            read_time = time.perf_counter() - start
+            assert np.array_equal(read_back, data[..., volume])
+            print(f"{f'save_nifti, {threads} threads':<24} {elapsed:>9.2f} {baseline / elapsed:>7.2f} "
+                  f"{os.path.getsize(path) / 1e6:>7.1f} {read_time:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
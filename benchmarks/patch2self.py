@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark OLS Patch2Self denoising of a DWI series
+
+Denoises synthetic 4D DWI series with DIPY's patch2self (version 1 and
+version 3, model="ols") and with micaflow.scripts.util_patch2self.
+patch2self_ols (all leave-one-out fits from one shared Gram matrix), and
+reports the time of each and its maximum absolute deviation from DIPY
+version 1. The native engine reproduces version 1, including the constant
+per-volume offset of its predictions (see util_patch2self). Version 3 fits
+on a random count-sketch of the voxels and is only approximately equal.
+
+Usage:
+    python benchmarks/patch2self.py [--volumes 60 200] [--shape 48 48 30] [--threads 1 4]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from micaflow.scripts.util_patch2self import patch2self_ols
+
+
+def make_series(shape, n_volumes, rng):
+    """Return a noisy synthetic series with 5 b0 volumes and its b-values."""
+    signal = rng.random(shape + (1,)) * 1000
+    attenuation = np.concatenate([np.ones(5), rng.uniform(0.2, 0.8, n_volumes - 5)])
+    data = signal * attenuation + rng.normal(0, 30, shape + (n_volumes,))
+    bvals = np.concatenate([np.zeros(5), np.full(n_volumes - 5, 1000)])
+    return np.asfortranarray(data.astype(np.float32)), bvals
+
+
+def deviation(result, reference):
+    """Maximum absolute difference over all volumes."""
+    return np.abs(result.astype(np.float64) - reference).max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OLS Patch2Self denoising of a DWI series")
+    parser.add_argument("--volumes", type=int, nargs="+", default=[60, 200],
+                        help="Series lengths to run (default: 60 200)")
+    parser.add_argument("--shape", type=int, nargs=3, default=[48, 48, 30],
+                        help="Volume shape in voxels (default: 48 48 30)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4],
+                        help="BLAS thread counts for the native engine (default: 1 4)")
+    args = parser.parse_args()
+
+    from dipy.denoise.patch2self import patch2self
+
+    rng = np.random.default_rng(0)
+    for n_volumes in args.volumes:
+        data, bvals = make_series(tuple(args.shape), n_volumes, rng)
+        print(f"\n{n_volumes} volumes of {tuple(args.shape)}")
+        print(f"{'method':<24} {'time (s)':>9} {'speedup':>7} {'deviation':>10}")
+
+        start = time.perf_counter()
+        reference = patch2self(data, bvals, model="ols", shift_intensity=True, clip_negative_vals=False,
+                               b0_threshold=50, b0_denoising=False, version=1)
+        baseline = time.perf_counter() - start
+        print(f"{'dipy version 1':<24} {baseline:>9.2f} {1.0:>7.2f} {0.0:>10.2e}")
+
+        start = time.perf_counter()
+        sketched = patch2self(data, bvals, model="ols", shift_intensity=True, clip_negative_vals=False,
+                              b0_threshold=50, b0_denoising=False, version=3)
+        elapsed = time.perf_counter() - start
+        print(f"{'dipy version 3':<24} {elapsed:>9.2f} {baseline / elapsed:>7.2f} "
+              f"{deviation(sketched, reference):>10.2e}")
+
+        for threads in args.threads:
+            start = time.perf_counter()
+            denoised = patch2self_ols(data, bvals, b0_threshold=50, threads=threads)
+            elapsed = time.perf_counter() - start
+            print(f"{f'native threads={threads}':<24} {elapsed:>9.2f} {baseline / elapsed:>7.2f} "
+                  f"{deviation(denoised, reference):>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark micaflow command dispatch latency
+
+Times end-to-end ``micaflow <command>`` calls on small synthetic inputs with
+the two dispatch modes supported by micaflow.cli:
+
+- inprocess  : the CLI imports the script module and calls its main(argv)
+- subprocess : the CLI re-executes ``python -m micaflow.scripts.<name>``
+
+The inputs are deliberately tiny so that the measured time is dominated by
+interpreter start-up and module imports rather than by the processing itself.
+This is the overhead paid by every rule of the Snakemake pipeline.
+
+Usage:
+    python benchmarks/startup_latency.py [--repeats 5] [--commands bet normalize extract_b0]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import nibabel as nib
+import numpy as np
+
+
+DISPATCH_MODES = ["subprocess", "inprocess"]
+
+
+def make_inputs(workdir):
+    """
+    Write small synthetic inputs for the benchmarked commands.
+
+    Parameters
+    ----------
+    workdir : str
+        Directory in which the inputs are written.
+
+    Returns
+    -------
+    dict
+        Mapping of command name to the argument list used to run it.
+    """
+    rng = np.random.default_rng(0)
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+
+    t1w = os.path.join(workdir, "t1w.nii.gz")
+    data = rng.random((32, 32, 32), dtype=np.float32) * 1000
+    nib.save(nib.Nifti1Image(data, affine), t1w)
+
+    parc = os.path.join(workdir, "parc.nii.gz")
+    labels = np.zeros((32, 32, 32), dtype=np.int16)
+    labels[8:24, 8:24, 8:24] = 2
+    nib.save(nib.Nifti1Image(labels, affine), parc)
+
+    dwi = os.path.join(workdir, "dwi.nii.gz")
+    bvals = np.array([0, 1000, 1000, 1000, 0, 1000])
+    dwi_data = rng.random((32, 32, 16, len(bvals)), dtype=np.float32) * 1000
+    nib.save(nib.Nifti1Image(dwi_data, affine), dwi)
+    bval_file = os.path.join(workdir, "dwi.bval")
+    np.savetxt(bval_file, bvals[None, :], fmt="%d")
+    bvec_file = os.path.join(workdir, "dwi.bvec")
+    bvecs = rng.standard_normal((3, len(bvals)))
+    np.savetxt(bvec_file, bvecs / np.linalg.norm(bvecs, axis=0), fmt="%.6f")
+
+    out = lambda name: os.path.join(workdir, name)
+    return {
+        "bet": [
+            "--input", t1w, "--parcellation", parc,
+            "--output", out("bet.nii.gz"), "--output-mask", out("bet_mask.nii.gz"),
+        ],
+        "normalize": ["--input", t1w, "--output", out("norm.nii.gz")],
+        "extract_b0": [
+            "--input", dwi, "--bvals", bval_file, "--bvecs", bvec_file,
+            "--output", out("b0.nii.gz"),
+        ],
+    }
+
+
+def time_command(command, args, mode, repeats):
+    """
+    Run ``micaflow <command>`` repeatedly and return the wall-clock times.
+
+    Parameters
+    ----------
+    command : str
+        micaflow subcommand to run.
+    args : list of str
+        Arguments forwarded to the subcommand.
+    mode : str
+        Dispatch mode, one of DISPATCH_MODES.
+    repeats : int
+        Number of timed runs.
+
+    Returns
+    -------
+    list of float
+        Wall-clock time of each run in seconds.
+    """
+    env = dict(os.environ, MICAFLOW_DISPATCH=mode)
+    cmd = [sys.executable, "-m", "micaflow.cli", command] + args
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micaflow command dispatch latency")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Number of timed runs per command and mode (default: 5)")
+    parser.add_argument("--commands", nargs="+", default=["bet", "normalize", "extract_b0"],
+                        help="Commands to benchmark (default: bet normalize extract_b0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = make_inputs(workdir)
+        print(f"{'command':<12} {'mode':<11} {'median (s)':>10} {'min (s)':>9}")
+        for command in args.commands:
+            if command not in inputs:
+                parser.error(f"no benchmark inputs defined for '{command}'")
+            # Warm-up run so that the file system cache is comparable between modes
+            time_command(command, inputs[command], "inprocess", 1)
+            medians = {}
+            for mode in DISPATCH_MODES:
+                times = time_command(command, inputs[command], mode, args.repeats)
+                medians[mode] = statistics.median(times)
+                print(f"{command:<12} {mode:<11} {medians[mode]:>10.3f} {min(times):>9.3f}")
+            saved = medians["subprocess"] - medians["inprocess"]
+            print(f"{command:<12} {'saved':<11} {saved:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark SynB0-DISCO inference backends against eager float32 on the CPU
+
+Runs micaflow.scripts.synb0_DISCO.ensemble.EnsembleInference on a synthetic
+T1w / b0 pair with every backend configuration (eager, TorchScript and
+onnxruntime; float32 or bfloat16 autocast; default or channels-last memory
+format) and reports the inference time and the deviation from eager
+float32. The deviation is the maximum absolute difference relative to the
+intensity range of the reference prediction and must stay below --tolerance
+(float32 configurations) or --bf16-tolerance (bfloat16 ones).
+
+Without --models-dir the folds are randomly initialized UNet3D networks.
+Their deep stack of untrained layers amplifies bfloat16 rounding, so the
+bfloat16 deviation of trained folds (--models-dir) is the meaningful one.
+
+Exports are written to a temporary cache, so the first (export) run is
+excluded from the timings. Configurations whose dependencies are missing
+(onnx / onnxruntime) are reported as skipped.
+
+Usage:
+    python benchmarks/synb0_backends.py [--folds 1] [--repeats 2] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from micaflow.scripts.synb0_DISCO.ensemble import EnsembleInference
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synb0_ensemble import make_inputs, make_models  # noqa: E402
+
+# (backend, bf16, channels_last)
+CONFIGURATIONS = [
+    ("eager", False, False),
+    ("eager", False, True),
+    ("eager", True, False),
+    ("eager", True, True),
+    ("torchscript", False, False),
+    ("torchscript", True, True),
+    ("onnxruntime", False, False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SynB0-DISCO inference backends on the CPU")
+    parser.add_argument("--folds", type=int, default=1, help="Number of folds (default: 1)")
+    parser.add_argument("--repeats", type=int, default=2, help="Timed runs per configuration (default: 2)")
+    parser.add_argument("--models-dir", help="Directory with trained folds (default: random weights)")
+    parser.add_argument("--grid", type=int, nargs=3, default=[77, 91, 77],
+                        help="Input grid in voxels (default: 77 91 77, the SynB0 grid)")
+    parser.add_argument("--tolerance", type=float, default=1e-3,
+                        help="Maximum relative deviation of float32 backends (default: 1e-3)")
+    parser.add_argument("--bf16-tolerance", type=float, default=1e-1,
+                        help="Maximum relative deviation of bfloat16 backends (default: 1e-1)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="PyTorch intra-op threads (default: all CPUs)")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    device = torch.device("cpu")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        t1_path, b0_path = make_inputs(workdir, tuple(args.grid))
+        if args.models_dir:
+            model_paths = sorted(
+                os.path.join(args.models_dir, f) for f in os.listdir(args.models_dir)
+                if f.endswith((".pt", ".pth"))
+            )[:args.folds]
+        else:
+            model_paths = make_models(workdir, args.folds)
+        cache_dir = os.path.join(workdir, "cache")
+
+        results = []
+        reference = None
+        for backend, bf16, channels_last in CONFIGURATIONS:
+            name = f"{backend}{' bf16' if bf16 else ''}{' channels-last' if channels_last else ''}"
+            try:
+                ensemble = EnsembleInference(model_paths, device, backend=backend, bf16=bf16,
+                                             channels_last=channels_last, cache_dir=cache_dir)
+                # Warm-up run (also the export run for exported backends)
+                ensemble.predict(t1_path, b0_path)
+            except ImportError as e:
+                results.append((name, None, None, f"skipped: {e}"))
+                continue
+
+            times = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                prediction = ensemble.predict(t1_path, b0_path)
+                times.append(time.perf_counter() - start)
+
+            if reference is None:
+                reference = prediction
+            deviation = np.abs(prediction - reference).max() / np.ptp(reference)
+            tolerance = args.bf16_tolerance if bf16 else args.tolerance
+            results.append((name, min(times), deviation, "ok" if deviation <= tolerance else "FAIL"))
+
+        baseline = results[0][1]
+        print(f"\n{'configuration':<32} {'time (s)':>9} {'speedup':>7} {'rel. dev.':>9}  status")
+        for name, elapsed, deviation, status in results:
+            if elapsed is None:
+                print(f"{name:<32} {'-':>9} {'-':>7} {'-':>9}  {status}")
+            else:
+                print(f"{name:<32} {elapsed:>9.2f} {baseline / elapsed:>7.2f} {deviation:>9.2e}  {status}")
+
+    if any(status == "FAIL" for *_, status in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark SynB0-DISCO ensemble inference on the CPU
+
+Runs micaflow.scripts.synb0_DISCO.ensemble.EnsembleInference on a synthetic
+T1w / b0 pair and reports the time of every forward pass (one fold, or
+several folds batched together) and the total, next to the previous approach
+of loading each fold and re-reading the inputs for every model.
+
+Without --models-dir the folds are randomly initialized UNet3D networks,
+which have the same cost as trained ones. The inputs are padded to a
+multiple of 8 voxels per axis; --grid shrinks them for quick runs.
+
+Usage:
+    python benchmarks/synb0_ensemble.py [--folds 5] [--batch-sizes 1 5] [--threads 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import nibabel as nib
+import numpy as np
+import torch
+
+from micaflow.scripts.synb0_DISCO import inference as synb0_inference
+from micaflow.scripts.synb0_DISCO.ensemble import EnsembleInference, load_model
+from micaflow.scripts.synb0_DISCO.model import UNet3D
+from micaflow.scripts.synb0_DISCO.util import torch2nii
+
+
+def make_inputs(workdir, grid):
+    """
+    Write a synthetic T1w and distorted b0 on the network grid.
+
+    Parameters
+    ----------
+    workdir : str
+        Directory in which the inputs are written.
+    grid : tuple of int
+        Input grid (x, y, z).
+
+    Returns
+    -------
+    tuple of str
+        Paths of the T1w and b0 images.
+    """
+    rng = np.random.default_rng(0)
+    paths = []
+    for name in ("T1.nii.gz", "b0.nii.gz"):
+        data = rng.random(grid, dtype=np.float32) * 1000
+        path = os.path.join(workdir, name)
+        nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+        paths.append(path)
+    return tuple(paths)
+
+
+def make_models(workdir, folds):
+    """Save randomly initialized UNet3D folds and return their paths."""
+    paths = []
+    for fold in range(folds):
+        torch.manual_seed(fold)
+        path = os.path.join(workdir, f"fold_{fold}.pth")
+        torch.save(UNet3D(2, 1).state_dict(), path)
+        paths.append(path)
+    return paths
+
+
+def sequential_baseline(model_paths, t1_path, b0_path, device):
+    """Load, preprocess and infer per fold, then average a list of outputs."""
+    predictions = []
+    for path in model_paths:
+        model = load_model(path, device)
+        predictions.append(torch2nii(synb0_inference.inference(t1_path, b0_path, model, device)))
+    return np.mean(predictions, axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SynB0-DISCO ensemble inference on the CPU")
+    parser.add_argument("--folds", type=int, default=5, help="Number of folds (default: 5)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5],
+                        help="Folds per forward pass to benchmark (default: 1 5)")
+    parser.add_argument("--models-dir", help="Directory with trained folds (default: random weights)")
+    parser.add_argument("--grid", type=int, nargs=3, default=[77, 91, 77],
+                        help="Input grid in voxels (default: 77 91 77, the SynB0 grid)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="PyTorch intra-op threads (default: all CPUs)")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    device = torch.device("cpu")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        t1_path, b0_path = make_inputs(workdir, tuple(args.grid))
+        if args.models_dir:
+            model_paths = sorted(
+                os.path.join(args.models_dir, f) for f in os.listdir(args.models_dir)
+                if f.endswith((".pt", ".pth"))
+            )[:args.folds]
+        else:
+            model_paths = make_models(workdir, args.folds)
+
+        start = time.perf_counter()
+        reference = sequential_baseline(model_paths, t1_path, b0_path, device)
+        baseline = time.perf_counter() - start
+
+        print(f"\n{'batch':>5} {'pass':>4} {'folds':>5} {'time (s)':>9}")
+        totals = []
+        for batch_size in args.batch_sizes:
+            ensemble = EnsembleInference(model_paths, device, batch_size=batch_size)
+            start = time.perf_counter()
+            prediction = ensemble.predict(t1_path, b0_path)
+            total = time.perf_counter() - start
+            for index, (fold_paths, seconds) in enumerate(ensemble.timings):
+                print(f"{batch_size:>5} {index:>4} {len(fold_paths):>5} {seconds:>9.2f}")
+            totals.append((batch_size, total, np.abs(prediction - reference).max()))
+
+        print(f"\n{'method':>20} {'total (s)':>9} {'max diff':>9}")
+        print(f"{'sequential reload':>20} {baseline:>9.2f} {0.0:>9.2e}")
+        for batch_size, total, diff in totals:
+            print(f"{f'ensemble batch={batch_size}':>20} {total:>9.2f} {diff:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
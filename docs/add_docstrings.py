@@ -55,7 +55,7 @@ def add_module_docstring(file_path, description):
 def main():
     """Add docstrings to all script modules."""
     for script_file in Path(SCRIPTS_DIR).glob("*.py"):
-        if script_file.stem in ["__init__", "util_bids_pathing"]:
+        if script_file.stem == "__init__" or script_file.stem.startswith("util_"):
             continue
         
         description = descriptions.get(script_file.stem, f"MicaFlow {script_file.stem} utility.")
@@ -256,7 +256,7 @@ def create_scripts_index():
         
         # List all script modules with short descriptions
         script_files = [p.stem for p in Path(SCRIPTS_DIR).glob("*.py") 
-                       if p.stem not in ["__init__", "util_bids_pathing"]]
+                       if p.stem != "__init__" and not p.stem.startswith("util_")]
         
         for script in sorted(script_files):
             short_desc = get_short_description(script)
@@ -298,7 +298,7 @@ def main():
     
     # Process all Python files in the scripts directory
     script_files = [p.stem for p in Path(SCRIPTS_DIR).glob("*.py") 
-                   if p.stem not in ["__init__", "util_bids_pathing"]]
+                   if p.stem != "__init__" and not p.stem.startswith("util_")]
     
     for script_name in script_files:
         print(f"Processing {script_name}...")
@@ -45,6 +45,7 @@ Segmentation and Analysis:
 Utilities:
   extract_b0        : Extract b=0 volumes from DWI
   calculate_dice    : DICE coefficient calculation
+  serve             : Persistent worker for commands run with --via-daemon
 
 Command Routing:
 ---------------
@@ -101,8 +102,17 @@ $ micaflow pipeline --dry-run --subject sub-001 --t1w-file t1.nii.gz
 
 Notes:
 -----
-- The CLI uses subprocess.run() to execute individual scripts
-- All scripts are invoked as Python modules: python -m micaflow.scripts.[name]
+- Individual scripts run in-process through their main(argv) entry point
+- Set MICAFLOW_DISPATCH=subprocess to run them as Python modules instead:
+  python -m micaflow.scripts.[name]
+- Add --via-daemon to any command to run module commands on a
+  'micaflow serve' worker with ANTs, PyTorch and DIPY already imported
+- Derived images are float32 (or the input's dtype), masks uint8; set
+  MICAFLOW_SCALED_INT16=1 to store continuous outputs as scaled int16
+- Set MICAFLOW_IO_LOG=<file.tsv> to log the image read/write time of every
+  command (the pipeline's --io-timing does this per subject)
+- .nii.gz outputs are compressed in parallel threads; MICAFLOW_GZIP_THREADS
+  sets their number for commands without --threads (default: 1)
 - The pipeline command uses Snakemake for workflow management
 - Configuration can be provided via command-line args or YAML config file
 """
@@ -120,7 +130,10 @@ import zipfile
 import tempfile
 import shutil
 from colorama import init, Fore, Style
-import importlib.resources
+import importlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 init()
 
@@ -177,10 +190,16 @@ def check_and_download_models():
         print(f"{Fore.RED}Failed to download or extract models: {e}{Style.RESET_ALL}")
 
 
-def get_snakefile_path():
+def get_snakefile_path(filename="Snakefile"):
     """
     Get the path to the Snakefile within the installed package using importlib.resources.
 
+    Parameters
+    ----------
+    filename : str, optional
+        Name of the workflow file in micaflow/resources (default: "Snakefile").
+        Use "Snakefile_multi" for the multi-subject workflow.
+
     Returns
     -------
     str
@@ -206,16 +225,258 @@ def get_snakefile_path():
     -----
     - The Snakefile must be in micaflow/resources/Snakefile
     - Path is resolved at runtime based on installation location
-    - Used exclusively by the 'pipeline' command
+    - Used by the 'pipeline' command and by 'bids --single-dag'
     """
     try:
+        # Imported here so that module commands and --help do not load it
+        import importlib.resources
+
         # Python 3.9+: files() returns a Traversable object
-        snakefile = importlib.resources.files("micaflow.resources").joinpath("Snakefile")
+        snakefile = importlib.resources.files("micaflow.resources").joinpath(filename)
         return str(snakefile)
     except Exception:
         # Fallback for older Python versions
         import pkg_resources
-        return pkg_resources.resource_filename("micaflow", "resources/Snakefile")
+        return pkg_resources.resource_filename("micaflow", f"resources/{filename}")
+
+
+# Map of command names to the script modules that implement them
+SCRIPT_MODULES = {
+    "apply_warp": "micaflow.scripts.apply_warp",
+    "bet": "micaflow.scripts.bet",
+    "bias_correction": "micaflow.scripts.bias_correction",
+    "calculate_dice": "micaflow.scripts.calculate_dice",
+    "compute_fa_md": "micaflow.scripts.compute_fa_md",
+    "coregister": "micaflow.scripts.coregister",
+    "denoise": "micaflow.scripts.denoise",
+    "motion_correction": "micaflow.scripts.motion_correction",
+    "SDC": "micaflow.scripts.SDC",
+    "apply_SDC": "micaflow.scripts.apply_SDC",
+    "synthseg": "micaflow.scripts.synthseg",
+    "texture_generation": "micaflow.scripts.texture_generation",
+    "normalize": "micaflow.scripts.normalize",
+    "synth_b0": "micaflow.scripts.synth_b0",
+    "extract_b0": "micaflow.scripts.extract_b0",
+}
+
+
+def run_script(module_name, script_args):
+    """
+    Run a micaflow processing script with forwarded command-line arguments.
+
+    By default the script module is imported and its ``main(argv)`` entry
+    point is called in the current interpreter, so a ``micaflow <command>``
+    call (e.g. from a Snakefile rule) starts Python and imports ANTs, PyTorch
+    or DIPY only once. Setting the environment variable
+    ``MICAFLOW_DISPATCH=subprocess`` restores the previous behaviour of
+    re-executing ``python -m <module>`` in a child process, and
+    ``MICAFLOW_DISPATCH=daemon`` (set by ``--via-daemon``) sends the job to a
+    running ``micaflow serve`` worker, falling back to an in-process run
+    when none is listening.
+
+    Parameters
+    ----------
+    module_name : str
+        Dotted module path of the script, e.g. ``micaflow.scripts.bet``.
+    script_args : list of str
+        Arguments to pass to the script, without the program name.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If the script exits with a non-zero status, in any dispatch mode.
+
+    Examples
+    --------
+    >>> run_script("micaflow.scripts.normalize",
+    ...            ["--input", "t1w.nii.gz", "--output", "t1w_norm.nii.gz"])
+
+    Notes
+    -----
+    - Scripts signal failure through ``sys.exit``; the resulting
+      ``SystemExit`` is converted to ``CalledProcessError`` so that callers
+      handle both dispatch modes identically
+    - Any other exception raised by the script is printed with its
+      traceback, as the child interpreter would, and reported as a
+      ``CalledProcessError`` with status 1
+    - ``sys.argv`` is set to the forwarded arguments while the script runs,
+      because some scripts read it at import time (e.g. ``--threads``)
+    """
+    dispatch = os.environ.get("MICAFLOW_DISPATCH", "inprocess")
+    if dispatch == "subprocess":
+        subprocess.run([sys.executable, "-m", module_name] + script_args, check=True)
+        return
+
+    if dispatch == "daemon":
+        from micaflow.daemon import get_socket_path, submit_job
+
+        returncode = submit_job(module_name, script_args)
+        if returncode is not None:
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, [module_name] + script_args)
+            return
+        print(f"{Fore.YELLOW}No micaflow daemon listening on {get_socket_path()}, "
+              f"running locally{Style.RESET_ALL}")
+
+    saved_argv = sys.argv
+    sys.argv = [module_name] + script_args
+    try:
+        module = importlib.import_module(module_name)
+        module.main(script_args)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            returncode = e.code if isinstance(e.code, int) else 1
+            raise subprocess.CalledProcessError(returncode, [module_name] + script_args)
+    except Exception as e:
+        traceback.print_exc()
+        raise subprocess.CalledProcessError(1, [module_name] + script_args) from e
+    finally:
+        sys.argv = saved_argv
+
+
+def run_subject_pipelines(jobs, parallel_subjects=1):
+    """
+    Run per-subject pipeline commands, several at a time if requested.
+
+    With ``parallel_subjects=1`` each command runs in turn with its output
+    passed straight through. Otherwise up to ``parallel_subjects`` commands
+    run concurrently and every output line is prefixed with the job label
+    (e.g. ``[sub-001/ses-01]``) so interleaved logs stay readable.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Jobs with at least a ``label`` (str) and ``cmd`` (list of str).
+    parallel_subjects : int, optional
+        Maximum number of commands running at once (default: 1).
+
+    Yields
+    ------
+    tuple
+        ``(job, status, error_msg, timestamp, duration)`` for each job in
+        completion order, where status is "success" or "failed", error_msg
+        is None on success, timestamp is the ISO start time and duration is
+        the wall-clock time in seconds.
+
+    Examples
+    --------
+    >>> jobs = [{"label": "sub-001", "cmd": ["micaflow", "pipeline", ...]}]
+    >>> for job, status, error, started, seconds in run_subject_pipelines(jobs, 4):
+    ...     print(job["label"], status)
+    """
+    print_lock = threading.Lock()
+    parallel = parallel_subjects > 1
+
+    def run_job(job):
+        label = job["label"]
+        run_timestamp = datetime.datetime.now().isoformat()
+        start_time = time.time()
+        with print_lock:
+            print(f"{Fore.CYAN}Launching pipeline for {label}...{Style.RESET_ALL}", flush=True)
+        try:
+            if not parallel:
+                subprocess.run(job["cmd"], check=True)
+            else:
+                proc = subprocess.Popen(job["cmd"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, errors="replace")
+                for line in proc.stdout:
+                    with print_lock:
+                        print(f"[{label}] {line}", end="", flush=True)
+                if proc.wait() != 0:
+                    raise subprocess.CalledProcessError(proc.returncode, job["cmd"])
+            return job, "success", None, run_timestamp, time.time() - start_time
+        except Exception as e:
+            # Any failure stays with its subject so the other jobs keep running
+            return job, "failed", f"{type(e).__name__}: {e}", run_timestamp, time.time() - start_time
+
+    finished = 0
+    with ThreadPoolExecutor(max_workers=max(1, parallel_subjects)) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            job, status, error_msg, run_timestamp, duration = future.result()
+            finished += 1
+            color = Fore.GREEN if status == "success" else Fore.RED
+            with print_lock:
+                print(f"{color}[{finished}/{len(jobs)}] {job['label']}: {status} "
+                      f"({duration:.0f} s){Style.RESET_ALL}", flush=True)
+            yield job, status, error_msg, run_timestamp, duration
+
+
+# Columns of the subject manifest read by resources/Snakefile_multi
+MANIFEST_COLUMNS = [
+    "subject", "session", "t1w_file", "flair_file", "dwi_file", "bval_file",
+    "bvec_file", "inverse_dwi_file", "inverse_bval_file", "inverse_bvec_file",
+]
+
+
+def write_subject_manifest(jobs, manifest_path):
+    """
+    Write the subject/session manifest used by the multi-subject Snakefile.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Jobs collected by the bids command, each with ``subject``,
+        ``session`` and ``inputs`` (t1w, flair, dwi, bval, bvec, inverse_dwi,
+        inverse_bval, inverse_bvec; None when missing).
+    manifest_path : str
+        Path of the tab-separated manifest to write.
+
+    Returns
+    -------
+    str
+        The manifest path.
+    """
+    def column(path):
+        return os.path.abspath(path) if path else ""
+
+    with open(manifest_path, "w") as f:
+        f.write("\t".join(MANIFEST_COLUMNS) + "\n")
+        for job in jobs:
+            inputs = job["inputs"]
+            row = [job["subject"], job["session"] or ""] + [
+                column(inputs[key]) for key in [
+                    "t1w", "flair", "dwi", "bval", "bvec",
+                    "inverse_dwi", "inverse_bval", "inverse_bvec"
+                ]
+            ]
+            f.write("\t".join(row) + "\n")
+    return manifest_path
+
+
+def run_subject_dag(jobs, cmd):
+    """
+    Run every subject in a single Snakemake invocation.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Jobs listed in the manifest passed to ``cmd``.
+    cmd : list of str
+        Snakemake command running resources/Snakefile_multi.
+
+    Yields
+    ------
+    tuple
+        ``(job, status, error_msg, timestamp, duration)`` for each job, as
+        run_subject_pipelines() does. All jobs share the status of the
+        Snakemake run; a failed run reports every subject as failed,
+        including those that finished (their outputs are kept).
+    """
+    run_timestamp = datetime.datetime.now().isoformat()
+    start_time = time.time()
+    print(f"{Fore.CYAN}Launching a single pipeline for {len(jobs)} subject(s)...{Style.RESET_ALL}")
+    print(f"Executing: {' '.join(cmd)}")
+    try:
+        subprocess.run(cmd, check=True)
+        status, error_msg = "success", None
+    except subprocess.CalledProcessError as e:
+        status, error_msg = "failed", str(e)
+    duration = time.time() - start_time
+    color = Fore.GREEN if status == "success" else Fore.RED
+    print(f"{color}{len(jobs)} subject(s): {status} ({duration:.0f} s){Style.RESET_ALL}")
+    for job in jobs:
+        yield job, status, error_msg, run_timestamp, duration
 
 
 def print_extended_help():
@@ -257,6 +518,7 @@ def print_extended_help():
       {GREEN}apply_SDC{RESET}         : Apply pre-computed SDC warp field to an image
       {GREEN}synthseg{RESET}          : Run SynthSeg brain segmentation
       {GREEN}texture_generation{RESET}: Generate texture features from neuroimaging data
+      {GREEN}serve{RESET}             : Run a persistent worker for commands sent with --via-daemon
     
     {CYAN}{BOLD}──────────────── PIPELINE REQUIRED PARAMETERS ────────────{RESET}
       {YELLOW}--subject{RESET} SUBJECT_ID           Subject ID
@@ -279,6 +541,8 @@ def print_extended_help():
       {YELLOW}--config-file{RESET} FILE             Path to a YAML configuration file
       {YELLOW}--extract-brain{RESET}                Generate brain-extracted versions of all outputs in a dedicated directory
       {YELLOW}--keep-temp{RESET}                    Keep temporary processing files (useful for debugging)
+      {YELLOW}--intermediate-format{RESET} FORMAT   Format of temporary images: 'nii.gz' or 'nii' (uncompressed, faster I/O) (default: 'nii.gz')
+      {YELLOW}--io-timing{RESET}                    Log the image read/write time of every command and print a summary at the end
       {YELLOW}--rm-cerebellum{RESET}                Remove cerebellum from brain extraction outputs
       {YELLOW}--PED{RESET}                          Phase encoding direction of DWI, options are: 'ap', 'pa', 'lr', 'rl', 'si', 'is' (default: 'pa')
       {YELLOW}--direction-dimension{RESET}          Dimension of the DWI image referring to directions (default: 3)
@@ -292,6 +556,14 @@ def print_extended_help():
       micaflow {GREEN}bids{RESET} {YELLOW}--bids-dir{RESET} /data/bids {YELLOW}--output-dir{RESET} /data/derivatives \\
         {YELLOW}--cores{RESET} 4 {YELLOW}--gpu{RESET}
       
+      {BLUE}# Process 8 subjects at a time on a 64-core node (8 cores each){RESET}
+      micaflow {GREEN}bids{RESET} {YELLOW}--bids-dir{RESET} /data/bids {YELLOW}--output-dir{RESET} /data/derivatives \\
+        {YELLOW}--parallel-subjects{RESET} 8 {YELLOW}--total-cores{RESET} 64
+      
+      {BLUE}# Schedule all subjects in one Snakemake run sharing 64 cores{RESET}
+      micaflow {GREEN}bids{RESET} {YELLOW}--bids-dir{RESET} /data/bids {YELLOW}--output-dir{RESET} /data/derivatives \\
+        {YELLOW}--single-dag{RESET} {YELLOW}--parallel-subjects{RESET} 8 {YELLOW}--total-cores{RESET} 64
+      
       {BLUE}# Process specific subjects with custom suffixes{RESET}
       micaflow {GREEN}bids{RESET} {YELLOW}--bids-dir{RESET} /data/bids {YELLOW}--output-dir{RESET} /data/derivatives \\
         {YELLOW}--participant-label{RESET} 001 002 {YELLOW}--dwi-suffix{RESET} dwi_acq-AP.nii.gz
@@ -351,7 +623,9 @@ def print_extended_help():
     {MAGENTA}•{RESET} Each module can be run independently with its own set of parameters
     {MAGENTA}•{RESET} Use --extract-brain to generate skull-stripped versions of all outputs in a dedicated directory
     {MAGENTA}•{RESET} Use --keep-temp to preserve intermediate files (useful for debugging)
+    {MAGENTA}•{RESET} Use --intermediate-format nii to skip gzip on temporary files; final outputs stay .nii.gz
     {MAGENTA}•{RESET} Use --rm-cerebellum to remove cerebellum from brain extraction outputs
+    {MAGENTA}•{RESET} Start 'micaflow serve' and add --via-daemon to any command to reuse warm imports
     
     For more detailed help on any command, use: micaflow {GREEN}[command]{RESET} {YELLOW}--help{RESET}
     """
@@ -393,7 +667,8 @@ def main():
     Module Commands:
       - Transform Python-style args to CLI-style (underscores to hyphens)
       - Build command-line argument list
-      - Execute via subprocess.run() with python -m
+      - Execute in-process via run_script() (or python -m when
+        MICAFLOW_DISPATCH=subprocess)
       - Report results and any errors
     
     Argument Transformation:
@@ -429,8 +704,8 @@ def main():
     
     Notes
     -----
-    - Uses subprocess.run() for all command execution
-    - Scripts executed as Python modules: python -m micaflow.scripts.[name]
+    - Uses subprocess.run() for pipeline and BIDS execution
+    - Module commands call the script's main(argv) in-process via run_script()
     - Help is intercepted before argparse to allow custom formatting
     - Unknown arguments passed through to Snakemake for pipeline command
     - Print statements used for user feedback (not logging framework)
@@ -439,8 +714,14 @@ def main():
     --------
     print_extended_help : Extended help message display
     get_snakefile_path : Get path to pipeline Snakefile
+    run_script : Dispatch a module command to its script
     """
-    check_and_download_models()
+    # --via-daemon is accepted by every command and handled here rather than
+    # by argparse, so that it is not forwarded to the scripts. The setting is
+    # inherited by the micaflow calls made from Snakefile rules.
+    if "--via-daemon" in sys.argv:
+        sys.argv = [arg for arg in sys.argv if arg != "--via-daemon"]
+        os.environ["MICAFLOW_DISPATCH"] = "daemon"
 
     # If no arguments provided, show help and exit
     if len(sys.argv) == 1:
@@ -452,31 +733,12 @@ def main():
     if (len(sys.argv) >= 3 and sys.argv[2] in ["-h", "--help"]) or len(sys.argv) == 2:
         # Check if the first argument is a valid command
         command = sys.argv[1]
-        
-        # Map of command names to their Python module paths
-        script_map = {
-            "apply_warp": "micaflow.scripts.apply_warp",
-            "bet": "micaflow.scripts.bet",
-            "bias_correction": "micaflow.scripts.bias_correction",
-            "calculate_dice": "micaflow.scripts.calculate_dice",
-            "compute_fa_md": "micaflow.scripts.compute_fa_md",
-            "coregister": "micaflow.scripts.coregister",
-            "denoise": "micaflow.scripts.denoise",
-            "motion_correction": "micaflow.scripts.motion_correction",
-            "SDC": "micaflow.scripts.SDC",
-            "apply_SDC": "micaflow.scripts.apply_SDC",
-            "synthseg": "micaflow.scripts.synthseg",
-            "texture_generation": "micaflow.scripts.texture_generation",
-            "normalize": "micaflow.scripts.normalize",
-        }
-
-        if command in script_map:
+
+        if command in SCRIPT_MODULES:
             if command != "pipeline":  # Special case for pipeline
                 try:
                     print(f"\n=== Help for '{command}' command ===\n")
-                    subprocess.run(
-                        ["python", "-m", script_map[command], "--help"], check=True
-                    )
+                    run_script(SCRIPT_MODULES[command], ["--help"])
                     sys.exit(0)
                 except subprocess.CalledProcessError as e:
                     print(f"Error displaying help for {command}: {e}")
@@ -549,6 +811,14 @@ def main():
     pipeline_parser.add_argument(
         "--keep-temp", action="store_true", help="Keep temporary files after processing"
     )
+    pipeline_parser.add_argument(
+        "--intermediate-format", choices=["nii.gz", "nii"], default="nii.gz",
+        help="File format of temporary images; final outputs are always .nii.gz (default: nii.gz)"
+    )
+    pipeline_parser.add_argument(
+        "--io-timing", action="store_true",
+        help="Log the time every command spends reading and writing images to micaflow_io_timing.tsv"
+    )
     pipeline_parser.add_argument(
         "--extract-brain", action="store_true", help="Keep brain-extracted images"
     )
@@ -590,10 +860,15 @@ def main():
     # Passthrough arguments
     bids_parser.add_argument("--gpu", action="store_true", help="Use GPU computation")
     bids_parser.add_argument("--dry-run", "-n", action="store_true", help="Print commands without executing")
-    bids_parser.add_argument("--cores", type=int, default=1, help="Number of cores per subject")
+    bids_parser.add_argument("--cores", type=int, default=1, help="Number of cores per subject (ignored if --total-cores is set)")
+    bids_parser.add_argument("--parallel-subjects", type=int, default=1, help="Number of subject/session pipelines to run at once (default: 1)")
+    bids_parser.add_argument("--total-cores", type=int, help="Global core budget split evenly between the --parallel-subjects pipelines")
+    bids_parser.add_argument("--single-dag", action="store_true", help="Run all subjects in one Snakemake process that schedules jobs across subjects")
     bids_parser.add_argument("--rm-cerebellum", action="store_true", help="Remove cerebellum")
     bids_parser.add_argument("--extract-brain", action="store_true", help="Generate brain-extracted outputs")
     bids_parser.add_argument("--keep-temp", action="store_true", help="Keep temporary files")
+    bids_parser.add_argument("--intermediate-format", choices=["nii.gz", "nii"], default="nii.gz", help="File format of temporary images (default: nii.gz)")
+    bids_parser.add_argument("--io-timing", action="store_true", help="Log image read/write times")
     bids_parser.add_argument("--linear", action="store_true", help="Use linear-only registration")
     bids_parser.add_argument("--nonlinear", action="store_true", help="Use nonlinear registration")
     bids_parser.add_argument("--PED", default="pa", help="Phase encoding direction (default: pa)")
@@ -834,6 +1109,13 @@ def main():
                         help="Path to b0 b-vector file.")
     compute_fa_md_parser.add_argument("--b0-index", type=int, default=0,
                         help="Index at which to insert b0 volume (default: 0).")
+    compute_fa_md_parser.add_argument("--output-ad", help="Output path for the axial diffusivity map (.nii.gz)")
+    compute_fa_md_parser.add_argument("--output-rd", help="Output path for the radial diffusivity map (.nii.gz)")
+    compute_fa_md_parser.add_argument("--output-mode", help="Output path for the tensor mode map (.nii.gz)")
+    compute_fa_md_parser.add_argument("--output-v1", help="Output path for the principal eigenvector map (.nii.gz)")
+    compute_fa_md_parser.add_argument("--output-tensor", help="Output path for the 6 tensor elements (.nii.gz)")
+    compute_fa_md_parser.add_argument("--fit-method", choices=["wls", "ols"], help="Tensor fitting method (default: wls)")
+    compute_fa_md_parser.add_argument("--workers", type=int, help="Number of worker processes for the fit (default: 1)")
 
     # Coregistration command
     coreg_parser = subparsers.add_parser(
@@ -916,6 +1198,8 @@ def main():
     denoise_parser.add_argument("--b0-denoise", action='store_true', help="Denoise b0 volumes separately (default: False)")
     denoise_parser.add_argument("--gibbs", action='store_true', help="Apply Gibbs ringing correction (default: False)")
     denoise_parser.add_argument("--threads", type=int, help="Number of threads to use (default: 1)")
+    denoise_parser.add_argument("--engine", choices=["dipy", "native"], help="Patch2Self implementation (default: dipy)")
+    denoise_parser.add_argument("--mask", help="Brain mask; only voxels inside it are denoised")
 
     # Motion Correction command
     motion_corr_parser = subparsers.add_parser(
@@ -962,11 +1246,25 @@ def main():
         type=int,
         help="Number of threads to use (default: 1)",
     )
+    motion_corr_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of volumes registered at once in worker processes (default: 1)",
+    )
+    motion_corr_parser.add_argument(
+        "--itk-threads",
+        type=int,
+        help="ITK threads per worker (default: threads divided by workers)",
+    )
     motion_corr_parser.add_argument(
         "--temp-dir",
         type=str,
-        default="tmp",
-        help="Path to the temporary directory for intermediate files (default: tmp)."
+        help="Directory for registration scratch files (default: system temporary directory)."
+    )
+    motion_corr_parser.add_argument(
+        "--output-transforms",
+        type=str,
+        help="Optional archive of the per-volume affines (.npy, or .h5/.hdf5 with h5py)."
     )
 
     # SDC command (main susceptibility distortion correction)
@@ -996,6 +1294,21 @@ def main():
         choices=["ap", "pa", "lr", "rl", "si", "is"],
         help="Phase-encoding direction (default: ap)"
     )
+    sdc_parser.add_argument(
+        "--levels",
+        type=int,
+        help="Number of pyramid levels for coarse-to-fine field estimation (default: 1)",
+    )
+    sdc_parser.add_argument(
+        "--max-iter",
+        type=int,
+        help="Maximum Gauss-Newton iterations per level (default: 500)",
+    )
+    sdc_parser.add_argument(
+        "--rel-tol",
+        type=float,
+        help="Also stop once the relative objective change falls below this value (default: off)",
+    )
 
     # Texture Generation command
     texture_parser = subparsers.add_parser(
@@ -1075,10 +1388,35 @@ def main():
         '--b0-to-T1-warp-secondary', help='Path to a secondary warp field to be applied after the primary warp and affine (optional)')
     synth_b0_parser.add_argument(
         '--b0-to-T1-affine', help='Path to save the affine transform from B0 to T1w (optional)')
+    synth_b0_parser.add_argument(
+        '--ensemble-batch', type=int, help='Number of models evaluated in one batched forward pass (default: 1)')
+    synth_b0_parser.add_argument(
+        '--tile-size', type=int, help='Run the network on overlapping tiles of this size (default: whole volume)')
+    synth_b0_parser.add_argument(
+        '--tile-overlap', type=float, help='Fraction of overlap between tiles (default: 0.5)')
+    synth_b0_parser.add_argument(
+        '--memory-budget', type=float, help='Inference memory budget in MB; tiles the volume if it does not fit')
+    synth_b0_parser.add_argument(
+        '--backend', choices=['eager', 'torchscript', 'onnxruntime'], help='Inference backend (default: eager)')
+    synth_b0_parser.add_argument(
+        '--bf16', action='store_true', help='Run the network under bfloat16 autocast')
+    synth_b0_parser.add_argument(
+        '--channels-last', action='store_true', help='Use the channels-last 3D memory format')
+    synth_b0_parser.add_argument(
+        '--compose-transforms', action='store_true',
+        help='Compose the transform chain into one displacement field and resample each DWI volume once')
     synth_b0_parser.add_argument(
         '--b0-index', type=int, default=0,
         help="Index at which to insert b0 volume (default: 0).")
 
+    # Daemon command
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a persistent worker that executes commands sent with --via-daemon")
+    serve_parser.add_argument(
+        "--socket", help="Unix socket to listen on (default: $MICAFLOW_DAEMON_SOCKET, $XDG_RUNTIME_DIR/micaflow.sock or a private per-user directory in $TMPDIR)")
+    serve_parser.add_argument(
+        "--no-preload", action="store_true", help="Do not import ANTs, PyTorch, DIPY etc. before accepting jobs")
+
     # Extract B0 command
     extract_b0_parser = subparsers.add_parser(
         "extract_b0", help="Extract b=0 volume from DWI")
@@ -1110,6 +1448,9 @@ def main():
     if not args.command:
         args.command = "pipeline"
 
+    # Help requests have exited above, so only real runs fetch missing models
+    check_and_download_models()
+
     # ---> ADD THIS FUNCTION <---
     def create_bids_dataset_description(out_dir):
         """Creates a BIDS dataset_description.json in the derivative root directory."""
@@ -1177,6 +1518,15 @@ def main():
                 return None, False # None found, Error=False
             return matches[0], False # Found, Error=False
 
+        # Split the core budget between the subject pipelines running at once
+        parallel_subjects = max(1, args.parallel_subjects)
+        cores_per_subject = args.cores
+        if args.total_cores:
+            cores_per_subject = max(1, args.total_cores // parallel_subjects)
+            print(f"{Fore.CYAN}Core budget: {args.total_cores} cores for up to {parallel_subjects} "
+                  f"concurrent subjects ({cores_per_subject} per subject).{Style.RESET_ALL}")
+        jobs = []
+
         # 2. Iterate Subjects
         for idx, sub in enumerate(subjects):
             sub_dir = os.path.join(args.bids_dir, sub)
@@ -1197,10 +1547,6 @@ def main():
 
             # 3. Iterate Sessions
             for ses in sessions:
-                # Start Timer
-                start_time = time.time()
-                run_timestamp = datetime.datetime.now().isoformat()
-
                 # Define path
                 if ses:
                     base_path = os.path.join(sub_dir, ses)
@@ -1317,102 +1663,145 @@ def main():
                 if args.rm_cerebellum: cmd.append("--rm-cerebellum")
                 if args.extract_brain: cmd.append("--extract-brain")
                 if args.keep_temp: cmd.append("--keep-temp")
+                if args.io_timing: cmd.append("--io-timing")
                 if args.linear: cmd.append("--linear")
                 if args.nonlinear: cmd.append("--nonlinear")
                 if args.config_file: cmd.extend(["--config-file", args.config_file])
                 
-                cmd.extend(["--cores", str(args.cores)])
+                cmd.extend(["--cores", str(cores_per_subject)])
                 cmd.extend(["--PED", args.PED])
                 cmd.extend(["--direction-dimension", str(args.direction_dimension)])
+                cmd.extend(["--intermediate-format", args.intermediate_format])
 
                 # FIX: Pass unknown arguments (like --unlock, --rerun-incomplete) to the pipeline
                 if unknown:
                     cmd.extend(unknown)
 
-                # 6. Execute and Log
-                print(f"{Fore.CYAN}Launching pipeline for {sub_ses_str}...{Style.RESET_ALL}")
-                
-                status = "unknown"
-                error_msg = None
-
-                if args.dry_run:
+                # 6. Queue for execution
+                if args.dry_run and not args.single_dag:
+                    print(f"{Fore.CYAN}Launching pipeline for {sub_ses_str}...{Style.RESET_ALL}")
                     print(f"Dry run: {' '.join(cmd)}")
-                    status = "dry_run"
-                else:
-                    try:
-                        subprocess.run(cmd, check=True)
-                        status = "success"
-                    except subprocess.CalledProcessError as e:
-                        print(f"{Fore.RED}Pipeline failed for {sub_ses_str}{Style.RESET_ALL}")
-                        status = "failed"
-                        error_msg = str(e)
+                    continue
+
+                jobs.append({
+                    "label": sub_ses_str,
+                    "subject": sub,
+                    "session": ses_id,
+                    "cmd": cmd,
+                    "inputs": {
+                        "t1w": t1w,
+                        "flair": flair,
+                        "dwi": dwi,
+                        "bval": bval_file,
+                        "bvec": bvec_file,
+                        "inverse_dwi": inv_dwi,
+                        "inverse_bval": inv_bval_file,
+                        "inverse_bvec": inv_bvec_file
+                    },
+                })
+
+        # 7. Execute and Generate Run Metadata JSON
+        if args.single_dag:
+            # One Snakemake process and DAG for every subject, so idle cores
+            # of one subject are filled with jobs from the others
+            if not jobs:
+                print(f"{Fore.YELLOW}No subjects to process.{Style.RESET_ALL}")
+                sys.exit(0)
+            os.makedirs(args.output_dir, exist_ok=True)
+            manifest = write_subject_manifest(jobs, os.path.join(args.output_dir, "micaflow_subjects.tsv"))
+            dag_cmd = [
+                "snakemake", "-s", get_snakefile_path("Snakefile_multi"), "--config",
+                f"manifest={manifest}",
+                f"output_dir={args.output_dir}",
+                f"subject_threads={cores_per_subject}",
+                f"gpu={args.gpu}",
+                f"rm_cerebellum={args.rm_cerebellum}",
+                f"extract_brain={args.extract_brain}",
+                f"keep_temp={args.keep_temp}",
+                f"intermediate_format={args.intermediate_format}",
+                f"io_timing={args.io_timing}",
+                f"linear={args.linear}",
+                f"nonlinear={args.nonlinear}",
+                f"PED={args.PED}",
+                f"direction_dimension={args.direction_dimension}",
+            ]
+            if args.config_file:
+                dag_cmd.extend(["--configfile", args.config_file])
+            dag_cmd.extend(["--cores", str(args.total_cores or cores_per_subject * parallel_subjects)])
+            if unknown:
+                dag_cmd.extend(unknown)
+            for job in jobs:
+                job["cmd"] = dag_cmd
+
+            if args.dry_run:
+                # Let Snakemake show the combined job list without running it
+                print(f"Dry run: {' '.join(dag_cmd + ['-n'])}")
+                subprocess.run(dag_cmd + ["-n"])
+                results = []
+            else:
+                results = run_subject_dag(jobs, dag_cmd)
+        else:
+            results = run_subject_pipelines(jobs, parallel_subjects)
+
+        # Results arrive in completion order; metadata is written from this
+        # thread only, so the summary JSON is never appended to concurrently
+        for job, status, error_msg, run_timestamp, duration in results:
+            # Logic updated: Append to a single summary JSON in the main output directory
+            try:
+                # Use main output dir
+                os.makedirs(args.output_dir, exist_ok=True)
+                
+                metadata = {
+                    "subject": job["subject"],
+                    "session": job["session"],
+                    "timestamp": run_timestamp,
+                    "duration_seconds": round(duration, 2),
+                    "status": status,
+                    "error": error_msg,
+                    "inputs": job["inputs"],
+                    "config": {
+                        "linear": args.linear,
+                        "nonlinear": args.nonlinear,
+                        "ped": args.PED,
+                        "direction_dimension": args.direction_dimension,
+                        "extract_brain": args.extract_brain,
+                        "rm_cerebellum": args.rm_cerebellum,
+                        "gpu": args.gpu,
+                        "cores": cores_per_subject,
+                        "parallel_subjects": parallel_subjects,
+                        "single_dag": args.single_dag
+                    },
+                    "command_line": job["cmd"]
+                }
+                
+                # Define the single summary log file path
+                json_path = os.path.join(args.output_dir, "micaflow_runs_summary.json")
                 
-                # 7. Generate Run Metadata JSON
-                # Logic updated: Append to a single summary JSON in the main output directory
-                if not args.dry_run:
+                # Load existing data if file exists
+                run_history = []
+                if os.path.exists(json_path):
                     try:
-                        duration = time.time() - start_time
-                        
-                        # Use main output dir
-                        os.makedirs(args.output_dir, exist_ok=True)
-                        
-                        metadata = {
-                            "subject": sub,
-                            "session": ses_id,
-                            "timestamp": run_timestamp,
-                            "duration_seconds": round(duration, 2),
-                            "status": status,
-                            "error": error_msg,
-                            "inputs": {
-                                "t1w": t1w,
-                                "flair": flair,
-                                "dwi": dwi,
-                                "bval": bval_file,
-                                "bvec": bvec_file,
-                                "inverse_dwi": inv_dwi,
-                                "inverse_bval": inv_bval_file,
-                                "inverse_bvec": inv_bvec_file
-                            },
-                            "config": {
-                                "linear": args.linear,
-                                "nonlinear": args.nonlinear,
-                                "ped": args.PED,
-                                "direction_dimension": args.direction_dimension,
-                                "extract_brain": args.extract_brain,
-                                "rm_cerebellum": args.rm_cerebellum,
-                                "gpu": args.gpu
-                            },
-                            "command_line": cmd
-                        }
-                        
-                        # Define the single summary log file path
-                        json_path = os.path.join(args.output_dir, "micaflow_runs_summary.json")
-                        
-                        # Load existing data if file exists
+                        with open(json_path, "r") as f:
+                            run_history = json.load(f)
+                            if not isinstance(run_history, list):
+                                # If for some reason it's not a list, wrap it or start new
+                                # (Handling backward compatibility if it was dict)
+                                run_history = [] 
+                    except json.JSONDecodeError:
+                        print(f"{Fore.YELLOW}Warning: Could not decode existing log file. Starting fresh.{Style.RESET_ALL}")
                         run_history = []
-                        if os.path.exists(json_path):
-                            try:
-                                with open(json_path, "r") as f:
-                                    run_history = json.load(f)
-                                    if not isinstance(run_history, list):
-                                        # If for some reason it's not a list, wrap it or start new
-                                        # (Handling backward compatibility if it was dict)
-                                        run_history = [] 
-                            except json.JSONDecodeError:
-                                print(f"{Fore.YELLOW}Warning: Could not decode existing log file. Starting fresh.{Style.RESET_ALL}")
-                                run_history = []
-                        
-                        # Append new run
-                        run_history.append(metadata)
-                        
-                        # Write back to file
-                        with open(json_path, "w") as f:
-                            json.dump(run_history, f, indent=4)
-                        
-                        print(f"Run metadata appended to {json_path}")
-
-                    except Exception as e:
-                        print(f"{Fore.RED}Error saving run metadata: {e}{Style.RESET_ALL}")
+                
+                # Append new run
+                run_history.append(metadata)
+                
+                # Write back to file
+                with open(json_path, "w") as f:
+                    json.dump(run_history, f, indent=4)
+                
+                print(f"Run metadata appended to {json_path}")
+
+            except Exception as e:
+                print(f"{Fore.RED}Error saving run metadata: {e}{Style.RESET_ALL}")
 
     elif args.command == "pipeline":
         # ---> ADD THIS CALL <---
@@ -1444,6 +1833,8 @@ def main():
             "rm_cerebellum",
             "gpu",
             "keep_temp",
+            "intermediate_format",
+            "io_timing",
             "extract_brain",
             "direction_dimension",
             "PED",
@@ -1502,10 +1893,7 @@ def main():
                     synthseg_args.append(str(arg_value))
         try:
             print(f"Running SynthSeg brain segmentation on {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.synthseg"] + synthseg_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.synthseg", synthseg_args)
             print(f"Brain segmentation completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error running brain segmentation: {e}")
@@ -1529,9 +1917,7 @@ def main():
         # Run the apply_SDC script
         try:
             print(f"Applying susceptibility distortion correction to {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.apply_SDC"] + apply_sdc_parser, check=True
-            )
+            run_script("micaflow.scripts.apply_SDC", apply_sdc_parser)
             print(
                 f"Susceptibility distortion correction completed. Output saved to {args.output}"
             )
@@ -1558,10 +1944,7 @@ def main():
         try:
             print(f"Applying warp transformation to {args.moving}...")
             print(len(apply_warp_args))
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.apply_warp"] + apply_warp_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.apply_warp", apply_warp_args)
             print(f"Warp transformation completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error applying warp transformation: {e}")
@@ -1588,9 +1971,7 @@ def main():
 
         try:
             print(f"Running brain extraction on {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.bet"] + bet_args, check=True
-            )
+            run_script("micaflow.scripts.bet", bet_args)
             print(f"Brain extraction completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error running brain extraction: {e}")
@@ -1615,10 +1996,7 @@ def main():
         # Run the bias_correction script
         try:
             print(f"Running bias field correction on {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.bias_correction"] + bias_corr_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.bias_correction", bias_corr_args)
             print(f"Bias correction completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error running bias correction: {e}")
@@ -1642,10 +2020,7 @@ def main():
         # Run the calculate_dice script
         try:
             print(f"Calculating DICE between {args.input} and {args.reference}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.calculate_dice"] + dice_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.calculate_dice", dice_args)
             if args.output:
                 print(f"Results saved to {args.output}")
         except subprocess.CalledProcessError as e:
@@ -1672,10 +2047,7 @@ def main():
         # Run the compute_fa_md script
         try:
             print(f"Computing FA and MD maps from {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.compute_fa_md"] + compute_fa_md_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.compute_fa_md", compute_fa_md_args)
             print(
                 f"DTI metrics computed. FA saved to {args.output_fa}, MD saved to {args.output_fa}"
             )
@@ -1704,9 +2076,7 @@ def main():
         # Run the coregister script
         try:
             print(f"Coregistering {args.moving_file} to {args.fixed_file}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.coregister"] + coreg_args, check=True
-            )
+            run_script("micaflow.scripts.coregister", coreg_args)
             print(f"Coregistration completed. Output saved to {args.output}")
             if args.warp_file:
                 print(f"Warp field saved to {args.warp_file}")
@@ -1735,9 +2105,7 @@ def main():
         # Run the denoise script
         try:
             print(f"Denoising diffusion image {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.denoise"] + denoise_args, check=True
-            )
+            run_script("micaflow.scripts.denoise", denoise_args)
             print(f"Denoising completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error during denoising: {e}")
@@ -1762,11 +2130,7 @@ def main():
         # Run the motion_correction script
         try:
             print(f"Performing motion correction on {args.denoised}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.motion_correction"]
-                + motion_corr_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.motion_correction", motion_corr_args)
             print(f"Motion correction completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error during motion correction: {e}")
@@ -1795,9 +2159,7 @@ def main():
         # Run the SDC script
         try:
             print(f"Running susceptibility distortion correction on {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.SDC"] + sdc_args, check=True
-            )
+            run_script("micaflow.scripts.SDC", sdc_args)
             print(
                 f"Susceptibility distortion correction completed. Output saved to {args.output}"
             )
@@ -1826,10 +2188,7 @@ def main():
             print(
                 f"Generating texture features for {args.input} using mask {args.mask}..."
             )
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.texture_generation"] + texture_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.texture_generation", texture_args)
             print(f"Texture generation completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error during texture generation: {e}")
@@ -1854,10 +2213,7 @@ def main():
         # Run the motion_correction script
         try:
             print(f"Performing motion correction on {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.normalize"] + normalize_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.normalize", normalize_args)
             print(f"Motion correction completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error during motion correction: {e}")
@@ -1885,9 +2241,7 @@ def main():
         try:
             print(f"Generating synthetic B0 using T1w ({args.t1}) and B0 ({args.b0}) inputs...")
             print(f"First performing linear registration between B0 and T1w...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.synth_b0"] + synth_b0_args, check=True
-            )
+            run_script("micaflow.scripts.synth_b0", synth_b0_args)
             print(f"Synthetic B0 generation completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error generating synthetic B0: {e}")
@@ -1912,14 +2266,20 @@ def main():
         # Run the extract_b0 script
         try:
             print(f"Extracting b=0 volume from {args.input}...")
-            subprocess.run(
-                ["python", "-m", "micaflow.scripts.extract_b0"] + extract_b0_args,
-                check=True,
-            )
+            run_script("micaflow.scripts.extract_b0", extract_b0_args)
             print(f"B0 extraction completed. Output saved to {args.output}")
         except subprocess.CalledProcessError as e:
             print(f"Error extracting b=0 volume: {e}")
             sys.exit(1)
 
+    elif args.command == "serve":
+        from micaflow.daemon import serve
+
+        try:
+            serve(args.socket, preload_modules=not args.no_preload)
+        except RuntimeError as e:
+            print(f"{Fore.RED}Error starting micaflow daemon: {e}{Style.RESET_ALL}")
+            sys.exit(1)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,518 @@
+"""
+daemon - Persistent worker that runs micaflow commands with warm imports
+
+Every rule of the Snakemake pipeline starts a fresh ``micaflow <command>``
+process that imports ANTsPy, PyTorch and DIPY again before doing any work.
+``micaflow serve`` starts a long-lived worker that imports these libraries
+and all micaflow scripts once, then accepts jobs over a local Unix socket.
+
+Each job is run in a child process forked from the worker, so it starts
+with every library already imported while staying isolated from other jobs
+(sys.argv, os.environ, the working directory and thread settings are all
+per-job). Each job's thread pools are resized to its ``--threads`` (or the
+rule's OMP_NUM_THREADS) after the fork, see limit_threads(). The client passes its stdin/stdout/stderr file descriptors over
+the socket, so the job's output appears in the calling terminal or
+Snakemake log exactly as for a local run.
+
+Usage:
+------
+# Start the worker (foreground; stop with Ctrl+C or SIGTERM)
+$ micaflow serve
+
+# Send a single command to it
+$ micaflow bet --input t1w.nii.gz --output brain.nii.gz --parcellation parc.nii.gz --via-daemon
+
+# Route every rule of a pipeline run through it
+$ micaflow pipeline --subject sub-001 ... --via-daemon
+
+Notes:
+-----
+- ``--via-daemon`` sets MICAFLOW_DISPATCH=daemon, which is inherited by the
+  ``micaflow`` calls that Snakemake makes for each rule
+- If no worker is listening, commands fall back to a local in-process run
+- The socket path defaults to ``$XDG_RUNTIME_DIR/micaflow.sock``, or to
+  ``micaflow-<uid>/daemon.sock`` in the temporary directory, a 0700
+  directory whose owner and mode are checked before use; it can be changed
+  with MICAFLOW_DAEMON_SOCKET or ``micaflow serve --socket``
+- The socket is created 0600, and both ends check the user id of their peer
+  (SO_PEERCRED / LOCAL_PEERCRED), so the client never sends its environment
+  or file descriptors to a socket held by another user and the worker only
+  runs jobs for its own user; only micaflow script modules can be run
+- The SynB0 fold weights are loaded once by the worker and shared with its
+  jobs (eager backend). SynthSeg weights are still loaded in each job, as
+  lamareg loads its TensorFlow model inside its own entry point
+- Requires a POSIX system (Unix sockets and fork)
+"""
+
+import importlib
+import json
+import os
+import selectors
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import traceback
+
+from colorama import Fore, Style
+
+# Heavy dependencies imported once by the worker before it accepts jobs
+PRELOAD_MODULES = [
+    "ants",
+    "torch",
+    "dipy.core.gradients",
+    "dipy.denoise.gibbs",
+    "dipy.denoise.patch2self",
+    "dipy.reconst.dti",
+    "nilearn.image",
+    "lamareg.scripts.synthseg",
+    "lamareg.scripts.lamar",
+]
+
+# Upper bound on the size of a job request (arguments plus environment)
+MAX_REQUEST_BYTES = 1 << 20
+
+# Seconds a client has to send its request; the accept loop waits meanwhile
+REQUEST_TIMEOUT = 5.0
+
+# Read by ITK/ANTs on every call and by any subprocess a job starts; the
+# thread pools of libraries already loaded by the worker are set directly
+THREAD_ENV_VARS = [
+    "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def get_socket_path():
+    """
+    Return the Unix socket path used by the worker and its clients.
+
+    Returns
+    -------
+    str
+        ``$MICAFLOW_DAEMON_SOCKET`` if set, otherwise ``micaflow.sock`` in
+        ``$XDG_RUNTIME_DIR``, otherwise ``daemon.sock`` in a per-user
+        directory of the system temporary directory (see private_dir()).
+    """
+    path = os.environ.get("MICAFLOW_DAEMON_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "micaflow.sock")
+    return os.path.join(tempfile.gettempdir(), f"micaflow-{os.getuid()}", "daemon.sock")
+
+
+def private_dir(path, create=False):
+    """
+    Check that a directory belongs to the current user and is closed to others.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the daemon socket.
+    create : bool, optional
+        Create it with mode 0700 if missing (default: False).
+
+    Raises
+    ------
+    RuntimeError
+        If path is a symlink or not a directory, is owned by another user,
+        or is accessible to group or others.
+    FileNotFoundError
+        If path does not exist and create is False.
+    """
+    if create:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError(f"{path} is not a directory")
+    if info.st_uid != os.getuid():
+        raise RuntimeError(f"{path} is owned by another user (uid {info.st_uid})")
+    if info.st_mode & 0o077:
+        raise RuntimeError(f"{path} is accessible to other users (mode {stat.S_IMODE(info.st_mode):o})")
+
+
+def peer_uid(sock):
+    """
+    Return the user id of the process at the other end of a Unix socket.
+
+    Raises
+    ------
+    OSError
+        If the platform offers no way to query it.
+    """
+    if hasattr(socket, "SO_PEERCRED"):  # Linux
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    if sys.platform == "darwin" or "bsd" in sys.platform:
+        # getsockopt(SOL_LOCAL, LOCAL_PEERCRED) returns struct xucred
+        # {u_int cr_version; uid_t cr_uid; short cr_ngroups; gid_t cr_groups[16]}
+        creds = sock.getsockopt(0, getattr(socket, "LOCAL_PEERCRED", 1), 76)
+        return struct.unpack_from("2I", creds)[1]
+    raise OSError(f"cannot check the owner of a Unix socket on {sys.platform}")
+
+
+def _uses_default_dir(socket_path):
+    """Whether socket_path is in the per-user temporary directory."""
+    default_dir = os.path.join(tempfile.gettempdir(), f"micaflow-{os.getuid()}")
+    return os.path.dirname(os.path.abspath(socket_path)) == default_dir
+
+
+def daemon_is_running(socket_path):
+    """Return True if something is accepting connections on socket_path."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def submit_job(module_name, script_args, socket_path=None):
+    """
+    Run a micaflow script on the worker and wait for it to finish.
+
+    Parameters
+    ----------
+    module_name : str
+        Dotted module path of the script, e.g. ``micaflow.scripts.bet``.
+    script_args : list of str
+        Arguments to pass to the script, without the program name.
+    socket_path : str, optional
+        Worker socket. Defaults to get_socket_path().
+
+    Returns
+    -------
+    int or None
+        Exit status of the job, or None if no worker of the current user is
+        listening (the caller should then run the command itself).
+
+    Notes
+    -----
+    Nothing is sent until the listening process is known to belong to the
+    current user, since the request carries the environment and stdio.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    socket_path = socket_path or get_socket_path()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if _uses_default_dir(socket_path):
+            private_dir(os.path.dirname(socket_path))
+        sock.connect(socket_path)
+        owner = peer_uid(sock)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    except (OSError, RuntimeError) as e:
+        sock.close()
+        print(f"{Fore.YELLOW}Not using the micaflow daemon socket {socket_path}: {e}{Style.RESET_ALL}",
+              file=sys.stderr)
+        return None
+    if owner != os.getuid():
+        sock.close()
+        print(f"{Fore.YELLOW}Not using the micaflow daemon socket {socket_path}: "
+              f"it is held by another user (uid {owner}){Style.RESET_ALL}", file=sys.stderr)
+        return None
+
+    with sock:
+        request = {
+            "module": module_name,
+            "args": list(script_args),
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+        }
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        # The job writes straight to our stdio, so it must be passed as real fds
+        socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [0, 1, 2])
+
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                print(f"{Fore.RED}Lost connection to the micaflow daemon{Style.RESET_ALL}",
+                      file=sys.stderr)
+                return 1
+            reply += chunk
+    return json.loads(reply)["returncode"]
+
+
+def job_threads(request):
+    """
+    Thread budget of a job: its ``--threads`` argument, else the client's
+    OMP_NUM_THREADS (set per rule by Snakemake), else None.
+    """
+    args = request["args"]
+    candidates = []
+    if "--threads" in args and args.index("--threads") + 1 < len(args):
+        candidates.append(args[args.index("--threads") + 1])
+    candidates.append(request["env"].get("OMP_NUM_THREADS", ""))
+    for value in candidates:
+        if str(value).isdigit() and int(value) > 0:
+            return int(value)
+    return None
+
+
+def limit_threads(threads):
+    """
+    Limit the thread pools of the current (forked) process.
+
+    The worker imported numpy, torch and ANTs before forking, so their
+    OpenMP/BLAS pools were sized when it started and no longer read the
+    environment; they are resized here, and the environment is set for ITK
+    and for subprocesses.
+
+    Parameters
+    ----------
+    threads : int
+        Number of threads.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(limits=threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def run_job(request, fds):
+    """
+    Execute one job request in the current (forked) process.
+
+    Parameters
+    ----------
+    request : dict
+        Job description sent by submit_job().
+    fds : list of int
+        The client's stdin, stdout and stderr.
+
+    Returns
+    -------
+    int
+        Exit status of the job.
+    """
+    # Imported here: micaflow.cli imports this module for --via-daemon
+    from micaflow.cli import run_script
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    try:
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.environ["MICAFLOW_DISPATCH"] = "inprocess"
+        threads = job_threads(request)
+        if threads:
+            limit_threads(threads)
+        run_script(request["module"], request["args"])
+        returncode = 0
+    except subprocess.CalledProcessError as e:
+        returncode = e.returncode
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return returncode
+
+
+def preload(modules):
+    """
+    Import the given modules, reporting any that are unavailable.
+
+    Parameters
+    ----------
+    modules : list of str
+        Dotted module names.
+    """
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            print(f"  {Fore.GREEN}loaded{Style.RESET_ALL} {name}")
+        except Exception as e:
+            print(f"  {Fore.YELLOW}skipped{Style.RESET_ALL} {name} ({e})")
+
+
+def preload_weights():
+    """Load the installed SynB0 fold weights into the worker's cache."""
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    try:
+        from micaflow.scripts.synb0_DISCO.backends import preload_weights as preload_folds
+
+        paths = sorted(os.path.join(models_dir, f) for f in os.listdir(models_dir)
+                       if f.endswith(".pt") or f.endswith(".pth"))
+        preload_folds(paths)
+        print(f"  {Fore.GREEN}loaded{Style.RESET_ALL} {len(paths)} SynB0 fold weight file(s)")
+    except Exception as e:
+        print(f"  {Fore.YELLOW}skipped{Style.RESET_ALL} SynB0 weights ({e})")
+
+
+def start_job(conn, listener, allowed_modules, jobs):
+    """Read a request from conn and fork a child to run it."""
+    fds = []
+    try:
+        if peer_uid(conn) != os.getuid():
+            raise ValueError("connection from another user")
+        conn.settimeout(REQUEST_TIMEOUT)
+        data, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_BYTES, 3)
+        while data and not data.endswith(b"\n") and len(data) < MAX_REQUEST_BYTES:
+            chunk = conn.recv(MAX_REQUEST_BYTES)
+            if not chunk:
+                break
+            data += chunk
+        request = json.loads(data)
+        if request.get("module") not in allowed_modules or len(fds) != 3:
+            raise ValueError(f"refusing job for module {request.get('module')!r}")
+        conn.settimeout(None)
+    except (OSError, ValueError) as e:
+        print(f"{Fore.YELLOW}Rejected job: {e}{Style.RESET_ALL}")
+        for fd in fds:
+            os.close(fd)
+        send_returncode(conn, 1)
+        return
+
+    pid = os.fork()
+    if pid == 0:
+        listener.close()
+        conn.close()
+        os._exit(run_job(request, fds))
+
+    for fd in fds:
+        os.close(fd)
+    jobs[pid] = conn
+    print(f"  [{pid}] {request['module']} {' '.join(request['args'])}")
+    sys.stdout.flush()
+
+
+def reap_jobs(jobs, block):
+    """Collect finished children and report their status to the clients."""
+    while jobs:
+        try:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            jobs.clear()
+            return
+        if pid == 0:
+            return
+        conn = jobs.pop(pid, None)
+        if conn is not None:
+            send_returncode(conn, os.waitstatus_to_exitcode(status))
+        if block:
+            return
+
+
+def send_returncode(conn, returncode):
+    """Send a job's exit status to the client and close the connection."""
+    try:
+        conn.sendall(json.dumps({"returncode": returncode}).encode() + b"\n")
+    except OSError:
+        pass  # client went away; the job has already finished
+    finally:
+        conn.close()
+
+
+def serve(socket_path=None, preload_modules=True):
+    """
+    Run the micaflow worker until interrupted.
+
+    Parameters
+    ----------
+    socket_path : str, optional
+        Unix socket to listen on. Defaults to get_socket_path().
+    preload_modules : bool, optional
+        Import PRELOAD_MODULES and all micaflow scripts, and load the SynB0
+        weights, before accepting jobs (default: True).
+
+    Raises
+    ------
+    RuntimeError
+        If another worker is already listening on the socket, the default
+        socket directory is not private to the user, or the platform lacks
+        Unix sockets or fork.
+    """
+    from micaflow.cli import SCRIPT_MODULES
+
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork"):
+        raise RuntimeError("micaflow serve requires Unix sockets and fork (Linux or macOS)")
+    socket_path = socket_path or get_socket_path()
+    allowed_modules = set(SCRIPT_MODULES.values())
+    if _uses_default_dir(socket_path):
+        private_dir(os.path.dirname(socket_path), create=True)
+
+    if os.path.exists(socket_path):
+        if daemon_is_running(socket_path):
+            raise RuntimeError(f"A micaflow daemon is already listening on {socket_path}")
+        os.unlink(socket_path)  # stale socket from a worker that did not shut down
+
+    if preload_modules:
+        print(f"{Fore.CYAN}Preloading libraries...{Style.RESET_ALL}")
+        preload(PRELOAD_MODULES + sorted(allowed_modules))
+        preload_weights()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Created 0600 rather than restricted after bind, which would leave a window
+    umask = os.umask(0o177)
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(umask)
+    listener.listen()
+
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    jobs = {}  # pid -> client connection
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    print(f"{Fore.GREEN}micaflow daemon listening on {socket_path}{Style.RESET_ALL}")
+    sys.stdout.flush()
+
+    try:
+        while running:
+            for _ in selector.select(timeout=0.2):
+                try:
+                    conn, _ = listener.accept()
+                except InterruptedError:
+                    continue
+                start_job(conn, listener, allowed_modules, jobs)
+            reap_jobs(jobs, block=False)
+    finally:
+        selector.close()
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        if jobs:
+            print(f"{Fore.CYAN}Waiting for {len(jobs)} running job(s)...{Style.RESET_ALL}")
+        while jobs:
+            reap_jobs(jobs, block=True)
+        print(f"{Fore.GREEN}micaflow daemon stopped{Style.RESET_ALL}")
@@ -97,6 +97,14 @@ micaflow SDC \\
     --output-warp <path/to/fieldmap.nii.gz> \\
     --phase-encoding si
 
+# Coarse-to-fine estimation on a 3-level pyramid
+micaflow SDC \\
+    --input <path/to/ap_image.nii.gz> \\
+    --reverse-image <path/to/pa_image.nii.gz> \\
+    --output <path/to/corrected.nii.gz> \\
+    --output-warp <path/to/fieldmap.nii.gz> \\
+    --levels 3
+
 Python API Usage:
 ----------------
 >>> from micaflow.scripts.SDC import run
@@ -149,7 +157,8 @@ Technical Notes:
 - Optimization: ADMM (Alternating Direction Method of Multipliers)
 - Regularization: Hyperelastic regularization with Laplacian operator
 - ADMM parameters:
-  * max_iter: 500 iterations
+  * max_iter: 500 iterations (upper bound, see --max-iter)
+  * rel_tol: off (optional extra stop on the relative objective change)
   * rho_max: 1e6 (maximum penalty parameter)
   * rho_min: 1e1 (minimum penalty parameter)
   * max_iter_pcg: 20 (preconditioned conjugate gradient iterations)
@@ -161,6 +170,9 @@ Technical Notes:
   * SI/IS → z-axis (dimension 3)
 - Supports 4D data: applies correction to all volumes
 - Field map saved for applying to other images
+- Multilevel mode (--levels N): the field map is first estimated on images
+  downsampled by 2^(N-1), then prolonged to the next finer level as its
+  starting point; the fine level then only needs a few iterations
 
 Phase-Encoding Directions:
 -------------------------
@@ -200,16 +212,20 @@ Julian, Abigail, and Lars Ruthotto. "PyHySCO: GPU-enabled susceptibility artifac
 
 import numpy as np
 import nibabel as nib
-from scipy.ndimage import map_coordinates
-from EPI_MRI.EPIMRIDistortionCorrection import DataObject, EPIMRIDistortionCorrection, myAvg1D, myDiff1D, myLaplacian1D, JacobiCG
-from optimization.GaussNewton import GaussNewton
-import ants
+from scipy.ndimage import gaussian_filter, zoom
 import argparse
 import tempfile
 import os
 import shutil
 import sys
+import time
 from colorama import init, Fore, Style
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_nifti_io import probe_image, read_data, read_volume, save_image
+from micaflow.scripts.util_pe_resample import PhaseEncodeResampler
+
+ants = lazy_import("ants")
+torch = lazy_import("torch")
 
 init()
 
@@ -250,6 +266,12 @@ def print_help_message():
       {YELLOW}--phase-encoding{RESET}: Phase-encoding direction
                          {MAGENTA}Choices: 'ap', 'pa', 'lr', 'rl', 'si', 'is'{RESET}
                          {MAGENTA}Default: 'ap' (Anterior-Posterior){RESET}
+      {YELLOW}--levels{RESET}        : Number of pyramid levels for coarse-to-fine
+                         field estimation {MAGENTA}(default: 1, single level){RESET}
+      {YELLOW}--max-iter{RESET}      : Maximum Gauss-Newton iterations per level
+                         {MAGENTA}(default: 500){RESET}
+      {YELLOW}--rel-tol{RESET}       : Also stop once the relative change of the objective
+                         falls below this value {MAGENTA}(default: off){RESET}
     
     {CYAN}{BOLD}──────────────────── EXAMPLE USAGE ───────────────────────{RESET}
     
@@ -276,6 +298,14 @@ def print_help_message():
       {YELLOW}--output-warp{RESET} fieldmap.nii.gz \\
       {YELLOW}--phase-encoding{RESET} si
     
+    {BLUE}# Example 4: Coarse-to-fine estimation (faster on large images){RESET}
+    micaflow SDC \\
+      {YELLOW}--input{RESET} ap_b0.nii.gz \\
+      {YELLOW}--reverse-image{RESET} pa_b0.nii.gz \\
+      {YELLOW}--output{RESET} corrected_b0.nii.gz \\
+      {YELLOW}--output-warp{RESET} fieldmap.nii.gz \\
+      {YELLOW}--levels{RESET} 3
+    
     {CYAN}{BOLD}─────── WHAT ARE SUSCEPTIBILITY DISTORTIONS? ────────────{RESET}
     
     {GREEN}Definition:{RESET}
@@ -311,8 +341,10 @@ def print_help_message():
     {GREEN}Optimization:{RESET}
     {MAGENTA}•{RESET} ADMM (Alternating Direction Method of Multipliers)
     {MAGENTA}•{RESET} Hyperelastic regularization
-    {MAGENTA}•{RESET} 500 iterations with adaptive penalty parameter
+    {MAGENTA}•{RESET} Up to 500 iterations, stopping early once the relative
+      change of the objective drops below 1e-3
     {MAGENTA}•{RESET} Preconditioned conjugate gradient solver
+    {MAGENTA}•{RESET} Optional coarse-to-fine pyramid ({YELLOW}--levels{RESET})
     
     {CYAN}{BOLD}───────────── PHASE-ENCODING DIRECTIONS ─────────────────{RESET}
     {GREEN}AP{RESET} (Anterior-Posterior): Front → Back {MAGENTA}[Most common for DWI]{RESET}
@@ -461,7 +493,8 @@ def apply_warpfield(image, warpfield, pe_dim=1):
     - Nearest-neighbor mode for extrapolation at boundaries
     - Displacement is applied by modifying coordinates along PE dimension
     - Positive displacement = shift in positive direction along axis
-    - Works on 3D images only; for 4D, apply volume-by-volume
+    - Works on 3D images only; to warp a 4D series, build one
+      util_pe_resample.PhaseEncodeResampler and apply it to all volumes
     
     Examples
     --------
@@ -475,29 +508,241 @@ def apply_warpfield(image, warpfield, pe_dim=1):
     >>> # Save result
     >>> nib.save(nib.Nifti1Image(corrected, affine), "corrected.nii.gz")
     """
-    # Create a grid of coordinates
-    coords = np.meshgrid(
-        np.arange(image.shape[0]),
-        np.arange(image.shape[1]),
-        np.arange(image.shape[2]),
-        indexing="ij",
-    )
+    return PhaseEncodeResampler(warpfield, pe_dim, mode="nearest").apply_volume(image)
 
-    # Convert tuple to list so we can modify it
-    warped_coords = list(coords)
-    
-    # Apply the warpfield to the coordinates along the specified dimension
-    warped_coords[pe_dim] = coords[pe_dim] + warpfield
 
-    # Interpolate the image at the warped coordinates
-    warped_image = map_coordinates(
-        image, warped_coords, order=1, mode="nearest"
+def downsample_image(data, affine, factor):
+    """
+    Downsample a 3D image by a given factor for the coarse pyramid levels.
+
+    The image is smoothed with a Gaussian to avoid aliasing and resampled
+    so that the field of view is preserved exactly: the voxel size grows by
+    the ratio of the old to the new number of voxels along each axis.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        3D image data.
+    affine : numpy.ndarray
+        4x4 voxel-to-world affine of the image.
+    factor : int
+        Downsampling factor (1 returns the input unchanged).
+
+    Returns
+    -------
+    tuple
+        (downsampled data, affine of the downsampled grid).
+    """
+    if factor == 1:
+        return data, affine
+
+    shape = np.array(data.shape[:3])
+    new_shape = np.maximum(np.round(shape / factor).astype(int), 2)
+    scale = shape / new_shape
+
+    smoothed = gaussian_filter(data, sigma=(scale - 1) / 2)
+    downsampled = zoom(smoothed, new_shape / shape, order=1, mode="nearest", grid_mode=True)
+
+    # Voxel centres of the coarse grid sit in the middle of the fine voxels they cover
+    new_affine = affine.copy()
+    new_affine[:3, :3] = affine[:3, :3] * scale
+    new_affine[:3, 3] = affine[:3, :3] @ ((scale - 1) / 2) + affine[:3, 3]
+    return downsampled, new_affine
+
+
+def prolong_field(field, fine_shape):
+    """
+    Interpolate a coarse-level field map onto the next finer grid.
+
+    HYSCO field maps are cell-centred in every dimension except the
+    phase-encoding one (the last), where they live on the cell nodes and
+    therefore have one extra sample. Both grids cover the same physical
+    domain, so the values (displacements in world units) are kept as they
+    are and only resampled.
+
+    Parameters
+    ----------
+    field : torch.Tensor
+        Coarse field map of size m_plus(m) for the coarse image size m.
+    fine_shape : list of int
+        m_plus(m) of the finer level.
+
+    Returns
+    -------
+    torch.Tensor
+        Field map of size fine_shape.
+    """
+    if field.dim() != 3:
+        raise ValueError("Multilevel field estimation supports 3D images only")
+
+    fine_shape = [int(n) for n in fine_shape]
+    field = field.reshape(1, 1, *field.shape)
+    # Cell-centred dimensions first, then the nodal phase-encoding dimension
+    field = torch.nn.functional.interpolate(
+        field, size=fine_shape[:-1] + [field.shape[-1]], mode="trilinear", align_corners=False
+    )
+    field = torch.nn.functional.interpolate(
+        field, size=fine_shape, mode="trilinear", align_corners=True
     )
+    return field.reshape(fine_shape)
+
+
+def make_data_object(im1, im2, affine, pe_dim, device="cpu"):
+    """
+    Build a PyHySCO DataObject from in-memory images.
+
+    ``DataObject`` only accepts file paths, so handing it arrays would mean
+    writing both images to gzipped NIfTIs and reading them back. This
+    builds the same object directly: the dimension permutation, domain and
+    cell sizes follow ``EPI_MRI.utils.load_data``, the intensities are
+    normalized with ``EPI_MRI.utils.normalize`` and the interpolation models
+    are ``Interp1D``, as with the default constructor.
+
+    Parameters
+    ----------
+    im1, im2 : numpy.ndarray
+        3D (or 4D) images with opposite phase-encoding directions.
+    affine : numpy.ndarray
+        4x4 voxel-to-world affine shared by both images (voxel sizes only).
+    pe_dim : int
+        Phase-encoding dimension, 1-based as in PyHySCO (1 or 2).
+    device : str, optional
+        Torch device. Default: 'cpu'.
+
+    Returns
+    -------
+    EPI_MRI.EPIMRIDistortionCorrection.DataObject
+    """
+    from EPI_MRI.EPIMRIDistortionCorrection import DataObject
+    from EPI_MRI.ImageModels import Interp1D
+    from EPI_MRI.utils import normalize
 
-    return warped_image
+    if pe_dim not in (1, 2):
+        raise ValueError("PyHySCO supports phase encoding along the first or second dimension only")
+    if im1.shape != im2.shape or im1.ndim not in (3, 4):
+        raise ValueError(f"Expected two 3D or 4D images of equal shape, got {im1.shape} and {im2.shape}")
+
+    dtype = torch.float64
+    voxel_size = torch.tensor(np.sqrt((affine[:3, :3] ** 2).sum(axis=0)), dtype=dtype, device=device)
+    m = torch.tensor(im1.shape, dtype=torch.int, device=device)
+    if im1.ndim == 3:
+        permute, permute_back = ([2, 1, 0], [2, 1, 0]) if pe_dim == 1 else ([2, 0, 1], [1, 2, 0])
+        extent = voxel_size * m
+        omega = torch.zeros(6, dtype=dtype, device=device)
+        for i, axis in enumerate(permute):
+            omega[2 * i + 1] = extent[axis]
+    else:
+        permute, permute_back = ([3, 2, 1, 0], [3, 2, 1, 0]) if pe_dim == 1 else ([3, 2, 0, 1], [2, 3, 1, 0])
+        extent = torch.zeros(6, dtype=dtype, device=device)
+        extent[1::2] = (voxel_size * m[:-1])[permute[1:]]
+        omega = torch.hstack((torch.tensor([0, int(m[-1])], dtype=dtype, device=device), extent))
+    m = m[permute]
+    h = (omega[1::2] - omega[:-1:2]) / m
 
+    data = DataObject.__new__(DataObject)
+    data.device, data.dtype = device, dtype
+    data.omega, data.m, data.h, data.p = omega, m, h, permute_back
+    data.im1 = torch.as_tensor(np.asarray(im1, dtype=np.float64), device=device).permute(permute)
+    data.im2 = torch.as_tensor(np.asarray(im2, dtype=np.float64), device=device).permute(permute)
+    rho0, rho1 = normalize(data.im1, data.im2)
+    data.I1 = Interp1D(rho0, omega, m, dtype=dtype, device=device)
+    data.I2 = Interp1D(rho1, omega, m, dtype=dtype, device=device)
+    return data
 
-def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap', direction_channel=0):
+
+def run_gauss_newton(opt, B0, rel_tol=None):
+    """
+    Run PyHySCO's Gauss-Newton optimizer, optionally with a relative objective stop.
+
+    Without rel_tol this is ``GaussNewton.run_correction``. With rel_tol the
+    same iteration (PCG step followed by an Armijo line search) and the
+    library's stop tests are reproduced (gradient norm, objective change
+    and field map change), and the optimizer additionally stops as soon as
+    the objective changes by less than ``rel_tol`` relative to its previous
+    value. ``opt.max_iter`` remains the upper bound on the number of
+    iterations.
+
+    Parameters
+    ----------
+    opt : optimization.GaussNewton.GaussNewton
+        Configured optimizer; its corr_obj, linear_solver, line_search, tolG
+        and log are used, and the result is stored in opt.Bc.
+    B0 : torch.Tensor
+        Initial field map.
+    rel_tol : float, optional
+        Relative change of the objective at which to stop. Default: None
+        (PyHySCO's stop criteria only).
+
+    Returns
+    -------
+    int
+        Number of iterations performed.
+    """
+    if rel_tol is None:
+        opt.run_correction(B0)
+        return opt.log.history[-1]['iteration']
+
+    start = time.time()
+    corr_obj = opt.corr_obj
+    opt.B0 = B0
+    opt.Bc = torch.clone(B0)
+
+    Jc, dJ, H, M = corr_obj.eval(opt.Bc, do_derivative=True, calc_hessian=True)
+
+    # Stop tolerances of GaussNewton.run_correction
+    J_stop = abs(Jc)
+    tol_J = 1e-3
+    tol_Y = 1e-2
+
+    opt.log.log_iteration(
+        {'iteration': "Iteration", 'loss': "Loss Value", 'CG iters': "Inner Iters",
+         'CG rel residual': "Inner Rel Residual", 'LS iters': "LS iters",
+         'stepsize': "Step Size", 'dist val': "Dist Val", 'reg val': "Reg Val",
+         'grad norm': "Grad Norm"})
+    opt.log.log_iteration({'iteration': 0, 'loss': Jc.item()})
+    fevals = 1
+
+    iteration = 0
+    for iteration in range(1, opt.max_iter + 1):
+        dy, residual, _, cg_iters, resvec = opt.linear_solver.eval(H, -1.0 * dJ, M, x=torch.zeros_like(dJ))
+        step, Bt, ls_iters, _ = opt.line_search.eval(corr_obj, opt.Bc, dy, Jc, dJ)
+        if step == 0:
+            opt.log.log_message("line search failed: stopping at iteration %i" % iteration)
+            break
+
+        stop_fmap_change = iteration > 1 and torch.norm(opt.Bc - Bt) <= tol_Y * (1 + torch.norm(B0))
+        J_previous = Jc
+        opt.Bc = Bt
+        Jc, dJ, H, M = corr_obj.eval(opt.Bc, do_derivative=True, calc_hessian=True)
+        opt.log.log_iteration(
+            {'iteration': iteration, 'loss': Jc.item(), 'CG iters': cg_iters,
+             'CG rel residual': residual / resvec[0].item(), 'LS iters': ls_iters, 'stepsize': step,
+             'dist val': corr_obj.Dc.item(), 'reg val': corr_obj.Sc.item(),
+             'grad norm': torch.norm(dJ).item()})
+        fevals = fevals + 1 + ls_iters
+
+        grad_norm = torch.norm(dJ)
+        if grad_norm <= opt.tolG or grad_norm <= opt.tolG * (1 + J_stop):
+            opt.log.log_message("reached norm gradient tolerance")
+            break
+        if iteration > 1 and torch.abs(Jc - J_previous) <= tol_J * (1 + J_stop):
+            opt.log.log_message("reached function value change tolerance")
+            break
+        if stop_fmap_change:
+            opt.log.log_message("reached field map change tolerance")
+            break
+        if abs(Jc.item() - J_previous.item()) <= rel_tol * abs(J_previous.item()):
+            opt.log.log_message("reached relative function value change tolerance")
+            break
+
+    opt.log.log_message(f"total function evaluations: {fevals}")
+    minutes, seconds = divmod(time.time() - start, 60)
+    opt.log.log_message("total runtime:\t%d min %2.4f sec\n" % (minutes, seconds))
+    return iteration
+
+
+def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap', direction_channel=0,
+        levels=1, max_iter=500, rel_tol=None):
     """
     Perform EPI distortion correction using phase-encoding reversed images.
     
@@ -528,8 +773,19 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
         - 'lr' or 'rl': Left-Right (x-axis)
         - 'si' or 'is': Superior-Inferior (z-axis)
     direction_channel : int, optional
-        For 4D data, index of volume to use for field estimation.
+        For 4D data, index of the volume used for field estimation; the
+        estimated 3D field is then applied to every volume.
         Default: 0 (first volume, typically b=0 for DWI).
+    levels : int, optional
+        Number of pyramid levels. With levels > 1 the field map is first
+        estimated on images downsampled by 2^(levels-1) and each result
+        initializes the next finer level. Default: 1 (full resolution only).
+    max_iter : int, optional
+        Maximum number of Gauss-Newton iterations per level. Default: 500.
+    rel_tol : float, optional
+        Also stop a level once the objective changes by less than this
+        fraction of its previous value. Default: None (PyHySCO's own stop
+        criteria only).
         
     Returns
     -------
@@ -546,20 +802,24 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
     Notes
     -----
     - HYSCO algorithm: Hyperelastic regularized field estimation
-    - ADMM optimization: 500 iterations with adaptive penalty
+    - Gauss-Newton optimization: up to max_iter iterations per level,
+      optional early stop on rel_tol
+    - Multilevel mode: coarse levels are cheap and leave only a few
+      iterations to do at full resolution
     - GPU acceleration: Automatic if CUDA available (10-30x faster)
     - Initial alignment: ANTs affine registration before field estimation
     - Processing time: 1-5 min (GPU) or 5-30 min (CPU)
     - Memory: ~8-16 GB RAM for typical datasets
     - Field map is in units of voxel displacement
-    - For 4D inputs, applies correction to all volumes
+    - For 4D inputs, the field is estimated on volume direction_channel
+      and the 3D field is applied to all volumes
     - Temporary files cleaned up automatically
     
     Algorithm Steps:
     1. Load input images and extract specified volume (if 4D)
     2. Register reverse image to data image (ANTs affine)
     3. Initialize HYSCO optimization with registered pair
-    4. Estimate B0 field map using ADMM (500 iterations)
+    4. Estimate B0 field map, coarse to fine if levels > 1
     5. Apply displacement field to correct distortions
     6. Save corrected image and field map
     
@@ -596,6 +856,8 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
     for filepath, name in [(data_image, "Data image"), (reverse_image, "Reverse image")]:
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"{name} not found: {filepath}")
+    if levels < 1:
+        raise ValueError(f"levels must be at least 1, got {levels}")
     
     # Convert phase-encoding direction to dimension index
     pe_dim = get_pe_dimension(phase_encoding)
@@ -608,6 +870,21 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
     else:
         print(f"{YELLOW}GPU acceleration: DISABLED (using CPU){RESET}")
     
+    # Validate the pair from the headers before reading and registering it
+    data_info = probe_image(data_image)
+    reverse_info = probe_image(reverse_image)
+    if data_info.ndim not in (3, 4) or reverse_info.ndim not in (3, 4) \
+            or data_info.shape[:3] != reverse_info.shape[:3]:
+        raise ValueError(
+            f"Expected 3D or 4D images of equal spatial shape, got {data_info.shape} and {reverse_info.shape}"
+        )
+    for info in (data_info, reverse_info):
+        if info.ndim == 4 and not 0 <= direction_channel < info.n_volumes:
+            raise ValueError(
+                f"direction_channel {direction_channel} is out of range for {info.path} "
+                f"({info.n_volumes} volumes)"
+            )
+    
     # Create a temporary directory
     with tempfile.TemporaryDirectory() as temp_dir:
         print(f"\n{CYAN}Loading images...{RESET}")
@@ -615,16 +892,23 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
         # Load images
         im1_nii = nib.load(data_image)
         affine = im1_nii.affine
-        im1_data = im1_nii.get_fdata()
+        im1_data = read_data(im1_nii)
         print(f"  Data image: {im1_data.shape}")
         
-        im2_data = nib.load(reverse_image).get_fdata()
-        print(f"  Reverse image: {im2_data.shape}")
+        # The field is estimated on one 3D volume of each 4D input
+        if reverse_info.ndim == 4:
+            im2_data = read_volume(reverse_image, direction_channel)
+        else:
+            im2_data = read_data(reverse_image)
+        print(f"  Reverse image: {reverse_info.shape}")
+        if im1_data.ndim == 4:
+            print(f"  Estimating the field on volume {direction_channel}")
+        est_im1 = im1_data[..., direction_channel] if im1_data.ndim == 4 else im1_data
 
         # Convert images to ANTsImage
         print(f"\n{CYAN}Performing initial alignment...{RESET}")
         print(f"  Registration type: ANTs Affine")
-        ants_im1 = ants.from_numpy(im1_data)
+        ants_im1 = ants.from_numpy(est_im1)
         ants_im2 = ants.from_numpy(im2_data)
 
         # Perform affine registration
@@ -637,73 +921,77 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
         # Get the registered image
         registered_im2 = registration["warpedmovout"].numpy()
 
-        # Save the registered images in the temporary directory
+        # The registered pair is handed to HYSCO in memory (see make_data_object)
         print(f"\n{CYAN}Preparing for HYSCO optimization...{RESET}")
-        registered_im2_path = os.path.join(temp_dir, "registered_im2.nii.gz")
-        registered_im1_path = os.path.join(temp_dir, "registered_im1.nii.gz")
-        registered_im2_nifti = nib.Nifti1Image(registered_im2, affine)
-        nib.save(registered_im2_nifti, registered_im2_path)
-        nib.save(nib.Nifti1Image(im1_data, affine), registered_im1_path)
-
-        # Load the image and domain information
-        print(f"  Creating data object...")
-        data = DataObject(
-            registered_im1_path,
-            registered_im2_path,
-            pe_dim,
-            device=device,
-        )
-        
-        # Set up the objective function
-        print(f"  Setting up HYSCO objective function...")
-        print(f"    Regularizer: Hyperelastic (Laplacian)")
-        print(f"    Penalty parameter (rho): 1e3")
-        loss_func = EPIMRIDistortionCorrection(
-            data,
-            300,
-            1e-4,
-            averaging_operator=myAvg1D,
-            derivative_operator=myDiff1D,
-            regularizer=myLaplacian1D,
-            PC=JacobiCG,
-        )
-        
-        # Initialize the field map
-        print(f"  Initializing B0 field map...")
-        B0 = loss_func.initialize(blur_result=True)
-        print(f"{GREEN}Initialization completed{RESET}")
-        
-        # Set up the optimizer
-        print(f"\n{CYAN}Starting ADMM optimization...{RESET}")
-        print(f"  Maximum iterations: 500")
+
+        # PyHySCO pulls in PyTorch; import it only when the optimization runs
+        from EPI_MRI.EPIMRIDistortionCorrection import EPIMRIDistortionCorrection, myAvg1D, myDiff1D, myLaplacian1D, JacobiCG, m_plus
+        from optimization.GaussNewton import GaussNewton
+
+        print(f"\n{CYAN}Starting Gauss-Newton optimization...{RESET}")
+        print(f"  Maximum iterations: {max_iter}")
+        if rel_tol is not None:
+            print(f"  Relative tolerance: {rel_tol:g}")
+        print(f"  Pyramid levels: {levels}")
         print(f"  Penalty range: [1e1, 1e6]")
         print(f"  PCG iterations: 20")
         print(f"  Gauss-Newton iterations: 1")
         resultspath = os.path.join(temp_dir, "hysco_result")  # Now inside temp_dir
-        opt = GaussNewton(
-            loss_func,
-            max_iter=500,
-            verbose=True,
-            path=resultspath,
-        )
-        
-        # Optimize!
-        opt.run_correction(B0)
+
+        field = None
+        for level in reversed(range(levels)):
+            # Coarse levels use downsampled copies of the registered pair
+            factor = 2 ** level
+            level_im1, level_affine = downsample_image(est_im1, affine, factor)
+            level_im2, _ = downsample_image(registered_im2, affine, factor)
+
+            # Build the image and domain information
+            print(f"\n{CYAN}Level {levels - level}/{levels} (downsampling factor {factor}){RESET}")
+            data = make_data_object(level_im1, level_im2, level_affine, pe_dim, device=device)
+            print(f"  Grid: {tuple(int(n) for n in data.m)}")
+
+            # Set up the objective function
+            loss_func = EPIMRIDistortionCorrection(
+                data,
+                300,
+                1e-4,
+                averaging_operator=myAvg1D,
+                derivative_operator=myDiff1D,
+                regularizer=myLaplacian1D,
+                PC=JacobiCG,
+            )
+
+            if field is None:
+                # Coarsest level: optimal transport initialization
+                print(f"  Initializing B0 field map...")
+                B0 = loss_func.initialize(blur_result=True)
+            else:
+                # Finer level: start from the prolonged coarse solution
+                B0 = prolong_field(field, m_plus(data.m))
+
+            opt = GaussNewton(
+                loss_func,
+                max_iter=max_iter,
+                verbose=True,
+                path=resultspath if factor == 1 else f"{resultspath}-level{level}",
+            )
+
+            # Optimize!
+            iterations = run_gauss_newton(opt, B0, rel_tol=rel_tol)
+            field = opt.Bc
+            print(f"{GREEN}Level completed in {iterations} iterations{RESET}")
+
         print(f"\n{GREEN}Optimization completed{RESET}")
         
-        # Save field map and corrected images
-        print(f"\n{CYAN}Applying correction and saving results...{RESET}")
-        corr, _ = opt.apply_correction()
-        
-        # Move field map to output location
-        shutil.move(resultspath + "-EstFieldMap.nii.gz", output_warp)
-        print(f"{GREEN}Field map saved:{RESET} {output_warp}")
-        
-        # Load the field map
-        fieldmap = nib.load(output_warp).get_fdata()
+        # The estimated field map stays in memory. HYSCO's own corrected images
+        # (opt.apply_correction) are Jacobian-modulated and intensity-normalized,
+        # so they are not the output of this script and are not computed
+        fieldmap = opt.Bc.detach().reshape(list(m_plus(data.m))).permute(data.p).cpu().numpy()
+        fieldmap = fieldmap.astype(np.float32)
 
-        # Ensure the warpfield has the same dimensions as the image
-        if fieldmap.shape != im1_data.shape:
+        # The field has one extra node along the phase-encoding dimension;
+        # crop it to the image grid
+        if fieldmap.shape != im1_data.shape[:3]:
             print(f"{YELLOW}Warning: Fieldmap shape {fieldmap.shape} doesn't match image shape {im1_data.shape}{RESET}")
             print(f"  Auto-cropping fieldmap to match...")
             
@@ -724,40 +1012,27 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
             
             fieldmap = fieldmap[tuple(crop_slices)]
             print(f"  Cropped shape: {fieldmap.shape}")
-            
-            cropped_fieldmap_nii = nib.Nifti1Image(fieldmap, affine)
-            nib.save(cropped_fieldmap_nii, output_warp)
 
-        # Apply the warpfield along the specified phase-encoding dimension
+        save_image(fieldmap, affine, output_warp)
+        print(f"{GREEN}Field map saved:{RESET} {output_warp}")
+
+        # Apply the warpfield along the specified phase-encoding dimension. The
+        # interpolation taps are computed once and applied to every volume, so
+        # the estimation volume is corrected together with the others
         print(f"\n{CYAN}Applying displacement field...{RESET}")
-        warped_im = apply_warpfield(im1_data, fieldmap, pe_dim-1)
+        resampler = PhaseEncodeResampler(fieldmap, pe_dim - 1, mode="nearest")
 
-        # Handle multi-volume case if input was 4D
         if len(im1_nii.shape) > 3:
-            num_volumes = im1_nii.shape[3]
-            print(f"  Detected 4D input with {num_volumes} volumes")
+            print(f"  Detected 4D input with {im1_nii.shape[3]} volumes")
             print(f"  Applying correction to all volumes...")
+            # Same thread budget as the PyTorch field estimation
+            corrected_4d = resampler.apply(im1_data, threads=torch.get_num_threads())
             
-            corrected_volumes = []
-            for vol_idx in range(num_volumes):
-                if vol_idx == direction_channel:
-                    # Use the already corrected volume
-                    corrected_volumes.append(warped_im)
-                else:
-                    # Apply same warp to other volumes
-                    vol_data = im1_data[:,:,:,vol_idx]
-                    corrected_vol = apply_warpfield(vol_data, fieldmap, pe_dim-1)
-                    corrected_volumes.append(corrected_vol)
-            
-            # Combine volumes back into a 4D image
-            corrected_4d = np.stack(corrected_volumes, axis=3)
-            output_nii = nib.Nifti1Image(corrected_4d, affine, im1_nii.header)
-            nib.save(output_nii, output_name)
+            save_image(corrected_4d, affine, output_name, header=im1_nii.header)
             print(f"{GREEN}Corrected 4D image saved:{RESET} {output_name}")
         else:
             # For 3D case, just save the single warped volume
-            warped_nifti = nib.Nifti1Image(warped_im, affine)
-            nib.save(warped_nifti, output_name)
+            save_image(resampler.apply(im1_data), affine, output_name)
             print(f"{GREEN}Corrected 3D image saved:{RESET} {output_name}")
                 # Clean up temporary transform files generated by ANTs
         if 'fwdtransforms' in registration:
@@ -779,10 +1054,6 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
             shutil.rmtree(temp_dir)
         if os.path.exists(temp_dir + 'GN-'):
             shutil.rmtree(temp_dir + 'GN-')
-        if os.path.exists(registered_im2_path):
-            os.remove(registered_im2_path)
-        if os.path.exists(registered_im1_path):
-            os.remove(registered_im1_path)
     
     print(f"\n{GREEN}{BOLD}Susceptibility distortion correction completed successfully!{RESET}")
     print(f"  Input: {data_image}")
@@ -791,9 +1062,22 @@ def run(data_image, reverse_image, output_name, output_warp, phase_encoding='ap'
     print(f"  Field map: {output_warp}")
     print(f"  Phase-encoding: {phase_encoding.upper()}\n")
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the SDC script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
     
@@ -832,8 +1116,27 @@ if __name__ == "__main__":
         choices=["ap", "pa", "lr", "rl", "si", "is"],
         help="Phase-encoding direction (default: ap)"
     )
+    parser.add_argument(
+        "--levels",
+        type=int,
+        default=1,
+        help="Number of pyramid levels for coarse-to-fine field estimation (default: 1)"
+    )
+    parser.add_argument(
+        "--max-iter",
+        type=int,
+        default=500,
+        help="Maximum Gauss-Newton iterations per level (default: 500)"
+    )
+    parser.add_argument(
+        "--rel-tol",
+        type=float,
+        default=None,
+        help="Also stop once the relative objective change falls below this value "
+             "(default: off, PyHySCO's stop criteria only)"
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         run(
@@ -842,6 +1145,9 @@ if __name__ == "__main__":
             args.output, 
             args.output_warp,
             phase_encoding=args.phase_encoding,
+            levels=args.levels,
+            max_iter=args.max_iter,
+            rel_tol=args.rel_tol,
         )
         sys.exit(0)
         
@@ -860,3 +1166,7 @@ if __name__ == "__main__":
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow SDC --help' for usage information.{RESET}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
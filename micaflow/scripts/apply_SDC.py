@@ -14,7 +14,9 @@ The module works by:
 2. Loading a 3D warp field containing displacement values (expected shape: nx, ny, nz)
 3. Determining the phase-encoding direction from the provided argument
 4. Applying the warp field to each 3D volume independently along the specified direction
-5. Using linear interpolation (scipy.ndimage.map_coordinates with order=1) to resample
+5. Using linear interpolation along the phase-encoding axis to resample; the two
+   interpolation taps and weights per voxel are computed once from the warp field and
+   reused for every volume (see util_pe_resample)
 7. Saving the unwarped image with the specified affine transformation
 
 API Usage:
@@ -42,8 +44,9 @@ import argparse
 import nibabel as nib
 import numpy as np
 import sys
-from scipy.ndimage import map_coordinates
 from colorama import init, Fore, Style
+from micaflow.scripts.util_nifti_io import iter_volumes, read_data, save_image
+from micaflow.scripts.util_pe_resample import PhaseEncodeResampler
 
 init()
 
@@ -108,7 +111,8 @@ def print_help_message():
     {CYAN}{BOLD}────────────────────────── NOTES ───────────────────────{RESET}
     {MAGENTA}•{RESET} The warp field contains displacement values along the phase-encoding direction
     {MAGENTA}•{RESET} Phase-encoding direction must match the direction used in SDC warp calculation
-    {MAGENTA}•{RESET} Uses linear interpolation (scipy.ndimage.map_coordinates, order=1)
+    {MAGENTA}•{RESET} Uses linear interpolation along the phase-encoding axis (equivalent to
+      scipy.ndimage.map_coordinates, order=1), precomputed once for all volumes
     {MAGENTA}•{RESET} Each 3D volume in the 4D input is warped independently
     {MAGENTA}•{RESET} Output affine is taken from the --affine reference image, not from --input
     {MAGENTA}•{RESET} Common phase-encoding directions:
@@ -142,31 +146,17 @@ def apply_warpfield(data_array, warp_field, pe_dim=1):
     Returns
     -------
     numpy.ndarray
-        3D warped array with the same shape as data_array
+        3D float32 warped array with the same shape as data_array
 
     Notes
     -----
-    - Uses linear interpolation (scipy.ndimage.map_coordinates with order=1)
-    - Out-of-bounds values are handled with 'nearest' mode
+    - Uses linear interpolation along pe_dim, equivalent to
+      scipy.ndimage.map_coordinates with order=1
+    - Voxels whose displaced coordinate falls outside the image are set to 0
+    - To warp several volumes with the same field, build one
+      util_pe_resample.PhaseEncodeResampler and reuse it
     """
-    nx, ny, nz = data_array.shape
-    grid_x, grid_y, grid_z = np.meshgrid(
-        np.arange(nx), np.arange(ny), np.arange(nz), indexing="ij"
-    )
-    coords = np.stack((grid_x, grid_y, grid_z), axis=-1).astype(
-        np.float64
-    )  # Ensure float64 type
-    new_coords = coords.copy()
-    
-    # Apply displacement along the specified phase-encoding dimension
-    new_coords[..., pe_dim] += warp_field
-    
-    # Rearrange shape to (3, nx, ny, nz) and flatten each
-    new_coords = new_coords.transpose(3, 0, 1, 2)
-    flat_coords = [c.flatten() for c in new_coords]
-    warped_flat = map_coordinates(data_array, flat_coords, order=1)
-    warped = warped_flat.reshape(data_array.shape)
-    return warped
+    return PhaseEncodeResampler(warp_field, pe_dim, mode="constant").apply_volume(data_array)
 
 def get_pe_dimension(phase_encoding):
     """
@@ -210,8 +200,9 @@ def apply_SD_correction(motion_corr_path, warp_field, moving_affine, output, ped
     Returns:
     - out_path: Path to the SD-corrected output image.
     """
+    # Volumes are streamed from disk one at a time, see the loop below
     data_img = nib.load(motion_corr_path)
-    data_arr = data_img.get_fdata()
+    data_shape = data_img.shape
     
     # Get the phase encoding dimension
     pe_dim = get_pe_dimension(ped)
@@ -219,35 +210,52 @@ def apply_SD_correction(motion_corr_path, warp_field, moving_affine, output, ped
     
     # Ensure the warpfield has the same dimensions as the image for all dimensions
     for dim in range(3):
-        if warp_field.shape[dim] != data_arr.shape[dim]:
-            print(f"Warning: Warp field dimension {dim} ({warp_field.shape[dim]}) doesn't match image ({data_arr.shape[dim]})")
-            if warp_field.shape[dim] > data_arr.shape[dim]:
+        if warp_field.shape[dim] != data_shape[dim]:
+            print(f"Warning: Warp field dimension {dim} ({warp_field.shape[dim]}) doesn't match image ({data_shape[dim]})")
+            if warp_field.shape[dim] > data_shape[dim]:
                 # Crop to match
                 if dim == 0:
-                    warp_field = warp_field[:data_arr.shape[dim], :, :]
+                    warp_field = warp_field[:data_shape[dim], :, :]
                 elif dim == 1:
-                    warp_field = warp_field[:, :data_arr.shape[dim], :]
+                    warp_field = warp_field[:, :data_shape[dim], :]
                 elif dim == 2:
-                    warp_field = warp_field[:, :, :data_arr.shape[dim]]
-                print(f"  Cropped warp field dimension {dim} to {data_arr.shape[dim]}")
+                    warp_field = warp_field[:, :, :data_shape[dim]]
+                print(f"  Cropped warp field dimension {dim} to {data_shape[dim]}")
             else:
                 print(f"  ERROR: Warp field dimension {dim} is smaller than image dimension!")
     
-    print(f"Final image shape: {data_arr.shape[:3]}, warp field shape: {warp_field.shape}")
+    print(f"Final image shape: {data_shape[:3]}, warp field shape: {warp_field.shape}")
     
-    # Apply the correction to each volume using the correct phase encoding dimension
-    transformed_vols = [
-        apply_warpfield(data_arr[..., i], warp_field, pe_dim)
-        for i in range(data_arr.shape[-1])
-    ]
-    SD_corrected = np.stack(transformed_vols, axis=-1)
-    nib.save(nib.Nifti1Image(SD_corrected, moving_affine), output)
+    # The interpolation taps and weights depend only on the warp field, so
+    # they are computed once and applied to each volume as it is read,
+    # writing into a single float32 output array
+    resampler = PhaseEncodeResampler(warp_field, pe_dim, mode="constant")
+    SD_corrected = np.empty(data_shape, dtype=np.float32, order="F")
+    for i, volume in iter_volumes(data_img):
+        if len(data_shape) > 3:
+            resampler.apply_volume(volume, out=SD_corrected[..., i])
+        else:
+            resampler.apply_volume(volume, out=SD_corrected)
+    save_image(SD_corrected, moving_affine, output)
     return output
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the apply_SDC script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Print help message if no arguments provided
-    if len(sys.argv) == 1 or '-h' in sys.argv or '--help' in sys.argv:
+    if not argv or '-h' in argv or '--help' in argv:
         print_help_message()
         sys.exit(0)
 
@@ -286,11 +294,11 @@ if __name__ == "__main__":
         help="Output path for the SD-corrected image.",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Load warp field as a numpy displacement field
     warp_img = nib.load(args.warp)
-    warp_field = warp_img.get_fdata().squeeze()  # Expected shape: (nx, ny, nz)
+    warp_field = read_data(warp_img).squeeze()  # Expected shape: (nx, ny, nz)
     print("Warp field shape:", warp_field.shape)
     # Load the moving affine from given image
     moving_affine = nib.load(args.affine).affine
@@ -298,4 +306,8 @@ if __name__ == "__main__":
     out_path = apply_SD_correction(
         args.input, warp_field, moving_affine, args.output, ped=args.phase_encoding
     )
-    print(f"SD-corrected image saved as: {out_path} (phase encoding: {args.phase_encoding})")
\ No newline at end of file
+    print(f"SD-corrected image saved as: {out_path} (phase encoding: {args.phase_encoding})")
+
+
+if __name__ == "__main__":
+    main()
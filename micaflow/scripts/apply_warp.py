@@ -73,10 +73,18 @@ Python Usage:
 
 """
 
-import ants
 import argparse
 import sys
+import numpy as np
 from colorama import init, Fore, Style
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import save_ants_image
+
+ants = lazy_import("ants")
+
+# Interpolators that only pick existing voxel values
+LABEL_INTERPOLATORS = ("nearestNeighbor", "multiLabel", "genericLabel")
 
 init()
 
@@ -215,6 +223,8 @@ def apply_warp(moving, reference, affine=None, warp=None, output="warped_image.n
     - Order: affine (1st) → warp (2nd) → secondary_warp (3rd)
     - Use nearestNeighbor or multiLabel for discrete label images
     - Use linear or bSpline for continuous intensity images
+    - Integer-valued results of label interpolators are saved as label maps
+      (smallest integer type holding the labels, see util_nifti_io)
     
     Examples
     --------
@@ -239,12 +249,14 @@ def apply_warp(moving, reference, affine=None, warp=None, output="warped_image.n
     """
     # Load images if they are file paths
     if isinstance(moving, str):
-        moving_img = ants.image_read(moving)
+        with io_timer("read", moving):
+            moving_img = ants.image_read(moving)
     else:
         moving_img = moving
         
     if isinstance(reference, str):
-        reference_img = ants.image_read(reference)
+        with io_timer("read", reference):
+            reference_img = ants.image_read(reference)
     else:
         reference_img = reference
 
@@ -274,15 +286,24 @@ def apply_warp(moving, reference, affine=None, warp=None, output="warped_image.n
     )
     
     # Save the result
-    ants.image_write(transformed, output)
+    kind = "continuous"
+    if interpolation in LABEL_INTERPOLATORS:
+        values = transformed.numpy()
+        if np.array_equal(values, np.rint(values)):
+            kind = "labels"
+    with io_timer("write", output):
+        save_ants_image(transformed, output, kind=kind)
     print(f"Warped image saved to: {output}")
     
     return transformed
 
 
-def main():
+def main(argv=None):
     # Check if no arguments were provided
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
 
@@ -313,7 +334,7 @@ def main():
         default="linear",
         help="Interpolation method (default: linear).",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Call the apply_warp function with parsed arguments
     apply_warp(
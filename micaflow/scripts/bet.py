@@ -83,12 +83,10 @@ Python API Usage (direct):
 >>> brain_data = input_img.get_fdata()
 >>> brain_data[~mask] = 0
 >>> 
->>> # Save results
->>> brain_img = nib.Nifti1Image(brain_data, input_img.affine)
->>> brain_img.to_filename("t1w_brain.nii.gz")
->>> 
->>> mask_img = nib.Nifti1Image(mask.astype(np.int8), input_img.affine)
->>> mask_img.to_filename("brain_mask.nii.gz")
+>>> # Save results (input dtype for the brain, uint8 for the mask)
+>>> from micaflow.scripts.util_nifti_io import save_image
+>>> save_image(brain_data, input_img.affine, "t1w_brain.nii.gz", header=input_img.header)
+>>> save_image(mask, input_img.affine, "brain_mask.nii.gz", kind="mask")
 
 Exit Codes:
 ----------
@@ -125,8 +123,7 @@ import shutil
 import sys
 from colorama import init, Fore, Style
 import nibabel as nib
-from nilearn.image import resample_to_img
-import numpy as np
+from micaflow.scripts.util_nifti_io import probe_image, read_data, same_grid, save_image
 
 init()
 
@@ -205,9 +202,22 @@ def print_help_message():
     print(help_text)
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the bet script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
 
@@ -237,7 +247,7 @@ if __name__ == "__main__":
         help="Remove cerebellum from brain mask (only works with --parcellation mode)",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Validate that either input-mask or parcellation is provided
     if not args.input_mask and not args.parcellation:
@@ -258,6 +268,9 @@ if __name__ == "__main__":
         print(f"{Fore.YELLOW}Warning: --output-mask is ignored when using --input-mask{Style.RESET_ALL}")
     
     try:
+        # nilearn is slow to import; only pay for it once processing starts
+        from nilearn.image import resample_to_img
+
         input_abs_path = os.path.abspath(args.input)
         input_img = nib.load(args.input)
     except Exception as e:
@@ -272,14 +285,9 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"{Fore.RED}Error loading input mask: {e}{Style.RESET_ALL}")
             sys.exit(1)
-            
-        input_brain = input_img.get_fdata()
-
-        # Check if mask and image have the same shape and affine
-        shapes_match = input_img.shape == input_mask_img.shape
-        affines_match = np.allclose(input_img.affine, input_mask_img.affine, rtol=1e-5)
 
-        if not (shapes_match and affines_match):
+        # Check from the headers if mask and image have the same shape and affine
+        if not same_grid(probe_image(input_img), probe_image(input_mask_img)):
             print(f"{Fore.YELLOW}Warning: Mask and input image do not match in shape or physical space.{Style.RESET_ALL}")
             print(f"  Image shape: {input_img.shape}, mask shape: {input_mask_img.shape}")
             print(f"  Image affine:\n{input_img.affine}\n  Mask affine:\n{input_mask_img.affine}")
@@ -289,9 +297,9 @@ if __name__ == "__main__":
         else:
             input_mask = input_mask_img.get_fdata().astype(bool)
 
+        input_brain = read_data(input_img)
         input_brain[~input_mask] = 0
-        input_brain = nib.Nifti1Image(input_brain, input_img.affine)
-        input_brain.to_filename(args.output)
+        save_image(input_brain, input_img.affine, args.output, header=input_img.header)
         print(f"{Fore.GREEN}Brain extraction complete. Output saved to: {args.output}{Style.RESET_ALL}")
         
     else:
@@ -306,7 +314,7 @@ if __name__ == "__main__":
             print(f"{Fore.RED}Error loading parcellation: {e}{Style.RESET_ALL}")
             sys.exit(1)
             
-        input_brain = input_img.get_fdata()
+        input_brain = read_data(input_img)
 
         # Resample synthseg to match input dimensions and space
         # Using nearest interpolation to preserve label values
@@ -332,13 +340,15 @@ if __name__ == "__main__":
 
         # Apply the mask to the input image
         input_brain[~mask] = 0
-        input_brain = nib.Nifti1Image(input_brain, input_img.affine)
-        input_brain.to_filename(args.output)
+        save_image(input_brain, input_img.affine, args.output, header=input_img.header)
         print(f"{Fore.GREEN}Brain extraction complete. Output saved to: {args.output}{Style.RESET_ALL}")
         
         if args.output_mask:
-            mask = nib.Nifti1Image(mask.astype(np.int8), input_img.affine)
-            mask.to_filename(args.output_mask)
+            save_image(mask, input_img.affine, args.output_mask, kind="mask")
             print(f"{Fore.GREEN}Brain mask saved to: {args.output_mask}{Style.RESET_ALL}")
     
     sys.exit(0)  # Explicit success exit
+
+
+if __name__ == "__main__":
+    main()
@@ -329,14 +329,17 @@ References:
    2011;54(3):2033-2044. doi:10.1016/j.neuroimage.2010.09.025
 """
 
-import ants
 import numpy as np
 import argparse
 import sys
 import os
 import tempfile
 from colorama import init, Fore, Style
-from dipy.denoise.gibbs import gibbs_removal
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import probe_image, same_grid, save_ants_image
+
+ants = lazy_import("ants")
 
 
 init()
@@ -574,6 +577,8 @@ def bias_field_correction_3d(image_path, output_path, mask_path=None, gibbs=Fals
         be automatically generated using Otsu thresholding.
     gibbs : bool, optional
         If True, apply Gibbs ringing removal before bias correction.
+    threads : int, optional
+        Number of threads for Gibbs removal and .nii.gz compression.
     
     Returns
     -------
@@ -617,9 +622,12 @@ def bias_field_correction_3d(image_path, output_path, mask_path=None, gibbs=Fals
     run_bias_field_correction : Main entry point with auto-detection
     """
     print(f"{CYAN}Loading 3D image...{RESET}")
-    img = ants.image_read(image_path)
+    with io_timer("read", image_path):
+        img = ants.image_read(image_path)
 
     if gibbs:
+        from dipy.denoise.gibbs import gibbs_removal
+
         print(f"{CYAN}Running Gibbs ringing removal...{RESET}")
         arr = img.numpy()
         gibbs_removal(arr, slice_axis=2, n_points=3, inplace=True, num_processes=threads)
@@ -630,7 +638,8 @@ def bias_field_correction_3d(image_path, output_path, mask_path=None, gibbs=Fals
     
     if mask_path:
         print(f"{CYAN}Loading mask...{RESET}")
-        mask_img = ants.image_read(mask_path)
+        with io_timer("read", mask_path):
+            mask_img = ants.image_read(mask_path)
     else:
         print(f"{YELLOW}No mask provided. Generating mask automatically...{RESET}")
         mask_img = ants.get_mask(img)
@@ -639,14 +648,16 @@ def bias_field_correction_3d(image_path, output_path, mask_path=None, gibbs=Fals
     corrected_img = ants.n4_bias_field_correction(img, mask=mask_img)
     
     print(f"{CYAN}Saving corrected image...{RESET}")
-    ants.image_write(corrected_img, output_path)
+    with io_timer("write", output_path):
+        save_ants_image(corrected_img, output_path, threads)
     
     print(f"{GREEN}3D bias correction completed{RESET}")
     return output_path
 
 
 def bias_field_correction_4d(image_path, mask_path=None, output_path=None, 
-                             b0_path=None, b0_corrected_path=None, direction_dimension=3):
+                             b0_path=None, b0_corrected_path=None, direction_dimension=3,
+                             threads=1):
     """
     Apply N4 bias field correction to a 4D diffusion image.
     
@@ -672,6 +683,8 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     direction_dimension : int, default=3
         Dimension along which diffusion volumes are organized (0-indexed).
         For standard NIfTI: dimension 3 (4th dimension).
+    threads : int, default=1
+        Number of threads used to compress .nii.gz outputs.
     
     Returns
     -------
@@ -717,6 +730,8 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     - Automatic resampling if b0/mask geometry doesn't match
     - Processing time: 1-5 minutes for typical DWI
     - More efficient than per-volume correction
+    - Bias field is applied to all volumes in place in float32, so peak
+      memory stays at about one copy of the 4D series
     - Preserves 4D image geometry
     
     Algorithm:
@@ -725,8 +740,7 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     3. Load or use first volume as b=0
     4. Resample mask and b=0 if needed
     5. Estimate bias field from b=0
-    6. Apply bias field to each volume
-    7. Reconstruct 4D image
+    6. Divide all volumes by the bias field in one broadcast operation
     
     See Also
     --------
@@ -735,15 +749,18 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     """
     # Read the input images
     print(f"{CYAN}Loading 4D diffusion image...{RESET}")
-    img = ants.image_read(image_path)
+    with io_timer("read", image_path):
+        img = ants.image_read(image_path)
 
-    img_data = img.numpy()
+    # float32 view of the image buffer; corrected in place further down
+    img_data = img.view()
     print(f"  Image shape: {img_data.shape}")
     print(f"  Direction dimension: {direction_dimension}")
     
     if b0_path:
         print(f"{CYAN}Loading b=0 image...{RESET}")
-        b0_img = ants.image_read(b0_path)
+        with io_timer("read", b0_path):
+            b0_img = ants.image_read(b0_path)
     else:
         b0_img = None
     
@@ -766,7 +783,8 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     # Handle the mask - either use provided mask or generate one
     if mask_path:
         print(f"{CYAN}Loading mask...{RESET}")
-        mask_img = ants.image_read(mask_path)
+        with io_timer("read", mask_path):
+            mask_img = ants.image_read(mask_path)
     else:
         print(f"{YELLOW}No mask provided. Generating mask automatically...{RESET}")
         # Generate mask from b0 or first volume
@@ -813,46 +831,16 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
 
     print(f"{CYAN}Applying bias field to all {img_data.shape[direction_dimension]} DWI volumes...{RESET}")
     
-    # Apply the same bias field to each volume of the 4D image
-    corrected_vols = []
-    num_volumes = img_data.shape[direction_dimension]
-    
-    for i in range(num_volumes):
-        if (i + 1) % 10 == 0 or i == 0 or i == num_volumes - 1:
-            print(f"  Processing volume {i+1}/{num_volumes}...")
-        
-        # Create dynamic indexing tuple to access volumes along the specified dimension
-        vol_idx = tuple(slice(None) if j != direction_dimension else i 
-                        for j in range(len(img_data.shape)))
-        
-        # Extract the current volume using dynamic indexing
-        vol_data = img_data[vol_idx]
-        
-        # Create ANTs image from the current volume
-        vol_ants = ants.from_numpy(
-            vol_data,
-            spacing=img.spacing[:3],
-            origin=img.origin[:3],
-            direction=img.direction[:3, :3],
-        )
-        
-        # Divide by the bias field (same as applying the correction)
-        corrected_vol = vol_ants / bias_field
-        
-        # Add to results
-        corrected_vols.append(corrected_vol.numpy())
-    
-    # Stack corrected volumes into 4D array along the specified direction dimension
-    print(f"{CYAN}Reconstructing 4D image...{RESET}")
-    corrected_array = np.stack(corrected_vols, axis=direction_dimension)
-    
-    # Create ANTs image from corrected array
-    corrected_img = ants.from_numpy(
-        corrected_array, 
-        spacing=img.spacing, 
-        origin=img.origin, 
-        direction=img.direction
-    )
+    # Divide every volume by the bias field in a single broadcast operation,
+    # writing into the image buffer so no second copy of the 4D series is made.
+    # Same float32 division as ANTs image arithmetic, so results are identical.
+    if bias_field.shape != first_vol_img.shape:
+        raise ValueError(f"Bias field shape {bias_field.shape} does not match the DWI volumes "
+                         f"of shape {first_vol_img.shape}")
+    bias_data = np.expand_dims(bias_field.numpy().astype(np.float32, copy=False),
+                               axis=direction_dimension)
+    np.divide(img_data, bias_data, out=img_data)
+    corrected_img = img
     
     # Correct b0 separately
     corrected_b0 = b0_resampled / bias_field
@@ -860,10 +848,12 @@ def bias_field_correction_4d(image_path, mask_path=None, output_path=None,
     # Save results
     print(f"{CYAN}Saving corrected images...{RESET}")
     if b0_corrected_path:
-        ants.image_write(corrected_b0, b0_corrected_path)
+        with io_timer("write", b0_corrected_path):
+            save_ants_image(corrected_b0, b0_corrected_path, threads)
         print(f"  Corrected b=0: {b0_corrected_path}")
     
-    ants.image_write(corrected_img, output_path)
+    with io_timer("write", output_path):
+        save_ants_image(corrected_img, output_path, threads)
     print(f"  Corrected 4D: {output_path}")
     
     print(f"{GREEN}4D bias correction completed{RESET}")
@@ -989,6 +979,7 @@ def run_bias_field_correction(image_path, output_path, mask_path=None, mode="aut
     Notes
     -----
     - Auto mode checks if dimension 4 exists and has size > 1
+    - Dimensionality and mask geometry are read from the headers only
     - Automatically resamples mask if geometry doesn't match
     - Temporary resampled masks are cleaned up automatically
     - For 4D: bias estimated from b=0 and applied to all volumes
@@ -1007,11 +998,10 @@ def run_bias_field_correction(image_path, output_path, mask_path=None, mode="aut
     os.environ.update(env)
     # If auto mode, determine if image is 3D or 4D
     print(f"{CYAN}Detecting image dimensionality...{RESET}")
-    img = ants.image_read(image_path)
+    info = probe_image(image_path)
     
     if mode == "auto":
-        dims = img.shape
-        mode = "4d" if (len(dims) > 3 and dims[3] > 1) else "3d"
+        mode = "4d" if info.n_volumes > 1 else "3d"
         print(f"  Detected: {mode.upper()} image")
     else:
         print(f"  Mode: {mode.upper()} (explicit)")
@@ -1025,18 +1015,18 @@ def run_bias_field_correction(image_path, output_path, mask_path=None, mode="aut
     # Check if mask needs resampling
     temp_mask_path = None
     if mask_path:
-        mask_img = ants.image_read(mask_path)
-        
-        # Check if they're in the same physical space
-        same_spacing = np.allclose(img.spacing[:3], mask_img.spacing[:3], rtol=1e-6)
-        same_origin = np.allclose(img.origin[:3], mask_img.origin[:3], rtol=1e-6)
-        same_direction = np.allclose(img.direction[:3,:3], mask_img.direction[:3,:3], rtol=1e-6)
+        # Check from the headers if they're in the same physical space
+        mask_info = probe_image(mask_path)
         
-        if not (same_spacing and same_origin and same_direction):
+        if not same_grid(info, mask_info):
             print(f"{YELLOW}Warning: Mask and input image have different physical properties{RESET}")
-            print(f"  Image spacing: {img.spacing[:3]}")
-            print(f"  Mask spacing: {mask_img.spacing[:3]}")
+            print(f"  Image spacing: {info.spacing}")
+            print(f"  Mask spacing: {mask_info.spacing}")
             print(f"{CYAN}Resampling mask to match input image...{RESET}")
+            with io_timer("read", image_path):
+                img = ants.image_read(image_path)
+            with io_timer("read", mask_path):
+                mask_img = ants.image_read(mask_path)
             
             # Create a temporary file for the resampled mask
             temp_dir = tempfile.gettempdir()
@@ -1059,7 +1049,7 @@ def run_bias_field_correction(image_path, output_path, mask_path=None, mode="aut
         if mode == "4d":
             return bias_field_correction_4d(
                 image_path, mask_path, output_path, 
-                b0_path, b0_corrected_path, direction_dimension
+                b0_path, b0_corrected_path, direction_dimension, threads
             )
         else:  # 3d
             return bias_field_correction_3d(image_path, output_path, mask_path, gibbs, threads)
@@ -1070,9 +1060,22 @@ def run_bias_field_correction(image_path, output_path, mask_path=None, mode="aut
             print(f"{CYAN}Cleaned up temporary files{RESET}")
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the bias_correction script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments provided or help requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
     
@@ -1117,7 +1120,7 @@ if __name__ == "__main__":
         help="Number of threads to use for processing (default: 1)."
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     try:
         # Validate input file exists
@@ -1179,4 +1182,8 @@ if __name__ == "__main__":
         print(f"\n{RED}{BOLD}Error during bias correction:{RESET}")
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow bias_correction --help' for usage information.{RESET}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
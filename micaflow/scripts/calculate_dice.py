@@ -93,11 +93,10 @@ See Also:
 """
 
 import csv
-import nibabel as nib
 import argparse
 import sys
 from colorama import init, Fore, Style
-from lamareg.scripts.dice_compare import compare_parcellations_dice
+from micaflow.scripts.util_nifti_io import probe_image, same_grid
 
 init()
 
@@ -201,9 +200,22 @@ def print_help_message():
     print(help_text)
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the calculate_dice script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
 
@@ -224,7 +236,7 @@ if __name__ == "__main__":
         help="Output CSV file path for DICE scores"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         print(f"{CYAN}Loading segmentation volumes...{RESET}")
@@ -236,15 +248,18 @@ if __name__ == "__main__":
         if not os.path.exists(args.reference):
             raise FileNotFoundError(f"Reference file not found: {args.reference}")
         
-        # Load images to validate dimensions
-        input_img = nib.load(args.input)
-        ref_img = nib.load(args.reference)
+        # Read the headers only to validate dimensions; lamareg loads the data
+        input_img = probe_image(args.input)
+        ref_img = probe_image(args.reference)
         
         print(f"  Input: {args.input} (shape: {input_img.shape})")
         print(f"  Reference: {args.reference} (shape: {ref_img.shape})")
+        if not same_grid(input_img, ref_img):
+            print(f"{YELLOW}Warning: Input and reference are not on the same voxel grid{RESET}")
         print(f"{CYAN}Computing DICE scores...{RESET}")
         
         # Call the actual comparison function from lamareg
+        from lamareg.scripts.dice_compare import compare_parcellations_dice
         compare_parcellations_dice(args.input, args.reference, args.output, verbose=False)
         
         print(f"\n{GREEN}{BOLD}DICE scores successfully computed!{RESET}")
@@ -284,3 +299,7 @@ if __name__ == "__main__":
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow calculate_dice --help' for usage information.{RESET}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,11 @@ Mean Diffusivity (MD):
 Features:
 --------
 - Computes DTI model using robust tensor fitting from DIPY
+- Fits in-mask voxels only, gathered into a compact voxel list
+  (util_voxel_list); background voxels are neither copied nor fitted
+- Optional AD, RD, tensor mode, principal eigenvector (V1) and tensor maps
+  from the same fit (util_tensor_fit)
+- WLS or OLS fitting, in chunks of voxels spread over worker processes
 - Compatible with standard neuroimaging file formats (NIfTI)
 - Preserves image header and spatial information in output files
 
@@ -45,6 +50,20 @@ micaflow compute_fa_md \\
     --output-fa <path/to/fa_map.nii.gz> \\
     --output-md <path/to/md_map.nii.gz>
 
+# Additional maps from the same fit, OLS, 4 worker processes
+micaflow compute_fa_md \\
+    --input <path/to/dwi.nii.gz> \\
+    --mask <path/to/brain_mask.nii.gz> \\
+    --bval <path/to/dwi.bval> \\
+    --bvec <path/to/dwi.bvec> \\
+    --output-fa <path/to/fa_map.nii.gz> \\
+    --output-md <path/to/md_map.nii.gz> \\
+    --output-ad <path/to/ad_map.nii.gz> \\
+    --output-rd <path/to/rd_map.nii.gz> \\
+    --output-v1 <path/to/v1_map.nii.gz> \\
+    --fit-method ols \\
+    --workers 4
+
 # With separate b0 volume to merge
 micaflow compute_fa_md \\
     --input <path/to/dwi.nii.gz> \\
@@ -113,7 +132,10 @@ Technical Notes:
 ---------------
 - DTI model requires at least 6 unique gradient directions + 1 b0 volume
 - More directions improve estimation robustness (30+ recommended)
-- Tensor fitting uses weighted least squares (WLS) by default in DIPY
+- Tensor fitting uses weighted least squares (WLS) by default in DIPY;
+  --fit-method ols trades some accuracy at low SNR for a faster fit
+- The V1 map has 3 volumes (x, y, z); the tensor map has 6 volumes in
+  lower-triangular order (Dxx, Dxy, Dyy, Dxz, Dyz, Dzz)
 - B-values should be in s/mm² units
 - FA values outside [0,1] are clamped (indicates fitting issues)
 - Processing time: ~30-60 seconds for typical resolution (depending on # volumes)
@@ -129,10 +151,10 @@ import argparse
 import sys
 import os
 import numpy as np
-from dipy.reconst.dti import TensorModel
-from dipy.core.gradients import gradient_table
 import nibabel as nib
 from colorama import init, Fore, Style
+from micaflow.scripts.util_nifti_io import probe_image, read_data, save_image
+from micaflow.scripts.util_voxel_list import VoxelList
 
 init()
 
@@ -177,6 +199,15 @@ def print_help_message():
       {YELLOW}--b0-index{RESET}   : Index at which to insert b0 (default: 0)
                    {MAGENTA}Note: All three b0 arguments required if any is provided{RESET}
     
+    {CYAN}{BOLD}─────────────────── OPTIONAL ARGUMENTS ───────────────────{RESET}
+      {YELLOW}--output-ad{RESET}     : Output path for the axial diffusivity map
+      {YELLOW}--output-rd{RESET}     : Output path for the radial diffusivity map
+      {YELLOW}--output-mode{RESET}   : Output path for the tensor mode map
+      {YELLOW}--output-v1{RESET}     : Output path for the principal eigenvector (3 volumes)
+      {YELLOW}--output-tensor{RESET} : Output path for the tensor elements (6 volumes)
+      {YELLOW}--fit-method{RESET}    : Tensor fit, wls or ols (default: wls)
+      {YELLOW}--workers{RESET}       : Worker processes for the fit (default: 1)
+    
     {CYAN}{BOLD}──────────────────── EXAMPLE USAGE ──────────────────────{RESET}
     
     {BLUE}# Example 1: DWI already includes b0{RESET}
@@ -226,6 +257,7 @@ def print_help_message():
     {MAGENTA}•{RESET} If b0 volume is provided, it will be merged with DWI at specified index
     {MAGENTA}•{RESET} B0 gradients (bval/bvec) will be inserted at the same index
     {MAGENTA}•{RESET} Uses weighted least squares (WLS) tensor fitting from DIPY
+    {MAGENTA}•{RESET} All requested maps are computed from a single tensor fit
     {MAGENTA}•{RESET} Typical processing time: 30-60 seconds (varies with # volumes)
     {MAGENTA}•{RESET} FA values are automatically clamped to [0, 1] range
     
@@ -326,7 +358,8 @@ def merge_b0_with_dwi(dwi_data, dwi_affine, b0_data, bvals, bvecs, b0_bval, b0_b
 
 
 def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path, md_path, 
-                  b0_volume=None, b0_bval=None, b0_bvec=None, b0_index=0):
+                  b0_volume=None, b0_bval=None, b0_bvec=None, b0_index=0,
+                  fit_method="wls", workers=1, extra_outputs=None):
     """
     Compute Fractional Anisotropy (FA) and Mean Diffusivity (MD) maps from DWI.
     
@@ -361,6 +394,13 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
         Path to b0 b-vector file (.bvec).
     b0_index : int, optional
         Index at which to insert b0 volume. Default is 0 (beginning).
+    fit_method : {'wls', 'ols'}, optional
+        Tensor fitting method. Default is 'wls'.
+    workers : int, optional
+        Number of worker processes fitting chunks of voxels. Default is 1.
+    extra_outputs : dict, optional
+        Additional maps to save, as metric name -> output path. Metrics are
+        'ad', 'rd', 'mode', 'v1' and 'tensor' (see util_tensor_fit).
         
     Returns
     -------
@@ -378,7 +418,9 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
     -----
     - MD values are in mm²/s (not × 10⁻³ mm²/s)
     - FA values are automatically clamped to [0, 1]
-    - Uses weighted least squares (WLS) tensor fitting
+    - Uses weighted least squares (WLS) tensor fitting unless fit_method='ols'
+    - All maps come from one fit; extra outputs do not refit the tensor
+    - Only voxels inside the mask are fitted; FA and MD are 0 elsewhere
     - Requires at least 6 unique gradient directions + 1 b0 volume
     - B-vectors should be normalized for non-zero b-values
     
@@ -407,26 +449,29 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
     ...     b0_bvec="b0.bvec"
     ... )
     """
-    print(f"{CYAN}Loading DWI data...{RESET}")
     bias_corr = nib.load(bias_corr_path)
-    dwi_data = bias_corr.get_fdata()
-    dwi_affine = bias_corr.affine
-    print(f"  DWI shape: {dwi_data.shape}")
-    
-    print(f"{CYAN}Loading brain mask...{RESET}")
     mask = nib.load(mask_path)
-    mask_data = mask.get_fdata()
-    print(f"  Mask shape: {mask_data.shape}")
     
-    # Validate dimensions
-    if dwi_data.shape[:3] != mask_data.shape[:3]:
+    # Validate dimensions from the headers before reading any data
+    dwi_info = probe_image(bias_corr)
+    mask_info = probe_image(mask)
+    if dwi_info.shape[:3] != mask_info.shape[:3]:
         raise ValueError(
             f"Dimension mismatch:\n"
-            f"  DWI spatial dimensions: {dwi_data.shape[:3]}\n"
-            f"  Mask dimensions: {mask_data.shape[:3]}\n"
+            f"  DWI spatial dimensions: {dwi_info.shape[:3]}\n"
+            f"  Mask dimensions: {mask_info.shape[:3]}\n"
             f"Spatial dimensions must match."
         )
     
+    print(f"{CYAN}Loading DWI data...{RESET}")
+    dwi_data = read_data(bias_corr)
+    dwi_affine = bias_corr.affine
+    print(f"  DWI shape: {dwi_data.shape}")
+    
+    print(f"{CYAN}Loading brain mask...{RESET}")
+    mask_data = read_data(mask)
+    print(f"  Mask shape: {mask_data.shape}")
+    
     print(f"{CYAN}Loading gradient table...{RESET}")
     # Load bvals and bvecs
     with open(moving_bval, 'r') as f:
@@ -448,7 +493,7 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
         
         # Load b0 volume
         b0_img = nib.load(b0_volume)
-        b0_data = b0_img.get_fdata()
+        b0_data = read_data(b0_img)
         print(f"  B0 shape: {b0_data.shape}")
         
         # Load b0 bval
@@ -511,10 +556,17 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
         print(f"{YELLOW}Warning: Only {dwi_count} DWI directions found. "
               f"DTI fitting requires at least 6 for reliable results.{RESET}")
     
-    # Apply mask (broadcast to 4D)
+    # Fit only the voxels inside the mask; the rest of the series is dropped
     print(f"{CYAN}Applying brain mask...{RESET}")
-    masked_data = dwi_data * mask_data[..., None]
-    
+    voxels = VoxelList(mask_data > 0)
+    masked_data = voxels.gather(dwi_data)
+    del dwi_data
+    print(f"  Voxels in mask: {voxels.n_voxels} ({voxels.fraction:.1%} of the grid)")
+    
+    # DIPY is slow to import; load it only once the data is ready to fit
+    from dipy.core.gradients import gradient_table
+    from micaflow.scripts.util_tensor_fit import fit_tensor_metrics
+
     # Create gradient table
     print(f"{CYAN}Creating gradient table...{RESET}")
     # DIPY expects bvecs as (N, 3) not (3, N)
@@ -522,34 +574,55 @@ def compute_fa_md(bias_corr_path, mask_path, moving_bval, moving_bvec, fa_path,
     gtab = gradient_table(bvals, bvecs_transposed)
     
     # Fit tensor model
+    extra_outputs = extra_outputs or {}
+    metrics = ["fa", "md"] + [name for name in extra_outputs if name not in ("fa", "md")]
     print(f"{CYAN}Fitting diffusion tensor model...{RESET}")
-    print(f"  Using weighted least squares (WLS) fitting")
-    tensor_model = TensorModel(gtab)
-    tensor_fit = tensor_model.fit(masked_data)
+    print(f"  Using {'weighted' if fit_method == 'wls' else 'ordinary'} least squares "
+          f"({fit_method.upper()}) fitting, {workers} worker(s)")
+    print(f"  Metrics: {', '.join(metrics)}")
+    tensor_maps = fit_tensor_metrics(masked_data, gtab, metrics, fit_method=fit_method, workers=workers)
     
     # Compute FA and MD
     print(f"{CYAN}Computing FA and MD maps...{RESET}")
-    fa = tensor_fit.fa
-    md = tensor_fit.md
+    fa_values = tensor_maps["fa"]
+    md_values = tensor_maps["md"]
+    fa = voxels.scatter(fa_values)
+    md = voxels.scatter(md_values)
     
     # Report statistics
     print(f"\n{GREEN}DTI Metrics Summary:{RESET}")
     print(f"  FA range: [{fa.min():.4f}, {fa.max():.4f}]")
-    print(f"  FA mean (in mask): {fa[mask_data > 0].mean():.4f}")
+    print(f"  FA mean (in mask): {fa_values.mean():.4f}")
     print(f"  MD range: [{md.min():.6f}, {md.max():.6f}] mm²/s")
-    print(f"  MD mean (in mask): {md[mask_data > 0].mean():.6f} mm²/s")
+    print(f"  MD mean (in mask): {md_values.mean():.6f} mm²/s")
     
     # Save FA and MD maps
     print(f"\n{CYAN}Saving output maps...{RESET}")
-    nib.save(nib.Nifti1Image(fa, dwi_affine), fa_path)
-    nib.save(nib.Nifti1Image(md, dwi_affine), md_path)
+    save_image(fa, dwi_affine, fa_path, threads=workers)
+    save_image(md, dwi_affine, md_path, threads=workers)
+    for name, path in extra_outputs.items():
+        print(f"  {name.upper()}: {path}")
+        save_image(voxels.scatter(tensor_maps[name]), dwi_affine, path, threads=workers)
     
     return fa_path, md_path
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the compute_fa_md script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
     
@@ -577,8 +650,22 @@ if __name__ == "__main__":
                         help="Path to b0 b-vector file.")
     parser.add_argument("--b0-index", type=int, default=0,
                         help="Index at which to insert b0 volume (default: 0).")
-    
-    args = parser.parse_args()
+    parser.add_argument("--output-ad", type=str,
+                        help="Output path for the axial diffusivity map.")
+    parser.add_argument("--output-rd", type=str,
+                        help="Output path for the radial diffusivity map.")
+    parser.add_argument("--output-mode", type=str,
+                        help="Output path for the tensor mode map.")
+    parser.add_argument("--output-v1", type=str,
+                        help="Output path for the principal eigenvector map.")
+    parser.add_argument("--output-tensor", type=str,
+                        help="Output path for the 6 tensor elements.")
+    parser.add_argument("--fit-method", choices=["wls", "ols"], default="wls",
+                        help="Tensor fitting method (default: wls).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes for the fit (default: 1).")
+    
+    args = parser.parse_args(argv)
     
     # Validate b0 arguments
     b0_args = [args.b0_volume, args.b0_bval, args.b0_bvec]
@@ -587,11 +674,19 @@ if __name__ == "__main__":
               f"(--b0-volume, --b0-bval, --b0-bvec) must be provided.{RESET}")
         sys.exit(1)
     
+    extra_outputs = {
+        name: path for name, path in (
+            ("ad", args.output_ad), ("rd", args.output_rd), ("mode", args.output_mode),
+            ("v1", args.output_v1), ("tensor", args.output_tensor),
+        ) if path
+    }
+    
     try:
         fa_path, md_path = compute_fa_md(
             args.input, args.mask, args.bval, args.bvec, 
             args.output_fa, args.output_md, 
-            args.b0_volume, args.b0_bval, args.b0_bvec, args.b0_index
+            args.b0_volume, args.b0_bval, args.b0_bvec, args.b0_index,
+            args.fit_method, args.workers, extra_outputs
         )
         
         print(f"\n{GREEN}{BOLD}DTI metrics computation complete!{RESET}")
@@ -613,4 +708,8 @@ if __name__ == "__main__":
         print(f"\n{RED}{BOLD}✗ Error during DTI computation:{RESET}")
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow compute_fa_md --help' for usage information.{RESET}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
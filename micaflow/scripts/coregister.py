@@ -150,8 +150,12 @@ import argparse
 import sys
 import os
 from colorama import init, Fore, Style
-import ants
 import shutil
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import probe_image, save_ants_image, save_labels
+
+ants = lazy_import("ants")
 
 init()
 
@@ -336,7 +340,8 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
         Higher values speed up processing on multi-core systems.
     output_segmentation : str, optional
         Path to save the registered segmentation image (.nii.gz).
-        Only used when segmentations are provided or generated.
+        Only used when segmentations are provided or generated. It is
+        stored with an integer label type (see util_nifti_io.save_labels).
     linear_only : bool, optional
         If True, only perform linear registration (rigid + affine) without 
         nonlinear SyN step. Faster but less accurate. Default: False.
@@ -411,8 +416,10 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
         print(f"{CYAN}Linear-only registration selected.{RESET}")
         print(f"{CYAN}Performing rigid + affine registration (no SyN)...{RESET}")
         
-        moving = ants.image_read(moving_file)
-        fixed = ants.image_read(fixed_file)
+        with io_timer("read", moving_file):
+            moving = ants.image_read(moving_file)
+        with io_timer("read", fixed_file):
+            fixed = ants.image_read(fixed_file)
         
         print(f"  Fixed image: {fixed_file} (shape: {fixed.shape})")
         print(f"  Moving image: {moving_file} (shape: {moving.shape})")
@@ -427,7 +434,8 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
         )
         
         registered_image = registration['warpedmovout']
-        ants.image_write(registered_image, output)
+        with io_timer("write", output):
+            save_ants_image(registered_image, output, threads)
         print(f"{GREEN}Registered image saved: {output}{RESET}")
         
         if affine_file:
@@ -437,15 +445,18 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
         # Transform segmentation if provided
         if moving_segmentation and fixed_segmentation and output_segmentation:
             print(f"{CYAN}Transforming segmentation...{RESET}")
-            moving_seg = ants.image_read(moving_segmentation)
-            fixed_seg = ants.image_read(fixed_segmentation)
+            with io_timer("read", moving_segmentation):
+                moving_seg = ants.image_read(moving_segmentation)
+            with io_timer("read", fixed_segmentation):
+                fixed_seg = ants.image_read(fixed_segmentation)
             transformed = ants.apply_transforms(
                 fixed=fixed_seg,
                 moving=moving_seg,
                 transformlist=registration['fwdtransforms'],
                 interpolator='nearestNeighbor'
             )
-            ants.image_write(transformed, output_segmentation)
+            with io_timer("write", output_segmentation):
+                save_ants_image(transformed, output_segmentation, threads, kind="labels")
             print(f"{GREEN}Registered segmentation saved: {output_segmentation}{RESET}")
         
         # Cleanup temporary files
@@ -479,6 +490,9 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
             inverse_secondary_warp_file=secondary_rev_warp_file,
             disable_robust=disable_robust
         )
+        # lamareg's own writer decides the type; only float maps are converted
+        if output_segmentation and probe_image(output_segmentation).dtype.kind == "f":
+            save_labels(output_segmentation, threads)
         print(f"{GREEN}Registration complete!{RESET}")
         
     else:
@@ -513,14 +527,29 @@ def coregister(fixed_file, moving_file, output, fixed_segmentation=None,
             inverse_secondary_warp_file=secondary_rev_warp_file,
             disable_robust=disable_robust
         )
+        if output_segmentation and probe_image(output_segmentation).dtype.kind == "f":
+            save_labels(output_segmentation, threads)
         print(f"{GREEN}Registration complete!{RESET}")
         
     return output
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the coregister script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
 
@@ -556,7 +585,7 @@ if __name__ == "__main__":
                         help="If provided, will save a secondary reverse warp file. More accurate but can be difficult to apply. If not provided, warpfields will be composed.")
     parser.add_argument("--disable-robust", action='store_true',
                         help="If set, disables robust registration mode in LAMAReg.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     try:
         # Call the coregister function with parsed arguments
@@ -591,3 +620,7 @@ if __name__ == "__main__":
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow coregister --help' for usage information.{RESET}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
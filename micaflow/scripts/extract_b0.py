@@ -143,6 +143,8 @@ Technical Notes:
 - Manual index specification overrides b-value threshold
 - Negative indices supported (e.g., -1 for last volume)
 - Preserves NIfTI header and spatial information
+- Volumes are copied as stored (same data type and scl_slope/scl_inter),
+  one volume at a time: peak memory is about one volume, not the 4D series
 
 File Format Notes:
 -----------------
@@ -168,7 +170,6 @@ See Also:
 
 """
 
-import ants
 import nibabel as nib
 import numpy as np
 import argparse
@@ -176,6 +177,7 @@ import sys
 import shutil
 import os
 from colorama import init, Fore, Style
+from micaflow.scripts.util_nifti_io import save_volumes
 
 init()
 
@@ -434,8 +436,8 @@ def extract_b0(dwi_path, bvals_path=None, bvecs_path=None, output_path=None,
     print(f"  File: {dwi_path}")
     try:
         img_nib = nib.load(dwi_path)
-        img_data = img_nib.get_fdata()
-        img_shape = img_data.shape
+        # Only the header is read here; volumes are loaded when extracted
+        img_shape = img_nib.shape
         img_affine = img_nib.affine
         print(f"  Shape: {img_shape}")
     except Exception as e:
@@ -650,18 +652,12 @@ def extract_b0(dwi_path, bvals_path=None, bvecs_path=None, output_path=None,
     # Extract the b0 volume
     print(f"\n{CYAN}Extracting b0 volume at index {direction_index}...{RESET}")
     
-    # Create a dynamic indexing tuple to select along the specified dimension
-    idx = tuple(slice(None) if i != direction_dimension else direction_index 
-               for i in range(len(img_data.shape)))
+    b0_shape = tuple(s for i, s in enumerate(img_shape) if i != direction_dimension % len(img_shape))
+    print(f"  B0 volume shape: {b0_shape}")
     
-    # Extract the b0 volume along the specified dimension
-    b0_data = img_data[idx]
-    print(f"  B0 volume shape: {b0_data.shape}")
-    
-    # Save b0 volume if output path specified
+    # Save b0 volume if output path specified; only this volume is read
     if output_path:
-        b0_nib = nib.Nifti1Image(b0_data, img_affine, img_nib.header)
-        nib.save(b0_nib, output_path)
+        save_volumes(img_nib, direction_index, output_path, axis=direction_dimension)
         print(f"{GREEN}Saved b0 volume to: {output_path}{RESET}")
     
     # Extract and save non-b0 volumes if requested
@@ -674,13 +670,11 @@ def extract_b0(dwi_path, bvals_path=None, bvecs_path=None, output_path=None,
         if not non_b0_indices:
             print(f"{YELLOW}Warning: No non-b0 volumes to extract (single volume input?){RESET}")
         else:
-            # Extract non-b0 volumes
-            non_b0_data = img_data[..., non_b0_indices]
-            print(f"  Non-b0 shape: {non_b0_data.shape}")
+            print(f"  Non-b0 shape: {img_shape[:3] + (len(non_b0_indices),)}")
             
-            # Save non-b0 volumes
-            non_b0_nib = nib.Nifti1Image(non_b0_data, img_affine, img_nib.header)
-            nib.save(non_b0_nib, output_dwi)
+            # Stream the non-b0 volumes into the output one at a time,
+            # keeping the stored data type and intensity scaling
+            save_volumes(img_nib, non_b0_indices, output_dwi, axis=-1)
             print(f"{GREEN}Saved non-b0 volumes to: {output_dwi}{RESET}")
     
     # Save b0-only bval if requested
@@ -742,9 +736,22 @@ def extract_b0(dwi_path, bvals_path=None, bvecs_path=None, output_path=None,
     print(f"\n{GREEN}{BOLD}B0 extraction completed successfully!{RESET}")
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the extract_b0 script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
     
@@ -768,7 +775,7 @@ if __name__ == "__main__":
     parser.add_argument("--b0-bval", help="Path for b0-only bval file")
     parser.add_argument("--b0-bvec", help="Path for b0-only bvec file")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     try:
         # Ensure either bvals or index is provided when needed
@@ -824,3 +831,7 @@ if __name__ == "__main__":
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow extract_b0 --help' for usage information.{RESET}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -127,6 +127,7 @@ Technical Notes:
 - B-vectors automatically normalized after rotation
 - Preserves NIfTI header and spatial information
 - Winsorization applied to reduce outlier effects
+- .nii.gz output is compressed with --threads threads
 
 Registration Parameters:
 -----------------------
@@ -168,6 +169,8 @@ See Also:
 import argparse
 import sys
 import os
+import shutil
+import tempfile
 
 # Set threading environment variables BEFORE importing ants or other heavy libraries
 # This ensures they are picked up correctly during initialization
@@ -185,11 +188,17 @@ if "--threads" in sys.argv:
     except ValueError:
         pass
 
-import ants
 import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from tqdm import tqdm
 from colorama import init, Fore, Style
 import scipy
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import probe_image, save_ants_image
+
+ants = lazy_import("ants")
 
 init()
 
@@ -232,6 +241,10 @@ def print_help_message():
                          {MAGENTA}If not provided, first volume is used{RESET}
       {YELLOW}--direction-dimension{RESET}: Dimension of volume axis (default: 3)
       {YELLOW}--threads{RESET}        : Number of threads for ANTs registration (default: 1)
+      {YELLOW}--workers{RESET}        : Number of volumes registered at once in worker processes (default: 1)
+      {YELLOW}--itk-threads{RESET}    : ITK threads per worker (default: threads / workers)
+      {YELLOW}--temp-dir{RESET}       : Directory for registration scratch files (default: $TMPDIR)
+      {YELLOW}--output-transforms{RESET}: Archive of per-volume affines for QC (.npy or .h5)
     
     {CYAN}{BOLD}──────────────────── EXAMPLE USAGE ───────────────────────{RESET}
     
@@ -259,6 +272,14 @@ def print_help_message():
       {YELLOW}--direction-dimension{RESET} 3 \\
       {YELLOW}--threads{RESET} 8
     
+    {BLUE}# Register 4 volumes at once with 2 ITK threads each{RESET}
+    micaflow motion_correction \\
+      {YELLOW}--denoised{RESET} denoised_dwi.nii.gz \\
+      {YELLOW}--input-bvecs{RESET} dwi.bvec \\
+      {YELLOW}--output-bvecs{RESET} corrected.bvec \\
+      {YELLOW}--output{RESET} motion_corrected_dwi.nii.gz \\
+      {YELLOW}--threads{RESET} 8 {YELLOW}--workers{RESET} 4
+    
     {CYAN}{BOLD}───────────── WHY MOTION CORRECTION? ────────────────────{RESET}
     
     {GREEN}Motion Artifacts:{RESET}
@@ -319,7 +340,8 @@ def print_help_message():
     
     {CYAN}{BOLD}───────────────── COMMON ISSUES ─────────────────────────{RESET}
     {YELLOW}Issue:{RESET} Registration takes very long
-    {GREEN}Solution:{RESET} Normal processing is 30-90 min; reduce volumes if needed
+    {GREEN}Solution:{RESET} Use --workers to register several volumes at once; a few
+              ITK threads per worker usually scales better than all threads in one
     
     {YELLOW}Issue:{RESET} Poor alignment after correction
     {GREEN}Solution:{RESET} Use external B0 reference, check for severe motion
@@ -334,7 +356,8 @@ def print_help_message():
 
 
 def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bvec_path, output, 
-                          b0_path=None, direction_dimension=3, threads=1, tmp_dir='tmp'):
+                          b0_path=None, direction_dimension=3, threads=1, tmp_dir=None,
+                          workers=1, itk_threads=None, output_transforms=None):
     """
     Perform motion and eddy current correction on diffusion-weighted images (DWI).
     
@@ -365,6 +388,22 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     threads : int, optional
         Number of threads to use for ANTs registration. Default: 1.
         Increasing this can speed up processing on multi-core systems.
+    tmp_dir : str, optional
+        Directory in which each registration gets a private scratch
+        directory for the files written by ANTs. Default: the system
+        temporary directory (honours TMPDIR), which keeps this metadata
+        traffic off network file systems.
+    workers : int, optional
+        Number of volumes registered at once, each in its own worker
+        process. Default: 1 (register volumes one after another).
+    itk_threads : int, optional
+        ITK threads used by each worker. Default: threads // workers.
+    output_transforms : str, optional
+        Path of an archive with the affine of every volume, as a
+        (volumes, 4, 4) array: ``.npy``, or ``.h5``/``.hdf5`` (requires
+        h5py). Matrices map reference-space points to the original volume
+        in ITK (LPS) physical coordinates; volumes without a linear
+        transform are NaN.
         
     Returns
     -------
@@ -382,8 +421,12 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     -----
     - Uses ANTs SyN with rigid + affine + deformable registration
     - B-vectors are rotated using the rotation component of affine transforms
-    - Rotation matrix extracted from ITK affine transform files (.mat)
+    - Affines are read once from the registration output into arrays; the
+      scratch files of each volume are removed together with their directory
     - Each volume registered independently to minimize cumulative drift
+    - With workers > 1, volumes are registered concurrently in a process
+      pool; registration of a single volume scales poorly beyond a few ITK
+      threads, so several workers with few threads each use cores better
     - Processing time: ~30-90 seconds for typical datasets
     - First volume copied unchanged if used as reference
     - B-vectors normalized to unit length after rotation
@@ -422,14 +465,11 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     if b0_path and not os.path.exists(b0_path):
         raise FileNotFoundError(f"B0 reference file not found: {b0_path}")
     
-    print(f"{CYAN}Loading DWI image...{RESET}")
-    print(f"  File: {dwi_path}")
-    dwi_ants = ants.image_read(dwi_path)
-    dwi_data = dwi_ants.numpy()
-    print(f"  Shape: {dwi_data.shape}")
+    # The b-vectors are checked against the header before the series is read
+    dwi_info = probe_image(dwi_path)
     
     # Load bvecs and ensure they're in the correct format [3, N]
-    print(f"\n{CYAN}Loading b-vectors...{RESET}")
+    print(f"{CYAN}Loading b-vectors...{RESET}")
     print(f"  File: {input_bvec_path}")
     bvecs = np.loadtxt(input_bvec_path)
     if bvecs.shape[0] != 3 and bvecs.shape[1] == 3:
@@ -440,11 +480,18 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     if bvecs.shape[0] != 3:
         raise ValueError(f"B-vectors must have 3 rows (x, y, z), got {bvecs.shape[0]}")
     
-    num_volumes = dwi_data.shape[direction_dimension]
+    num_volumes = dwi_info.shape[direction_dimension]
     if bvecs.shape[1] != num_volumes:
         raise ValueError(f"Number of b-vectors ({bvecs.shape[1]}) doesn't match "
                         f"number of volumes ({num_volumes})")
     
+    print(f"\n{CYAN}Loading DWI image...{RESET}")
+    print(f"  File: {dwi_path}")
+    with io_timer("read", dwi_path):
+        dwi_ants = ants.image_read(dwi_path)
+    dwi_data = dwi_ants.numpy()
+    print(f"  Shape: {dwi_data.shape}")
+    
     # Create a copy for the rotated bvecs
     rotated_bvecs = np.copy(bvecs)
 
@@ -452,7 +499,8 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     print(f"\n{CYAN}Setting up reference image...{RESET}")
     if b0_path:
         print(f"  Using external B0: {b0_path}")
-        b0_ants = ants.image_read(b0_path)
+        with io_timer("read", b0_path):
+            b0_ants = ants.image_read(b0_path)
     else:
         print(f"  Using first volume as reference (internal B0)")
         # Extract the first volume as reference if no external B0 provided
@@ -474,10 +522,16 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     if not os.path.exists(input_bval_path):
         raise FileNotFoundError(f"Could not find associated b-value file: {input_bval_path}")
     
-    # Environment variables are already set at the top of the script, 
-    # but we can reinforce them here just in case
-    os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(threads)
-    os.environ["OMP_NUM_THREADS"] = str(threads)
+    workers = max(1, workers)
+    if itk_threads is None:
+        itk_threads = max(1, threads // workers)
+    if workers > 1:
+        print(f"  Registering {workers} volumes at once with {itk_threads} ITK thread(s) each")
+    else:
+        # Environment variables are already set at the top of the script, 
+        # but we can reinforce them here just in case
+        os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(itk_threads)
+        os.environ["OMP_NUM_THREADS"] = str(itk_threads)
     
     dataset = dmri.from_nii(
         filename=dwi_path,
@@ -508,108 +562,40 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
 
 
     
-    with tqdm(total=dataset_length, unit="vols.") as pbar:
-        # run an original-to-synthetic affine registration
+    geometry = (dwi_ants.origin[:3], dwi_ants.spacing[:3], dwi_ants.direction[:3, :3])
+    if tmp_dir:
+        os.makedirs(tmp_dir, exist_ok=True)
+    affines = np.full((dataset_length, 4, 4), np.nan)
+
+    def volumes():
+        # The model is fit in this process; only the registrations are farmed out
         for i in range(dataset_length):
             pbar.set_description_str(f"Fitting vol. {i}")
-
-            # fit the model
             predicted = model.fit_predict(i)
-
-            # Create ANTs images
-            fixed_ants = ants.from_numpy(
-                predicted,
-                origin=dwi_ants.origin[:3],
-                spacing=dwi_ants.spacing[:3],
-                direction=dwi_ants.direction[:3, :3]
-            )
-            
-            moving_ants = ants.from_numpy(
-                dataset.dataobj[..., i],
-                origin=dwi_ants.origin[:3],
-                spacing=dwi_ants.spacing[:3],
-                direction=dwi_ants.direction[:3, :3]
-            )
-
             pbar.set_description_str(f"Registering vol. <{i}>")
+            yield i, predicted, dataset.dataobj[..., i]
 
-            # Run registration using the parameters from this file
-            if not os.path.exists(os.path.join(tmp_dir, "motioncorrection")):
-                os.makedirs(os.path.join(tmp_dir, "motioncorrection"), exist_ok=True)
-            outprefix = os.path.join(tmp_dir, "motioncorrection", f"ants-{i:05d}_")
-            reg_result = register_level0_level1(
-                fixed=fixed_ants,
-                moving=moving_ants,
-                outprefix=outprefix,
-                verbose=False
-            )
-
-            # Extract affine matrix
-            # Handle multiple transforms from multi-stage registration
-            composite_matrix = np.eye(4)
-            
-            # Filter for .mat files (linear transforms)
-            # ANTsPy returns transforms in order of application [T1, T2, ...]
-            affine_files = [t for t in reg_result['fwdtransforms'] if t.endswith('.mat')]
-            
-            for affine_file in affine_files:
-                mat = scipy.io.loadmat(affine_file)
-                if 'AffineTransform_float_3_3' in mat:
-                    params = mat['AffineTransform_float_3_3'].flatten()
-                    matrix = np.eye(4)
-                    matrix[:3, :3] = params[:9].reshape(3, 3)
-                    matrix[:3, 3] = params[9:]
-                    
-                    # Accumulate: M_total = M_new * M_total
-                    # This correctly composes the transforms (T2(T1(x)) -> M2 * M1)
-                    composite_matrix = np.dot(matrix, composite_matrix)
-                
+    with tqdm(total=dataset_length, unit="vols.") as pbar:
+        # run an original-to-synthetic affine registration
+        for i, warped_data, affine in register_volumes(
+            volumes(), geometry, tmp_dir, workers=workers, itk_threads=itk_threads
+        ):
             # update
-            warped_data = reg_result["warpedmovout"].numpy()
             registered_data[...,i] = warped_data
-            
-            # Extract and apply the rotation to the bvec for this volume
-            if 'fwdtransforms' in reg_result and len(reg_result['fwdtransforms']) > 0:
-                # Find the affine transform file (typically ends with .mat)
-                affine_file = None
-                for transform in reg_result['fwdtransforms']:
-                    if transform.endswith('.mat'):
-                        affine_file = transform
-                        break
+
+            # Apply the rotation to the bvec for this volume
+            if affine is not None and i < bvecs.shape[1]:
+                affines[i] = affine
+                # Rotate the b-vector using the transformation rotation matrix
+                rotated_bvec = np.dot(affine[:3, :3], bvecs[:, i])
                 
-                if affine_file and os.path.exists(affine_file):
-                    # Extract rotation matrix from the affine transformation
-                    rotation_matrix = extract_rotation_matrix_from_itk(affine_file)
+                # Normalize to unit vector (preserve direction, normalize magnitude)
+                norm = np.linalg.norm(rotated_bvec)
+                if norm > 0:
+                    rotated_bvec = rotated_bvec / norm
                     
-                    # Apply rotation to the corresponding bvec
-                    if rotation_matrix is not None and i < bvecs.shape[1]:
-                        # Rotate the b-vector using the transformation rotation matrix
-                        rotated_bvec = np.dot(rotation_matrix, bvecs[:, i])
-                        
-                        # Normalize to unit vector (preserve direction, normalize magnitude)
-                        norm = np.linalg.norm(rotated_bvec)
-                        if norm > 0:
-                            rotated_bvec = rotated_bvec / norm
-                            
-                        rotated_bvecs[:, i] = rotated_bvec
-            
-            # Clean up temporary transform files generated by ANTs
-            if 'fwdtransforms' in reg_result:
-                for transform_file in reg_result['fwdtransforms']:
-                    if os.path.exists(transform_file):
-                        try:
-                            os.remove(transform_file)
-                        except Exception as e:
-                            print(f"{YELLOW}Warning: Could not remove {transform_file}: {e}{RESET}")
-            
-            if 'invtransforms' in reg_result:
-                for transform_file in reg_result['invtransforms']:
-                    if os.path.exists(transform_file):
-                        try:
-                            os.remove(transform_file)
-                        except Exception as e:
-                            print(f"{YELLOW}Warning: Could not remove {transform_file}: {e}{RESET}")
-            
+                rotated_bvecs[:, i] = rotated_bvec
+
             pbar.update()
                 
     # Save the registered data with original geometry
@@ -620,7 +606,8 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
         spacing=dwi_ants.spacing, 
         direction=dwi_ants.direction
     )
-    ants.image_write(registered_ants, output)
+    with io_timer("write", output):
+        save_ants_image(registered_ants, output, threads)
     print(f"{GREEN}Saved to: {output}{RESET}")
     
     # Save the rotated bvecs
@@ -628,6 +615,11 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     np.savetxt(output_bvec_path, rotated_bvecs, fmt='%.6f')
     print(f"{GREEN}Saved to: {output_bvec_path}{RESET}")
 
+    if output_transforms:
+        print(f"\n{CYAN}Saving per-volume affines...{RESET}")
+        save_transform_archive(output_transforms, affines)
+        print(f"{GREEN}Saved to: {output_transforms}{RESET}")
+
     print(f"\n{GREEN}{BOLD}Motion correction completed successfully!{RESET}")
     print(f"  Processed {len(registered_data)} volumes")
     print(f"  Motion-corrected DWI: {output}")
@@ -636,59 +628,206 @@ def run_motion_correction(dwi_path, input_bval_path, input_bvec_path, output_bve
     return output
 
 
-def extract_rotation_matrix_from_itk(affine_file):
+def register_volume(fixed_data, moving_data, geometry, tmp_dir=None):
     """
-    Extract the rotation matrix from an ITK affine transform file.
-    
-    ITK affine transform files store transformation parameters including a 3×3
-    rotation/scaling matrix and a 3×1 translation vector. This function extracts
-    the rotation component needed for b-vector correction.
-    
+    Register one DWI volume to its reference and return the results.
+
+    This is the unit of work of the motion correction loop. It only takes
+    and returns numpy arrays so that it can run in a worker process.
+
+    Parameters
+    ----------
+    fixed_data : numpy.ndarray
+        3D reference volume (model prediction or B0).
+    moving_data : numpy.ndarray
+        3D volume to register.
+    geometry : tuple
+        (origin, spacing, direction) of the 3D volumes.
+    tmp_dir : str, optional
+        Parent of the scratch directory that ANTs writes its transforms to.
+        Default: the system temporary directory.
+
+    Returns
+    -------
+    tuple
+        (warped, affine): the registered volume as a numpy array and the
+        4×4 matrix of the linear forward transform (see read_itk_affine),
+        or None if the registration produced no linear transform.
+    """
+    origin, spacing, direction = geometry
+    fixed_ants = ants.from_numpy(fixed_data, origin=origin, spacing=spacing, direction=direction)
+    moving_ants = ants.from_numpy(moving_data, origin=origin, spacing=spacing, direction=direction)
+
+    # antsRegistration only exchanges transforms through files: keep them in a
+    # private directory, read the result once and drop the directory as a whole
+    scratch_dir = tempfile.mkdtemp(prefix="micaflow-mc-", dir=tmp_dir)
+    try:
+        reg_result = register_level0_level1(
+            fixed=fixed_ants,
+            moving=moving_ants,
+            outprefix=os.path.join(scratch_dir, "ants_"),
+            verbose=False
+        )
+        warped_data = reg_result["warpedmovout"].numpy()
+
+        # ANTs collapses the chained linear stages into one .mat file; should
+        # there be several, compose them in antsApplyTransforms order (the
+        # last listed transform is applied to a point first)
+        affine = None
+        for affine_file in (t for t in reg_result['fwdtransforms'] if t.endswith('.mat')):
+            matrix = read_itk_affine(affine_file)
+            affine = matrix if affine is None else affine @ matrix
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return warped_data, affine
+
+
+def read_itk_affine(affine_file):
+    """
+    Read an ITK affine transform file into a 4×4 matrix.
+
     Parameters
     ----------
     affine_file : str
-        Path to the ITK affine transform file (.mat).
-        Generated by ANTs during registration.
-        
+        Path to the ITK affine transform file (.mat) written by ANTs.
+
     Returns
     -------
     numpy.ndarray
-        3×3 rotation matrix, or identity matrix if extraction fails.
-        
+        4×4 matrix in ITK (LPS) physical coordinates, mapping points of the
+        fixed image to the moving image. The upper-left 3×3 block holds the
+        rotation, scaling and shearing used to rotate the b-vectors.
+
+    Raises
+    ------
+    ValueError
+        If the file holds no 3D affine transform parameters.
+
     Notes
     -----
-    - ITK format stores parameters in row-major order
-    - First 9 elements form the 3×3 transformation matrix
-    - Matrix includes rotation, scaling, and shearing
-    - For DWI, we primarily care about the rotation component
-    - Returns identity matrix on error to avoid breaking pipeline
-    
-    Examples
-    --------
-    >>> rotation = extract_rotation_matrix_from_itk("transform.mat")
-    >>> rotated_bvec = np.dot(rotation, original_bvec)
+    - ANTs stores the parameters as ``AffineTransform_float_3_3`` or
+      ``AffineTransform_double_3_3``, the 3×3 matrix in row-major order
+      followed by the translation
+    - ITK applies ``A (x - c) + c + t`` with the center ``c`` stored as the
+      fixed parameters, so the translation column is ``t + c - A c``
     """
-    try:
-        # Load the transformation file using scipy.io.loadmat
-        mat = scipy.io.loadmat(affine_file)
-        
-        # Get the transformation parameters array (should be 12 elements: 9 matrix + 3 translation)
-        params = mat['AffineTransform_float_3_3'].flatten()
-        
-        # First 9 elements are the transformation matrix in row-major order
-        rotation_matrix = np.array([
-            [params[0], params[1], params[2]],
-            [params[3], params[4], params[5]],
-            [params[6], params[7], params[8]]
-        ])
-        
-        return rotation_matrix
-            
-    except Exception as e:
-        print(f"{YELLOW}Warning: Error extracting rotation matrix from {affine_file}: {e}{RESET}")
-        print(f"{YELLOW}Using identity matrix (no rotation applied).{RESET}")
-        # Return identity matrix as fallback
-        return np.eye(3)
+    mat = scipy.io.loadmat(affine_file)
+    key = next((k for k in ('AffineTransform_float_3_3', 'AffineTransform_double_3_3') if k in mat), None)
+    if key is None:
+        names = ", ".join(k for k in mat if not k.startswith('__'))
+        raise ValueError(f"No 3D affine transform in {affine_file} (found: {names or 'nothing'})")
+    params = mat[key].flatten().astype(np.float64)
+    center = mat['fixed'].flatten().astype(np.float64) if 'fixed' in mat else np.zeros(3)
+
+    matrix = np.eye(4)
+    matrix[:3, :3] = params[:9].reshape(3, 3)
+    matrix[:3, 3] = params[9:12] + center - matrix[:3, :3] @ center
+    return matrix
+
+
+def save_transform_archive(path, affines):
+    """
+    Save the per-volume affines of a run to a single file.
+
+    Parameters
+    ----------
+    path : str
+        Output path ending in .npy, .h5 or .hdf5.
+    affines : numpy.ndarray
+        (volumes, 4, 4) array as built by run_motion_correction.
+
+    Raises
+    ------
+    ValueError
+        If the file extension is not supported.
+    ImportError
+        If an HDF5 archive is requested and h5py is not installed.
+    """
+    if path.endswith(".npy"):
+        np.save(path, affines)
+    elif path.endswith((".h5", ".hdf5")):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("h5py is required to write HDF5 transform archives; "
+                              "install it or use a .npy path")
+        with h5py.File(path, "w") as f:
+            dset = f.create_dataset("affines", data=affines)
+            dset.attrs["convention"] = "ITK LPS physical, reference to original volume"
+    else:
+        raise ValueError(f"Unsupported transform archive format: {path} (use .npy, .h5 or .hdf5)")
+
+
+def _init_registration_worker(itk_threads):
+    """Set the thread count of a worker process before ANTs is imported."""
+    for var in ("ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS", "OMP_NUM_THREADS",
+                "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(itk_threads)
+
+
+def register_volumes(volumes, geometry, tmp_dir=None, workers=1, itk_threads=1):
+    """
+    Register a series of DWI volumes, several at a time if requested.
+
+    Parameters
+    ----------
+    volumes : iterable of tuple
+        (index, fixed_data, moving_data) for each volume. Consumed lazily,
+        so at most about 2 × workers volumes are held in memory at once.
+    geometry : tuple
+        (origin, spacing, direction) of the 3D volumes.
+    tmp_dir : str, optional
+        Parent of the per-volume scratch directories (see register_volume).
+    workers : int, optional
+        Number of worker processes. With 1 (default) volumes are registered
+        in the calling process, one after another.
+    itk_threads : int, optional
+        ITK threads per worker process (default: 1). Ignored with one
+        worker, where the calling process's settings apply.
+
+    Yields
+    ------
+    tuple
+        (index, warped, affine) as returned by register_volume(),
+        in completion order.
+
+    Notes
+    -----
+    - Workers are started with the "spawn" method so that each one
+      initialises ITK with its own thread count
+    """
+    if workers <= 1:
+        for i, fixed_data, moving_data in volumes:
+            yield (i,) + register_volume(fixed_data, moving_data, geometry, tmp_dir)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_registration_worker,
+        initargs=(itk_threads,),
+    ) as executor:
+        pending = {}
+        volumes = iter(volumes)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep every worker busy with one volume queued behind it
+            while not exhausted and len(pending) < 2 * workers:
+                try:
+                    i, fixed_data, moving_data = next(volumes)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(register_volume, fixed_data, moving_data,
+                                         geometry, tmp_dir)
+                pending[future] = i
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                yield (i,) + future.result()
 
 
 def register_level0_level1(fixed, moving, outprefix="reg_", verbose=True):
@@ -841,9 +980,22 @@ def register_level0_level1(fixed, moving, outprefix="reg_", verbose=True):
         "invtransforms": combined_inv,
     }
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the motion_correction script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
     
@@ -892,6 +1044,17 @@ if __name__ == "__main__":
         default=1,
         help="Number of threads to use for ANTs registration (default: 1).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of volumes registered at once in worker processes (default: 1).",
+    )
+    parser.add_argument(
+        "--itk-threads",
+        type=int,
+        help="ITK threads per worker (default: threads divided by workers).",
+    )
     parser.add_argument(
         "--input-bvals",
         type=str,
@@ -901,10 +1064,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--temp-dir",
         type=str,
-        default="tmp",
-        help="Path to the temporary directory for intermediate files (default: tmp).",
+        help="Directory for registration scratch files (default: system temporary directory).",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--output-transforms",
+        type=str,
+        help="Optional archive of the per-volume affines (.npy, or .h5/.hdf5 with h5py).",
+    )
+    args = parser.parse_args(argv)
     
     try:
         corrected_image = run_motion_correction(
@@ -916,7 +1083,10 @@ if __name__ == "__main__":
             args.b0, 
             args.direction_dimension,
             args.threads,
-            tmp_dir=args.temp_dir
+            tmp_dir=args.temp_dir,
+            workers=args.workers,
+            itk_threads=args.itk_threads,
+            output_transforms=args.output_transforms
         )
         sys.exit(0)
         
@@ -935,4 +1105,8 @@ if __name__ == "__main__":
         print(f"\n{RED}{BOLD}Error during motion correction:{RESET}")
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow motion_correction --help' for usage information.{RESET}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
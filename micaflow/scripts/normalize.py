@@ -160,6 +160,7 @@ import sys
 import nibabel as nib
 import numpy as np
 from colorama import init, Fore, Style
+from micaflow.scripts.util_nifti_io import save_image
 
 init()
 
@@ -476,15 +477,13 @@ def normalize_intensity(input_file, output_file, lower_percentile=1.0, upper_per
         print(f"  Mean: {np.mean(normalized_data[mask]):.4f}")
         print(f"  Std: {np.std(normalized_data[mask]):.4f}")
     
-    # Create a new image with the same header
-    normalized_img = nib.Nifti1Image(normalized_data, img.affine, header=img.header)
-    
     # Save the normalized image
     if verbose:
         print(f"\n{CYAN}Saving normalized image...{RESET}")
         print(f"  Output: {output_file}")
     
-    nib.save(normalized_img, output_file)
+    # Same header, and the input's data type, as the input image
+    save_image(normalized_data, img.affine, output_file, header=img.header)
     
     if verbose:
         print(f"\n{GREEN}{BOLD}Intensity normalization completed successfully!{RESET}")
@@ -496,10 +495,22 @@ def normalize_intensity(input_file, output_file, lower_percentile=1.0, upper_per
     return output_file
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the normalize script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if no arguments were provided or help was requested
-    print(len(sys.argv))
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_extended_help()
         sys.exit(0)
     
@@ -542,7 +553,7 @@ if __name__ == "__main__":
         help="Maximum value in output range (default: 100)"
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     try:
         # Validate percentile values
@@ -586,4 +597,8 @@ if __name__ == "__main__":
         print(f"\n{RED}{BOLD}Error during normalization:{RESET}")
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow normalize_intensity --help' for usage information.{RESET}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
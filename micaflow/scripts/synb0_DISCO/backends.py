@@ -0,0 +1,187 @@
+import hashlib
+import os
+import warnings
+
+import numpy as np
+import torch
+
+from .model import UNet3D
+
+BACKENDS = ("eager", "torchscript", "onnxruntime")
+
+# Exported folds are cached per weight file, backend and memory format
+CACHE_EXTENSIONS = {"torchscript": ".ts", "onnxruntime": ".onnx"}
+
+# Spatial size of the example input used for tracing / export; the exported
+# graphs accept any size divisible by 8
+EXAMPLE_SHAPE = (1, 2, 16, 16, 16)
+
+
+# Fold weights kept in memory by preload_weights(); the micaflow daemon fills
+# it once so that the jobs it forks build their models without torch.load
+_WEIGHTS = {}
+
+
+def _weights_key(model_path):
+    # A replaced weight file is not served from the cache
+    stat = os.stat(model_path)
+    return os.path.abspath(model_path), stat.st_mtime_ns, stat.st_size
+
+
+def preload_weights(model_paths):
+    # Load fold weights on the CPU into the in-process cache
+    for model_path in model_paths:
+        _WEIGHTS[_weights_key(model_path)] = torch.load(model_path, map_location="cpu")
+
+
+def load_model(model_path, device):
+    # Load one fold's weights into an evaluation-mode UNet3D
+    model = UNet3D(2, 1).to(device)
+    state = _WEIGHTS.get(_weights_key(model_path))
+    if state is None:
+        state = torch.load(model_path, map_location=device)
+    # Parameters are copied, so the cached tensors are never modified
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+
+def default_cache_dir():
+    # $MICAFLOW_CACHE_DIR, otherwise the user's cache directory
+    path = os.environ.get("MICAFLOW_CACHE_DIR")
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "micaflow")
+
+
+def cache_path(model_path, backend, cache_dir=None, channels_last=False):
+    """
+    Path of the exported copy of a fold.
+
+    The name contains a hash of the weight file, the PyTorch version and the
+    memory format, so changed weights or a PyTorch upgrade trigger a new
+    export instead of reusing a stale one.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(f"{torch.__version__}-{channels_last}".encode())
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir or default_cache_dir(), "synb0",
+                        f"{stem}-{digest.hexdigest()[:16]}{CACHE_EXTENSIONS[backend]}")
+
+
+def _atomic_export(path, write):
+    # Write to a temporary name and rename, so that concurrent jobs never
+    # read a partially written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_torchscript(model_path, path, channels_last=False):
+    # Trace the fold once and freeze it (weights become constants)
+    model = load_model(model_path, "cpu")
+    example = torch.zeros(EXAMPLE_SHAPE)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last_3d)
+        example = example.to(memory_format=torch.channels_last_3d)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    _atomic_export(path, lambda tmp_path: torch.jit.save(traced, tmp_path))
+
+
+def export_onnx(model_path, path):
+    # Export the fold with dynamic spatial axes
+    try:
+        import onnx  # noqa: F401
+    except ImportError:
+        raise ImportError("onnx is required to export models for the onnxruntime backend; "
+                          "install onnx and onnxruntime or use another backend")
+    model = load_model(model_path, "cpu")
+    spatial = {2: "z", 3: "x", 4: "y"}
+    _atomic_export(path, lambda tmp_path: torch.onnx.export(
+        model, (torch.zeros(EXAMPLE_SHAPE),), tmp_path, input_names=["input"],
+        output_names=["output"], dynamic_axes={"input": spatial, "output": spatial},
+        dynamo=False,
+    ))
+
+
+class OnnxRuntimeModel:
+    # Callable wrapper giving an onnxruntime session the module interface
+    def __init__(self, path, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("onnxruntime is required for the onnxruntime backend; "
+                              "install it or use another backend")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, x):
+        output = self.session.run(None, {"input": x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(x.device)
+
+
+def load_backend(model_path, device, backend="eager", cache_dir=None, channels_last=False):
+    """
+    Load one fold for the given inference backend.
+
+    Parameters
+    ----------
+    model_path : str
+        Fold weight file (.pt / .pth).
+    device : torch.device
+        Device to run inference on.
+    backend : {'eager', 'torchscript', 'onnxruntime'}, optional
+        'eager' runs the UNet3D module as is. 'torchscript' and
+        'onnxruntime' export the fold on first use and load the cached
+        export afterwards. Default: 'eager'.
+    cache_dir : str, optional
+        Export cache directory. Default: $MICAFLOW_CACHE_DIR or
+        ~/.cache/micaflow.
+    channels_last : bool, optional
+        Use the channels-last 3D memory format (eager and torchscript).
+
+    Returns
+    -------
+    callable
+        Maps a network input tensor to the network output.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r} (choose from {', '.join(BACKENDS)})")
+    if backend == "onnxruntime" and device.type != "cpu":
+        raise ValueError("The onnxruntime backend only runs on the CPU")
+
+    if backend == "eager":
+        model = load_model(model_path, device)
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last_3d)
+        return model
+
+    if backend == "torchscript":
+        path = cache_path(model_path, backend, cache_dir, channels_last)
+        # torch.jit is deprecated in favour of torch.export, but remains the
+        # simplest serializable form of a frozen CPU model. The tracer warns
+        # about InstanceNorm's input-size checks, which do not affect the graph
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            warnings.simplefilter("ignore", torch.jit.TracerWarning)
+            if not os.path.exists(path):
+                print(f"Exporting {os.path.basename(model_path)} to TorchScript: {path}")
+                export_torchscript(model_path, path, channels_last)
+            return torch.jit.load(path, map_location=device)
+
+    path = cache_path(model_path, backend, cache_dir)
+    if not os.path.exists(path):
+        print(f"Exporting {os.path.basename(model_path)} to ONNX: {path}")
+        export_onnx(model_path, path)
+    return OnnxRuntimeModel(path)
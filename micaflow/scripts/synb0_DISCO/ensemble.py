@@ -0,0 +1,141 @@
+import contextlib
+import copy
+import functools
+import time
+
+import torch
+from torch.func import functional_call, stack_module_state
+
+from .backends import load_backend, load_model  # noqa: F401 (load_model re-exported)
+from .inference import preprocess, postprocess, sliding_window, tile_size_for_budget
+from . import util
+
+
+class EnsembleInference:
+    """
+    Average the predictions of several SynB0-DISCO folds.
+
+    All folds are loaded once and stay resident. The inputs are read,
+    normalized and padded once per prediction, and the fold outputs are
+    accumulated into a running mean on the device instead of being kept
+    as a list of full volumes.
+
+    Parameters
+    ----------
+    model_paths : list of str
+        Fold weight files (.pt / .pth).
+    device : torch.device
+        Device to run inference on.
+    batch_size : int, optional
+        Number of folds evaluated in one batched forward pass (their
+        weights are stacked and the network is vmapped over them). Each
+        extra fold multiplies the activation memory, so the default of 1
+        runs the folds one after the other.
+    tile_size : int or tuple of int, optional
+        Run each forward pass on overlapping tiles of this size, blended
+        with Gaussian weights (see inference.sliding_window). Default: None
+        (whole volume).
+    tile_overlap : float, optional
+        Fraction of overlap between neighbouring tiles. Default: 0.5.
+    memory_budget : float, optional
+        Activation memory budget in MB. Without an explicit tile_size, the
+        largest tile that fits is used when the whole volume does not.
+    backend : {'eager', 'torchscript', 'onnxruntime'}, optional
+        Inference backend (see backends.load_backend). Batching folds
+        requires 'eager'. Default: 'eager'.
+    bf16 : bool, optional
+        Run the network under bfloat16 autocast (eager and torchscript).
+    channels_last : bool, optional
+        Use the channels-last 3D memory format (eager and torchscript).
+    cache_dir : str, optional
+        Directory for exported folds. Default: $MICAFLOW_CACHE_DIR or
+        ~/.cache/micaflow.
+    """
+
+    def __init__(self, model_paths, device, batch_size=1, tile_size=None,
+                 tile_overlap=0.5, memory_budget=None, backend="eager", bf16=False,
+                 channels_last=False, cache_dir=None):
+        self.model_paths = list(model_paths)
+        self.device = device
+        self.batch_size = max(1, int(batch_size))
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.memory_budget = memory_budget
+        self.bf16 = bf16
+        self.channels_last = channels_last
+        if backend != "eager" and self.batch_size > 1:
+            raise ValueError("Batching folds (batch_size > 1) requires the eager backend")
+        if backend == "onnxruntime" and (bf16 or channels_last):
+            raise ValueError("bf16 and channels-last are not supported by the onnxruntime backend")
+        self.models = [
+            load_backend(path, device, backend, cache_dir, channels_last) for path in self.model_paths
+        ]
+        # (fold paths, seconds) for every forward pass of the last predict()
+        self.timings = []
+
+        # One entry per forward pass: (fold indices, stacked params and buffers
+        # for a vmapped pass, or None for a single fold)
+        self.groups = []
+        for start in range(0, len(self.models), self.batch_size):
+            group = self.models[start:start + self.batch_size]
+            indices = list(range(start, start + len(group)))
+            self.groups.append((indices, stack_module_state(group) if len(group) > 1 else None))
+        if any(stacked is not None for _, stacked in self.groups):
+            # Stateless copy of the architecture for functional_call
+            self._base = copy.deepcopy(self.models[0]).to("meta")
+
+    def _functional_forward(self, params, buffers, x):
+        return functional_call(self._base, (params, buffers), (x,))
+
+    def _forward(self, indices, stacked, x):
+        # Outputs of one group of folds, stacked along a new leading axis
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last_3d)
+        autocast = (torch.autocast(self.device.type, dtype=torch.bfloat16) if self.bf16
+                    else contextlib.nullcontext())
+        with autocast:
+            if stacked is None:
+                output = self.models[indices[0]](x).unsqueeze(0)
+            else:
+                output = torch.vmap(self._functional_forward, in_dims=(0, 0, None))(*stacked, x)
+        return output.float().contiguous()
+
+    def predict(self, T1_path, b0_d_path):
+        """
+        Run the ensemble on a T1w / distorted b0 pair.
+
+        Returns
+        -------
+        numpy.ndarray
+            Mean synthetic b0, shape (x, y, z, 1), float32.
+        """
+        img_data, params = preprocess(T1_path, b0_d_path)
+        img_data = torch.from_numpy(img_data).to(self.device)
+
+        self.timings = []
+        mean = None
+        count = 0
+        with torch.no_grad():
+            for indices, stacked in self.groups:
+                tile_size = self.tile_size
+                if tile_size is None and self.memory_budget is not None:
+                    tile_size = tile_size_for_budget(self.memory_budget, img_data.shape[2:], len(indices))
+                forward = functools.partial(self._forward, indices, stacked)
+
+                start = time.perf_counter()
+                if tile_size is None:
+                    outputs = forward(img_data)
+                else:
+                    outputs = sliding_window(forward, img_data, tile_size, self.tile_overlap)
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                self.timings.append(([self.model_paths[i] for i in indices], time.perf_counter() - start))
+
+                for output in outputs:
+                    count += 1
+                    if mean is None:
+                        mean = output.clone()
+                    else:
+                        mean += (output - mean) / count
+
+        return util.torch2nii(postprocess(mean, params).cpu().numpy())
@@ -2,90 +2,211 @@ import numpy as np
 import torch
 import nibabel as nib
 import argparse
+import math
 from .model import UNet3D
 from . import util
+from ..util_nifti_io import save_image
 
-def inference(T1_path, b0_d_path, model, device):
+# Approximate peak activation memory of one UNet3D forward pass per input
+# voxel (float32, CPU), used to pick a tile size for a memory budget
+ACTIVATION_BYTES_PER_VOXEL = 2500
+
+def preprocess(T1_path, b0_d_path):
+    # Load, normalize and pad the inputs once; returns the network input
+    # and what postprocess() needs to undo the normalization and padding
+    # Get image
+    img_T1 = np.expand_dims(util.get_nii_img(T1_path), axis=3)
+    img_b0_d = np.expand_dims(util.get_nii_img(b0_d_path), axis=3)
+    print('T1 shape: ' + str(img_T1.shape))
+    print('b0_d shape: ' + str(img_b0_d.shape))
+
+    # Convert to torch img format
+    img_T1 = util.nii2torch(img_T1)
+    img_b0_d = util.nii2torch(img_b0_d)
+
+    # Normalize data
+    img_T1 = util.normalize_img(img_T1, 150, 0, 1, -1)
+    max_img_b0_d = np.percentile(img_b0_d, 99)
+    min_img_b0_d = 0
+    img_b0_d = util.normalize_img(img_b0_d, max_img_b0_d, min_img_b0_d, 1, -1)
+
+    # Calculate padding needed to make dimensions divisible by 8
+    original_shape = img_T1.shape[2:5]
+    pad_dims = []
+    for i in range(3):  # For the 3 spatial dimensions
+        dim_size = original_shape[i]
+        remainder = dim_size % 8
+        if remainder != 0:
+            padding_needed = 8 - remainder
+            # Distribute padding as evenly as possible
+            pad_before = padding_needed // 2
+            pad_after = padding_needed - pad_before
+            pad_dims.append((pad_before, pad_after))
+        else:
+            # No padding needed for this dimension
+            pad_dims.append((0, 0))
+
+    # Apply padding if needed
+    if any(sum(p) > 0 for p in pad_dims):
+        print(f"Padding dimensions to be divisible by 8: {pad_dims}")
+        # FIX: Properly structure padding as a tuple of tuples: ((before,after), (before,after), ...)
+        padding = ((0, 0), (0, 0),  # No padding for batch and channel dims
+                 (pad_dims[0][0], pad_dims[0][1]),  # Depth padding
+                 (pad_dims[1][0], pad_dims[1][1]),  # Height padding
+                 (pad_dims[2][0], pad_dims[2][1]))  # Width padding
+
+        # Apply same padding to both images
+        img_T1 = np.pad(img_T1, padding, 'constant')
+        img_b0_d = np.pad(img_b0_d, padding, 'constant')
+        print(f"Padded shape: {img_T1.shape[2:5]}")
+
+    # Set "data"
+    img_data = np.concatenate((img_b0_d, img_T1), axis=1).astype(np.float32)
+
+    return img_data, (max_img_b0_d, min_img_b0_d, pad_dims)
+
+
+def postprocess(img_model, params):
+    # Undo the normalization and padding applied by preprocess()
+    max_img_b0_d, min_img_b0_d, pad_dims = params
+
+    # Unnormalize model
+    img_model = util.unnormalize_img(img_model, max_img_b0_d, min_img_b0_d, 1, -1)
+
+    # Remove padding if added
+    if any(sum(p) > 0 for p in pad_dims):
+        # Remove the padding we added earlier
+        img_model = img_model[:, :, 
+                   pad_dims[0][0]:(None if pad_dims[0][1]==0 else -pad_dims[0][1]),
+                   pad_dims[1][0]:(None if pad_dims[1][1]==0 else -pad_dims[1][1]),
+                   pad_dims[2][0]:(None if pad_dims[2][1]==0 else -pad_dims[2][1])]
+        print(f"Removed padding. Final shape: {img_model.shape[2:5]}")
+    else:
+        # If dimensions were already divisible by 8, use the old hard-coded padding removal
+        img_model = img_model[:, :, 2:-1, 2:-1, 3:-2]
+        print("Using default padding removal")
+
+    return img_model
+
+
+def tile_size_for_budget(memory_budget, shape, n_models=1):
+    # Largest tile (a multiple of 8 per axis, at most the padded volume)
+    # whose activations for n_models networks fit in memory_budget MB;
+    # None if the whole volume fits
+    max_voxels = memory_budget * 1024 ** 2 / (ACTIVATION_BYTES_PER_VOXEL * n_models)
+    if math.prod(shape) <= max_voxels:
+        return None
+    edge = max(8, int(max_voxels ** (1 / 3)) // 8 * 8)
+    tile = [min(edge, s) for s in shape]
+    # Give the room left by short axes to the others
+    for i in range(3):
+        while tile[i] + 8 <= shape[i] and math.prod(tile) / tile[i] * (tile[i] + 8) <= max_voxels:
+            tile[i] += 8
+    return tuple(tile)
+
+
+def gaussian_weights(tile_size, sigma_scale=0.125):
+    # Gaussian importance map that down-weights tile borders when blending
+    grids = []
+    for size in tile_size:
+        coords = torch.arange(size, dtype=torch.float32) - (size - 1) / 2
+        grids.append(torch.exp(-0.5 * (coords / (sigma_scale * size)) ** 2))
+    weights = grids[0][:, None, None] * grids[1][None, :, None] * grids[2][None, None, :]
+    weights /= weights.max()
+    # Keep the borders slightly positive so every voxel has a defined average
+    return weights.clamp_(min=1e-3)
+
+
+def tile_starts(size, tile, overlap):
+    # Start offsets of overlapping tiles covering [0, size)
+    if tile >= size:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    count = math.ceil((size - tile) / step) + 1
+    return sorted({round(i * (size - tile) / (count - 1)) for i in range(count)})
+
+
+def sliding_window(forward, img_data, tile_size, overlap=0.5, sigma_scale=0.125):
+    """
+    Evaluate forward on overlapping tiles and blend them with Gaussian weights.
+
+    Parameters
+    ----------
+    forward : callable
+        Maps an input tile (1, C, z, x, y) to an output with the same
+        spatial shape in its last three axes.
+    img_data : torch.Tensor
+        Network input (1, C, z, x, y), padded to a multiple of 8.
+    tile_size : int or tuple of int
+        Tile edge length(s); rounded down to a multiple of 8 (the network
+        pools three times) and clipped to the volume.
+    overlap : float, optional
+        Fraction of the tile shared by neighbouring tiles. Default: 0.5.
+    sigma_scale : float, optional
+        Gaussian sigma as a fraction of the tile size. Default: 0.125.
+
+    Returns
+    -------
+    torch.Tensor
+        Blended output covering the whole volume.
+
+    Notes
+    -----
+    UNet3D uses instance normalization, whose statistics are computed per
+    tile, so the result is close to but not identical with a full-volume
+    pass. Larger tiles and overlaps reduce the difference.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Tile overlap must be in [0, 1), got {overlap}")
+    shape = img_data.shape[2:]
+    if isinstance(tile_size, int):
+        tile_size = (tile_size,) * 3
+    tile_size = tuple(min(max(8, t // 8 * 8), s) for t, s in zip(tile_size, shape))
+
+    weights = gaussian_weights(tile_size, sigma_scale).to(img_data.device)
+    output = None
+    weight_sum = torch.zeros(shape, dtype=torch.float32, device=img_data.device)
+    starts = [tile_starts(s, t, overlap) for s, t in zip(shape, tile_size)]
+    print(f"Sliding-window inference: tile {tile_size}, "
+          f"{len(starts[0]) * len(starts[1]) * len(starts[2])} tiles")
+    for z in starts[0]:
+        for x in starts[1]:
+            for y in starts[2]:
+                window = (slice(z, z + tile_size[0]), slice(x, x + tile_size[1]), slice(y, y + tile_size[2]))
+                tile_out = forward(img_data[(Ellipsis,) + window])
+                if output is None:
+                    output = torch.zeros(tile_out.shape[:-3] + shape, dtype=torch.float32,
+                                         device=img_data.device)
+                output[(Ellipsis,) + window] += tile_out * weights
+                weight_sum[window] += weights
+    return output / weight_sum
+
+
+def inference(T1_path, b0_d_path, model, device, tile_size=None, overlap=0.5, memory_budget=None):
     # Eval mode
     model.eval()
     
     # Disable gradient computation for inference
     with torch.no_grad():
-        # Get image
-        img_T1 = np.expand_dims(util.get_nii_img(T1_path), axis=3)
-        img_b0_d = np.expand_dims(util.get_nii_img(b0_d_path), axis=3)
-        print('T1 shape: ' + str(img_T1.shape))
-        print('b0_d shape: ' + str(img_b0_d.shape))
-
-        # Convert to torch img format
-        img_T1 = util.nii2torch(img_T1)
-        img_b0_d = util.nii2torch(img_b0_d)
-
-        # Normalize data
-        img_T1 = util.normalize_img(img_T1, 150, 0, 1, -1)
-        max_img_b0_d = np.percentile(img_b0_d, 99)
-        min_img_b0_d = 0
-        img_b0_d = util.normalize_img(img_b0_d, max_img_b0_d, min_img_b0_d, 1, -1)
-
-        # Calculate padding needed to make dimensions divisible by 8
-        original_shape = img_T1.shape[2:5]
-        pad_dims = []
-        for i in range(3):  # For the 3 spatial dimensions
-            dim_size = original_shape[i]
-            remainder = dim_size % 8
-            if remainder != 0:
-                padding_needed = 8 - remainder
-                # Distribute padding as evenly as possible
-                pad_before = padding_needed // 2
-                pad_after = padding_needed - pad_before
-                pad_dims.append((pad_before, pad_after))
-            else:
-                # No padding needed for this dimension
-                pad_dims.append((0, 0))
-        
-        # Apply padding if needed
-        if any(sum(p) > 0 for p in pad_dims):
-            print(f"Padding dimensions to be divisible by 8: {pad_dims}")
-            # FIX: Properly structure padding as a tuple of tuples: ((before,after), (before,after), ...)
-            padding = ((0, 0), (0, 0),  # No padding for batch and channel dims
-                     (pad_dims[0][0], pad_dims[0][1]),  # Depth padding
-                     (pad_dims[1][0], pad_dims[1][1]),  # Height padding
-                     (pad_dims[2][0], pad_dims[2][1]))  # Width padding
-            
-            # Apply same padding to both images
-            img_T1 = np.pad(img_T1, padding, 'constant')
-            img_b0_d = np.pad(img_b0_d, padding, 'constant')
-            print(f"Padded shape: {img_T1.shape[2:5]}")
-
-        # Set "data"
-        img_data = np.concatenate((img_b0_d, img_T1), axis=1)
+        img_data, params = preprocess(T1_path, b0_d_path)
 
         # Send data to device
         img_data = torch.from_numpy(img_data).float().to(device)
         print("Passing to model...")
         
-        # Pass through model
-        img_model = model(img_data)
+        # Pass through model, tile by tile if requested or needed to stay
+        # within the memory budget
+        if tile_size is None and memory_budget is not None:
+            tile_size = tile_size_for_budget(memory_budget, img_data.shape[2:])
+        if tile_size is None:
+            img_model = model(img_data)
+        else:
+            img_model = sliding_window(model, img_data, tile_size, overlap)
         
         print("Model complete")
-        # Unnormalize model
-        img_model = util.unnormalize_img(img_model, max_img_b0_d, min_img_b0_d, 1, -1)
-
-        # Remove padding if added
-        if any(sum(p) > 0 for p in pad_dims):
-            # Remove the padding we added earlier
-            img_model = img_model[:, :, 
-                       pad_dims[0][0]:(None if pad_dims[0][1]==0 else -pad_dims[0][1]),
-                       pad_dims[1][0]:(None if pad_dims[1][1]==0 else -pad_dims[1][1]),
-                       pad_dims[2][0]:(None if pad_dims[2][1]==0 else -pad_dims[2][1])]
-            print(f"Removed padding. Final shape: {img_model.shape[2:5]}")
-        else:
-            # If dimensions were already divisible by 8, use the old hard-coded padding removal
-            img_model = img_model[:, :, 2:-1, 2:-1, 3:-2]
-            print("Using default padding removal")
 
         # Return model
-        return img_model
+        return postprocess(img_model, params)
 
 
 if __name__ == '__main__':
@@ -98,6 +219,12 @@ if __name__ == '__main__':
                       help='Number of CPU threads to use (default: system setting)')
     parser.add_argument('--cpu', action='store_true',
                       help='Force CPU usage even if GPU is available')
+    parser.add_argument('--tile-size', type=int, default=None,
+                      help='Run the network on overlapping tiles of this size (default: whole volume)')
+    parser.add_argument('--tile-overlap', type=float, default=0.5,
+                      help='Fraction of overlap between tiles (default: 0.5)')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                      help='Activation memory budget in MB; picks a tile size if the volume does not fit')
     args = parser.parse_args()
     
     # Set thread count if specified
@@ -123,9 +250,10 @@ if __name__ == '__main__':
     model.load_state_dict(torch.load(args.model_path))
 
     # Inference
-    img_model = inference(args.t1_path, args.b0_path, model, device)
+    img_model = inference(args.t1_path, args.b0_path, model, device,
+                          args.tile_size, args.tile_overlap, args.memory_budget)
 
     # Save
     nii_template = nib.load(args.b0_path)
-    nii = nib.Nifti1Image(util.torch2nii(img_model.detach().cpu()), nii_template.affine, nii_template.header)
-    nib.save(nii, args.output_path)
+    save_image(util.torch2nii(img_model.detach().cpu()), nii_template.affine, args.output_path,
+               header=nii_template.header)
@@ -191,12 +191,26 @@ Technical Notes:
 ---------------
 - Model architecture: 3D U-Net with 2 input channels, 1 output channel
 - Ensemble size: 5 models (or fewer if models unavailable)
-- Inference: Average of all model predictions
+- Inference: Average of all model predictions, accumulated as a running
+  mean; inputs are loaded and normalized once for all models, which stay
+  resident (--ensemble-batch N evaluates N models in one vmapped pass)
+- Tiled inference: --tile-size / --memory-budget run the network on
+  overlapping tiles blended with Gaussian weights, bounding activation
+  memory; results differ slightly from a whole-volume pass because the
+  network's instance normalization is computed per tile
+- Backends: --backend torchscript / onnxruntime export each model once and
+  cache the export ($MICAFLOW_CACHE_DIR, default ~/.cache/micaflow);
+  --bf16 runs the network under bfloat16 autocast (about 2x faster on
+  CPUs with AVX-512 BF16/AMX, at reduced precision) and --channels-last
+  uses the channels-last 3D memory format
 - Registration: ANTs affine for initial alignment
 - Distortion field: ANTs SyN with restricted transformation
 - Phase-encoding restriction: Only allows deformation along PE axis
 - Multi-threading: Supports both PyTorch and ANTs threading
 - Temporary files: Automatically cleaned up after completion
+- --compose-transforms: the DWI → T1 → DWI chain (inverse affine, PE warp,
+  B0→T1 warps and affine) is composed once into a single displacement field
+  on the DWI grid, so each volume is interpolated once instead of twice
 
 Registration Parameters:
 -----------------------
@@ -256,22 +270,21 @@ References:
 import argparse
 import sys
 import os
-import torch
 import nibabel as nib
 import numpy as np
-import ants
 import shutil
 import subprocess
 from colorama import Fore, Style, init
 import glob
 import tempfile
-from .synb0_DISCO.inference import inference
-from .synb0_DISCO.model import UNet3D
-from .synb0_DISCO.util import torch2nii
-from lamareg import lamareg
-from lamareg.scripts import apply_warp
 from micaflow.scripts.apply_warp import apply_warp
 from micaflow.scripts.coregister import coregister
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import iter_volumes, save_ants_image, save_image
+
+torch = lazy_import("torch")
+ants = lazy_import("ants")
 
 init()
 
@@ -323,6 +336,19 @@ def print_help_message():
       {YELLOW}--corrected-b0{RESET}             : Path to save corrected B0 (for QC)
       {YELLOW}--direction-dimension{RESET}          : Volume dimension in 4D (default: 3)
       {YELLOW}--b0-to-T1-warp-secondary{RESET}  : Secondary warp field (optional)
+      {YELLOW}--ensemble-batch{RESET}           : Models per batched forward pass (default: 1;
+                                   higher values need proportionally more memory)
+      {YELLOW}--tile-size{RESET}                : Run the network on overlapping tiles of this
+                                   edge length in voxels (default: whole volume)
+      {YELLOW}--tile-overlap{RESET}             : Fraction of overlap between tiles (default: 0.5)
+      {YELLOW}--memory-budget{RESET}            : Inference memory budget in MB; picks the largest
+                                   tile that fits when the volume does not
+      {YELLOW}--backend{RESET}                  : Inference backend: eager, torchscript or
+                                   onnxruntime (default: eager)
+      {YELLOW}--bf16{RESET}                     : Run the network under bfloat16 autocast
+      {YELLOW}--channels-last{RESET}            : Use the channels-last 3D memory format
+      {YELLOW}--compose-transforms{RESET}       : Compose all transforms into one displacement
+                                   field and resample each DWI volume once
     
     {CYAN}{BOLD}──────────────────── EXAMPLE USAGE ───────────────────────{RESET}
     
@@ -412,6 +438,8 @@ def print_help_message():
     {MAGENTA}•{RESET} Requires high-quality T1w image
     {MAGENTA}•{RESET} Distortion field restricted to PE direction only
     {MAGENTA}•{RESET} Supports 4D DWI with multiple volumes
+    {MAGENTA}•{RESET} {YELLOW}--compose-transforms{RESET}: single resampling per volume
+      (about half the apply time, no double interpolation blur)
     {MAGENTA}•{RESET} Automatic temporary file cleanup
     {MAGENTA}•{RESET} Multi-threading supported for CPU operations
     
@@ -512,8 +540,43 @@ def get_restrict_transformation(phase_encoding):
         return (0, 1, 0)  # Default to y-axis (AP/PA)
 
 
+def compose_transform_chain(reference, transformlist, whichtoinvert, output_prefix):
+    """
+    Compose a chain of ANTs transforms into a single displacement field.
+
+    Parameters
+    ----------
+    reference : ants.ANTsImage
+        Image defining the grid of the composed field (the DWI grid).
+    transformlist : list of str
+        Transform files, in the order expected by ants.apply_transforms.
+    whichtoinvert : list of bool
+        Which transforms (affines only) to invert.
+    output_prefix : str
+        Prefix of the composed field file.
+
+    Returns
+    -------
+    str
+        Path of the composed displacement field.
 
-def main():
+    Notes
+    -----
+    Applying the returned field with a single ants.apply_transforms call is
+    equivalent to applying the whole chain, but each image is interpolated
+    once instead of once per resampling step.
+    """
+    return ants.apply_transforms(
+        fixed=reference,
+        moving=reference,
+        transformlist=transformlist,
+        whichtoinvert=whichtoinvert,
+        compose=output_prefix,
+    )
+
+
+
+def main(argv=None):
     """
     Generate synthetic undistorted B0 and correct DWI distortion using SynB0-DISCO.
     
@@ -527,6 +590,12 @@ def main():
     The approach uses deep learning to predict undistorted B0 contrast from T1w
     images, enabling distortion correction without reverse phase-encoding acquisitions.
     
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command-line arguments without the program name. Defaults to
+        ``sys.argv[1:]``.
+    
     Command-Line Arguments
     ----------------------
     Required:
@@ -576,7 +645,10 @@ def main():
     --------
     # See print_help_message() for detailed usage examples
     """
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv or "-h" in argv or "--help" in argv:
         print_help_message()
         sys.exit(0)
         
@@ -602,8 +674,24 @@ def main():
     parser.add_argument('--b0-to-T1-affine', required=True, help='Path to the B0 to T1 affine matrix')
     parser.add_argument('--b0-to-T1-warp', required=True, help='Path to the B0 to T1 warp field')
     parser.add_argument('--b0-to-T1-warp-secondary', help='Path to secondary warp field for B0 to T1')
-
-    args = parser.parse_args()
+    parser.add_argument('--ensemble-batch', type=int, default=1,
+                        help='Number of models evaluated in one batched forward pass (default: 1)')
+    parser.add_argument('--tile-size', type=int,
+                        help='Run the network on overlapping tiles of this size (default: whole volume)')
+    parser.add_argument('--tile-overlap', type=float, default=0.5,
+                        help='Fraction of overlap between tiles (default: 0.5)')
+    parser.add_argument('--memory-budget', type=float,
+                        help='Inference memory budget in MB; tiles the volume if it does not fit')
+    parser.add_argument('--backend', choices=['eager', 'torchscript', 'onnxruntime'], default='eager',
+                        help='Inference backend (default: eager)')
+    parser.add_argument('--bf16', action='store_true',
+                        help='Run the network under bfloat16 autocast')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='Use the channels-last 3D memory format')
+    parser.add_argument('--compose-transforms', action='store_true',
+                        help='Compose the transform chain into one displacement field and resample each volume once')
+
+    args = parser.parse_args(argv)
     
     try:
         
@@ -628,7 +716,8 @@ def main():
         
         # Load DWI and extract first volume
         print(f"\n{CYAN}Loading DWI image...{RESET}")
-        dwi_image = ants.image_read(dwi_path)
+        with io_timer("read", dwi_path):
+            dwi_image = ants.image_read(dwi_path)
         dwi_data = dwi_image.numpy()
         print(f"  Shape: {dwi_data.shape}")
         
@@ -697,53 +786,51 @@ def main():
         model_files = model_files[:model_count]
         model_paths = [os.path.join(models_dir, f) for f in model_files]
 
-        # Run inference with ensemble
-        print(f"\n{CYAN}Running inference with model ensemble...{RESET}")
-        all_predictions = []
-
-        for i, model_path in enumerate(model_paths):
-            print(f"\n  {CYAN}Model {i+1}/{model_count}: {os.path.basename(model_path)}{RESET}")
-            
-            try:
-                model = UNet3D(2, 1).to(device)
-                model.load_state_dict(torch.load(model_path, map_location=device))
-                model.eval()
-                print(f"    {GREEN}Model loaded{RESET}")
-            except Exception as e:
-                raise RuntimeError(f"Error loading model: {e}")
+        # The network definition imports PyTorch at module level
+        from .synb0_DISCO.ensemble import EnsembleInference
 
-            try:
-                with torch.no_grad():
-                    img_model = inference(t1_path, b0_path, model, device)
-                prediction = torch2nii(img_model.detach().cpu())
-                all_predictions.append(prediction)
-                print(f"    {GREEN}Inference completed{RESET}")
-            except Exception as e:
-                raise RuntimeError(f"Error during inference: {e}")
-        
-        # Average predictions
-        print(f"\n{CYAN}Combining predictions from all models...{RESET}")
-        combined_prediction = np.mean(all_predictions, axis=0)
+        # Run inference with ensemble: inputs are preprocessed once, all
+        # folds stay loaded and their outputs are averaged as they arrive
+        print(f"\n{CYAN}Running inference with model ensemble...{RESET}")
+        try:
+            ensemble = EnsembleInference(
+                model_paths, device, batch_size=args.ensemble_batch, tile_size=args.tile_size,
+                tile_overlap=args.tile_overlap, memory_budget=args.memory_budget,
+                backend=args.backend, bf16=args.bf16, channels_last=args.channels_last,
+            )
+            print(f"  {GREEN}{model_count} models loaded{RESET}")
+        except Exception as e:
+            raise RuntimeError(f"Error loading model: {e}")
+
+        try:
+            combined_prediction = ensemble.predict(t1_path, b0_path)
+        except Exception as e:
+            raise RuntimeError(f"Error during inference: {e}")
+        for fold_paths, seconds in ensemble.timings:
+            names = ", ".join(os.path.basename(path) for path in fold_paths)
+            print(f"  Model(s) {names}: {seconds:.1f} s")
         print(f"  {GREEN}Ensemble average computed{RESET}")
         
         # Save intermediate result
         nii_template = nib.load(t1_path)
-        intermediate_nii = nib.Nifti1Image(combined_prediction, 
-                                            nii_template.affine, nii_template.header)
-        nib.save(intermediate_nii, intermediate_output)
+        save_image(combined_prediction, nii_template.affine, intermediate_output,
+                   header=nii_template.header, threads=num_threads)
         print(f"  {GREEN}Saved to: {intermediate_output}{RESET}")
         
         # Register synthetic B0
         print(f"\n{CYAN}Registering synthetic B0...{RESET}")
-        synthetic_b0 = ants.image_read(intermediate_output)
-        b0_img = ants.image_read(b0_path)
+        with io_timer("read", intermediate_output):
+            synthetic_b0 = ants.image_read(intermediate_output)
+        with io_timer("read", b0_path):
+            b0_img = ants.image_read(b0_path)
         synthetic_b0_registration = ants.registration(
             fixed=b0_img,
             moving=synthetic_b0,
             type_of_transform='Affine'
         )
         synthetic_b0_in_T1space = synthetic_b0_registration['warpedmovout']
-        ants.image_write(synthetic_b0_in_T1space, intermediate_output)
+        with io_timer("write", intermediate_output):
+            save_ants_image(synthetic_b0_in_T1space, intermediate_output, num_threads)
         print(f"  {GREEN}Registration completed{RESET}")
 
         # Compute distortion field
@@ -774,7 +861,8 @@ def main():
                 whichtoinvert=[True],
                 interpolator='bSpline'
             )
-            ants.image_write(b0_in_DWI, args.corrected_b0)
+            with io_timer("write", args.corrected_b0):
+                save_ants_image(b0_in_DWI, args.corrected_b0, num_threads)
             print(f"  {GREEN}Saved to: {args.corrected_b0}{RESET}")
 
         # Apply correction to DWI
@@ -783,32 +871,43 @@ def main():
         num_volumes = dwi_reference.shape[direction_dim]
         print(f"  Processing {num_volumes} volumes")
         
-        # Create volume processing directory
-        volume_temp_dir = os.path.join(temp_dir, "volume_processing")
-        os.makedirs(volume_temp_dir, exist_ok=True)
-        
-        dwi_data = dwi_reference.get_fdata()
+        transformsformlist = [transforms['fwdtransforms'][0]]
+        if args.b0_to_T1_warp_secondary:
+            transformsformlist.append(args.b0_to_T1_warp_secondary)
+        transformsformlist.append(args.b0_to_T1_warp)
+        transformsformlist.append(args.b0_to_T1_affine)
+
+        if args.compose_transforms:
+            # DWI -> T1 (inverse affine) followed by the distortion chain,
+            # composed once on the first-volume DWI grid
+            print(f"  Composing transforms into a single displacement field")
+            correction_field = compose_transform_chain(
+                first_dwi_image,
+                [args.b0_to_T1_affine] + transformsformlist,
+                [True] + [False] * len(transformsformlist),
+                os.path.join(temp_dir, "dwi_correction_"),
+            )
+
         corrected_volumes = []
         
-        # Process each volume
-        for vol_idx in range(num_volumes):
+        # Process each volume, reading one at a time from disk
+        for vol_idx, vol_data in iter_volumes(dwi_reference, axis=direction_dim):
             print(f"  Volume {vol_idx+1}/{num_volumes}...", end=' ')
             
-            vol_idx_tuple = tuple(slice(None) if i != direction_dim else vol_idx 
-                                for i in range(len(dwi_data.shape)))
-            vol_data = dwi_data[vol_idx_tuple]
-            vol_path = os.path.join(volume_temp_dir, f"vol_{vol_idx}.nii.gz")
-            
-            vol_img = nib.Nifti1Image(vol_data, dwi_reference.affine)
-            nib.save(vol_img, vol_path)
-            
-            vol_ants = ants.image_read(vol_path)
-            transformsformlist = [transforms['fwdtransforms'][0]]
-            if args.b0_to_T1_warp_secondary:
-                transformsformlist.append(args.b0_to_T1_warp_secondary)
-            transformsformlist.append(args.b0_to_T1_warp)
-            transformsformlist.append(args.b0_to_T1_affine)
-            
+            # The volume shares the geometry of the first DWI volume, so the
+            # ANTs image is built in memory instead of via a NIfTI file
+            vol_ants = first_dwi_image.new_image_like(vol_data)
+
+            if args.compose_transforms:
+                corrected_vol = ants.apply_transforms(
+                    fixed=first_dwi_image,
+                    moving=vol_ants,
+                    transformlist=[correction_field],
+                    interpolator='bSpline'
+                )
+                corrected_volumes.append(corrected_vol.numpy())
+                continue
+
             corrected_vol_T1space = ants.apply_transforms(
                 fixed=synthetic_b0_in_T1space,
                 moving=vol_ants,
@@ -828,12 +927,19 @@ def main():
         # Save corrected DWI
         print(f"\n{CYAN}Saving corrected DWI...{RESET}")
         corrected_4d = np.stack(corrected_volumes, axis=direction_dim)
-        output_nii = nib.Nifti1Image(corrected_4d, dwi_reference.affine, dwi_reference.header)
-        nib.save(output_nii, output)
+        save_image(corrected_4d, dwi_reference.affine, output, header=dwi_reference.header,
+                   threads=num_threads)
         print(f"  {GREEN}Saved to: {output}{RESET}")
 
-        # Save warp field
-        shutil.copy(transforms['fwdtransforms'][0], args.warp)
+        # Save warp field; ANTs writes it gzipped, so other formats are re-saved
+        warp_field = transforms['fwdtransforms'][0]
+        if args.warp.endswith(".nii.gz") and warp_field.endswith(".nii.gz"):
+            shutil.copy(warp_field, args.warp)
+        else:
+            with io_timer("read", warp_field):
+                warp_image = ants.image_read(warp_field)
+            with io_timer("write", args.warp):
+                save_ants_image(warp_image, args.warp, num_threads)
         print(f"\n{CYAN}Warp field saved to:{RESET} {args.warp}")
         
         
@@ -115,19 +115,16 @@ micaflow synthseg \\
 
 Python API Usage:
 ----------------
->>> from micaflow.scripts.synthseg import main
->>> import sys
+>>> from micaflow.scripts.synthseg import main, run_synthseg
 >>> 
 >>> # Basic usage
->>> sys.argv = [
-...     'synthseg',
+>>> main([
 ...     '--i', 'T1w.nii.gz',
 ...     '--o', 'segmentation.nii.gz'
-... ]
->>> main()
+... ])
 >>> 
->>> # With options (alternative approach)
->>> main({
+>>> # With options (alternative approach, bypasses argument parsing)
+>>> run_synthseg({
 ...     'i': 'T1w.nii.gz',
 ...     'o': 'segmentation.nii.gz',
 ...     'parc': True,
@@ -187,7 +184,6 @@ import os
 import sys
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from colorama import init, Fore, Style
-from lamareg.scripts.synthseg import main
 
 init()
 
@@ -202,6 +198,22 @@ BOLD = Style.BRIGHT
 RESET = Style.RESET_ALL
 
 
+def run_synthseg(args):
+    """
+    Run lamareg's SynthSeg on a dictionary of options.
+
+    lamareg (and TensorFlow behind it) is imported on the first call, so
+    importing this module or printing help stays fast.
+
+    Parameters
+    ----------
+    args : dict
+        SynthSeg options as built by main(), e.g. ``{'i': ..., 'o': ...}``.
+    """
+    from lamareg.scripts.synthseg import main as lamareg_synthseg
+    return lamareg_synthseg(args)
+
+
 def print_extended_help():
 
     help_text = f"""
@@ -296,9 +308,22 @@ def print_extended_help():
     print(help_text)
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point for the synthseg script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
     # Check if help flags are provided or no arguments
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+    if not argv or "-h" in argv or "--help" in argv:
         print_extended_help()
         sys.exit(0)
 
@@ -381,7 +406,7 @@ if __name__ == "__main__":
     )
 
     # parse commandline
-    args = vars(parser.parse_args())
+    args = vars(parser.parse_args(argv))
     
     # Map 'input' and 'output' to 'i' and 'o' to match the internal logic and lamareg backend
     if 'input' in args:
@@ -424,7 +449,7 @@ if __name__ == "__main__":
         print(f"\n{CYAN}Starting segmentation...{RESET}\n")
         
         # Run SynthSeg
-        main(args)
+        run_synthseg(args)
         
         print(f"\n{GREEN}{BOLD}Segmentation completed successfully!{RESET}")
         print(f"  Output: {args['o']}")
@@ -446,3 +471,7 @@ if __name__ == "__main__":
         print(f"  {str(e)}")
         print(f"\n{YELLOW}Run 'micaflow synthseg --help' for usage information.{RESET}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -122,8 +122,12 @@ import argparse
 import os
 import sys
 import numpy as np
-import ants
 from colorama import init, Fore, Style
+from micaflow.scripts.util_lazy_import import lazy_import
+from micaflow.scripts.util_io_timing import io_timer
+from micaflow.scripts.util_nifti_io import same_grid
+
+ants = lazy_import("ants")
 
 init()
 
@@ -395,14 +399,19 @@ def compute_relative_intensity(image, mask):
 def run_texture_pipeline(input_path, mask_path, output_prefix):
     """Run simplified texture generation pipeline."""
     
+    # Check from the headers whether the mask is in the same space
+    mask_matches = same_grid(input_path, mask_path)
+    
     print(f"{Fore.CYAN}Loading input: {input_path}{Style.RESET_ALL}")
-    img = ants.image_read(input_path)
+    with io_timer("read", input_path):
+        img = ants.image_read(input_path)
     
     print(f"{Fore.CYAN}Loading mask: {mask_path}{Style.RESET_ALL}")
-    mask = ants.image_read(mask_path)
+    with io_timer("read", mask_path):
+        mask = ants.image_read(mask_path)
     
     # Ensure mask is in same space
-    if not ants.image_physical_space_consistency(img, mask):
+    if not mask_matches:
         print(f"{Fore.YELLOW}Resampling mask to input space...{Style.RESET_ALL}")
         mask = ants.resample_image_to_target(mask, img, interp_type='nearestNeighbor')
 
@@ -411,7 +420,8 @@ def run_texture_pipeline(input_path, mask_path, output_prefix):
     grad_map = compute_gradient_magnitude(img)
     
     grad_out = f"{output_prefix}_gradient-magnitude.nii.gz"
-    ants.image_write(grad_map, grad_out)
+    with io_timer("write", grad_out):
+        ants.image_write(grad_map, grad_out)
     print(f"  Saved: {grad_out}")
 
     # 2. Relative Intensity
@@ -419,11 +429,25 @@ def run_texture_pipeline(input_path, mask_path, output_prefix):
     ri_map = compute_relative_intensity(img, mask)
     
     ri_out = f"{output_prefix}_relative-intensity.nii.gz"
-    ants.image_write(ri_map, ri_out)
+    with io_timer("write", ri_out):
+        ants.image_write(ri_map, ri_out)
     print(f"  Saved: {ri_out}")
 
-if __name__ == "__main__":
-    if len(sys.argv) == 1 or "-h" in sys.argv or "--help" in sys.argv:
+def main(argv=None):
+    """
+    Command-line entry point for the texture_generation script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Arguments without the program name. Defaults to ``sys.argv[1:]``.
+        ``micaflow.cli`` passes the forwarded arguments here to run the
+        script in-process instead of re-executing the interpreter.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv or "-h" in argv or "--help" in argv:
         print_extended_help()
         sys.exit(0)
     parser = argparse.ArgumentParser(description="Simple Texture Feature Extraction")
@@ -431,7 +455,7 @@ if __name__ == "__main__":
     parser.add_argument("--mask", "-m", required=True, help="Brain mask")
     parser.add_argument("--output", "-o", required=True, help="Output prefix")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if not os.path.exists(args.input):
         print(f"{Fore.RED}Error: Input file not found: {args.input}{Style.RESET_ALL}")
@@ -446,4 +470,8 @@ if __name__ == "__main__":
         print(f"\n{Fore.GREEN}Done!{Style.RESET_ALL}")
     except Exception as e:
         print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import os
 import sys
-import torch
-import tensorflow as tf
 from colorama import init, Fore, Style
+from micaflow.scripts.util_lazy_import import lazy_import
+
+# Only needed for the GPU check; the Snakefile imports this module at parse time
+torch = lazy_import("torch")
+tf = lazy_import("tensorflow")
 
 init()
 
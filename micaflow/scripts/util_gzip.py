@@ -0,0 +1,376 @@
+"""
+util_gzip - Multi-threaded gzip writing and indexed gzip reading
+
+Writing a .nii.gz with nibabel or ANTs deflates the whole image in one
+thread, which for a 4D DWI series can take longer than a light processing
+step. ParallelGzipWriter cuts the uncompressed stream into blocks (4 MB by
+default) and deflates them in a thread pool (zlib releases the GIL), writing
+each block as its own gzip member. A file of concatenated members is a
+standard gzip file: gzip, zlib, nibabel, ITK/ANTs and FSL read it as one
+stream.
+
+Each member carries its compressed and uncompressed size in a gzip extra
+field (subfield "MF"), in the spirit of BGZF. IndexedGzipReader uses these
+to build an index of the members from their headers alone, so that reading
+one volume of a 4D series decompresses only the blocks holding it instead of
+everything before it, and sequential reads decompress the next blocks in
+background threads. Files from other gzip writers are not indexed and are
+read as usual.
+
+Scripts with a --threads option pass it as the number of threads. Otherwise
+it is MICAFLOW_GZIP_THREADS, else 1, so that a command never uses more cores
+than the Snakemake rule running it was given. OMP_NUM_THREADS is not used:
+scripts lower it to 1 for their own reasons.
+
+>>> from micaflow.scripts.util_gzip import IndexedGzipReader, ParallelGzipWriter
+>>> with ParallelGzipWriter("dwi.nii.gz", threads=8) as f:
+...     f.write(header_bytes)
+...     f.write(data.tobytes(order="F"))
+>>> with IndexedGzipReader("dwi.nii.gz") as f:
+...     f.seek(offset_of_volume_40)
+...     volume_bytes = f.read(volume_size)
+"""
+
+import bisect
+import io
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Uncompressed bytes per gzip member; the unit of work of the thread pool
+BLOCK_SIZE = 1 << 22
+
+# Fastest deflate level, as nibabel writes .nii.gz by default
+GZIP_LEVEL = 1
+
+GZIP_THREADS_ENV = "MICAFLOW_GZIP_THREADS"
+
+# Member header: gzip magic, deflate, FEXTRA flag, mtime 0, XFL, OS unknown,
+# XLEN, then subfield "MF" with the member size and the uncompressed size
+_HEADER = struct.Struct("<BBBBIBBH2sHII")
+_SUBFIELD_ID = b"MF"
+
+
+def gzip_threads(threads=None):
+    """Number of compression threads: threads, else MICAFLOW_GZIP_THREADS, else 1."""
+    if threads:
+        return max(1, int(threads))
+    value = os.environ.get(GZIP_THREADS_ENV, "")
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    return 1
+
+
+def compress_block(block, level=GZIP_LEVEL):
+    """
+    Compress a block of bytes into one self-contained gzip member.
+
+    Parameters
+    ----------
+    block : bytes
+        Uncompressed data (less than 4 GB).
+    level : int, optional
+        Deflate level, 1 (fastest) to 9 (smallest). Default: 1.
+
+    Returns
+    -------
+    bytes
+        Gzip member whose extra field records its own size and len(block).
+    """
+    deflater = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = deflater.compress(block) + deflater.flush()
+    size = _HEADER.size + len(body) + 8
+    header = _HEADER.pack(0x1F, 0x8B, 8, 4, 0, 0, 255, 12, _SUBFIELD_ID, 8, size, len(block))
+    return b"".join((header, body, struct.pack("<II", zlib.crc32(block), len(block))))
+
+
+class ParallelGzipWriter(io.IOBase):
+    """
+    Write-only gzip file whose blocks are deflated in parallel threads.
+
+    Supports write(), tell() and seeking to the current position, which is
+    what nibabel needs to save an image into it.
+
+    Parameters
+    ----------
+    path : str
+        Output path.
+    threads : int, optional
+        Compression threads. Default: see gzip_threads().
+    level : int, optional
+        Deflate level. Default: 1.
+    block_size : int, optional
+        Uncompressed bytes per gzip member. Default: 4 MB.
+    """
+
+    # Class defaults keep close() safe when __init__ fails
+    _file = None
+    _executor = None
+
+    def __init__(self, path, threads=None, level=GZIP_LEVEL, block_size=BLOCK_SIZE):
+        self.name = str(path)
+        self.level = level
+        self.block_size = int(block_size)
+        self.threads = gzip_threads(threads)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._position = 0
+        self._members = 0
+        self._file = open(path, "wb")
+        self._executor = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+    def writable(self):
+        return True
+
+    def _submit(self, block):
+        self._members += 1
+        if self._executor is None:
+            self._file.write(compress_block(block, self.level))
+            return
+        self._pending.append(self._executor.submit(compress_block, block, self.level))
+        # Bound the memory held by blocks waiting to be written, in order
+        while len(self._pending) > 2 * self.threads:
+            self._file.write(self._pending.popleft().result())
+
+    def write(self, data):
+        """Append bytes-like data; returns the number of bytes written."""
+        view = memoryview(data).cast("B")
+        start = 0
+        if self._buffer:
+            start = min(self.block_size - len(self._buffer), len(view))
+            self._buffer += view[:start]
+            if len(self._buffer) == self.block_size:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+        while len(view) - start >= self.block_size:
+            self._submit(view[start:start + self.block_size].tobytes())
+            start += self.block_size
+        self._buffer += view[start:]
+        self._position += len(view)
+        return len(view)
+
+    def tell(self):
+        """Uncompressed position."""
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Only the current position is supported; gzip streams cannot seek on write."""
+        if whence == io.SEEK_SET and offset == self._position:
+            return self._position
+        raise io.UnsupportedOperation("ParallelGzipWriter cannot seek")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Compress the remaining data and close the file."""
+        if self.closed:
+            return
+        try:
+            if self._file is not None:
+                # An empty stream is still written as one (empty) member
+                if self._buffer or not self._members:
+                    self._submit(bytes(self._buffer))
+                    self._buffer = bytearray()
+                while self._pending:
+                    self._file.write(self._pending.popleft().result())
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+            if self._file is not None:
+                self._file.close()
+            super().close()
+
+
+def gzip_file(source, path, threads=None, level=GZIP_LEVEL, block_size=BLOCK_SIZE):
+    """
+    Compress a file with ParallelGzipWriter.
+
+    Parameters
+    ----------
+    source : str
+        Uncompressed input file.
+    path : str
+        Output .gz path.
+    threads, level, block_size
+        As for ParallelGzipWriter.
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    with open(source, "rb") as infile, ParallelGzipWriter(path, threads, level, block_size) as outfile:
+        for block in iter(lambda: infile.read(block_size), b""):
+            outfile.write(block)
+    return path
+
+
+def read_member_index(path):
+    """
+    Index the gzip members of a file written by ParallelGzipWriter.
+
+    Only the member headers are read, not the compressed data.
+
+    Parameters
+    ----------
+    path : str
+        Gzip file.
+
+    Returns
+    -------
+    list of tuple or None
+        (compressed offset, member size, uncompressed offset, uncompressed
+        size) per member, or None if the file has a member without the size
+        subfield (i.e. it was written by another gzip writer).
+    """
+    index = []
+    offset = uncompressed = 0
+    with open(path, "rb") as f:
+        total = os.fstat(f.fileno()).st_size
+        while offset < total:
+            f.seek(offset)
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                return None
+            fields = _HEADER.unpack(head)
+            if fields[:4] != (0x1F, 0x8B, 8, 4) or fields[7:10] != (12, _SUBFIELD_ID, 8):
+                return None
+            size, isize = fields[10], fields[11]
+            if size < _HEADER.size + 8:
+                return None
+            index.append((offset, size, uncompressed, isize))
+            offset += size
+            uncompressed += isize
+    return index
+
+
+def is_indexed_gzip(path):
+    """Whether path starts with a member written by ParallelGzipWriter."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_HEADER.size)
+    except (OSError, TypeError):
+        return False
+    if len(head) < _HEADER.size:
+        return False
+    fields = _HEADER.unpack(head)
+    return fields[:4] == (0x1F, 0x8B, 8, 4) and fields[7:10] == (12, _SUBFIELD_ID, 8)
+
+
+class IndexedGzipReader(io.IOBase):
+    """
+    Read-only random access to a file written by ParallelGzipWriter.
+
+    Parameters
+    ----------
+    path : str
+        Gzip file with indexed members (see is_indexed_gzip).
+    threads : int, optional
+        Threads decompressing the blocks after the one being read, for
+        sequential reads. Default: 1 (no read-ahead).
+
+    Raises
+    ------
+    ValueError
+        If the file has no member index.
+    """
+
+    _file = None
+    _executor = None
+
+    def __init__(self, path, threads=1):
+        self.name = str(path)
+        self._index = read_member_index(path)
+        if self._index is None:
+            raise ValueError(f"{path} was not written with an indexed gzip member layout")
+        self._starts = [entry[2] for entry in self._index]
+        self.size = sum(entry[3] for entry in self._index)
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        self._position = 0
+        self._last = None
+        self._ahead = {}
+        self.threads = max(1, int(threads))
+        self._executor = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _read_member(self, block):
+        offset, size, _, isize = self._index[block]
+        with self._lock:
+            self._file.seek(offset)
+            raw = self._file.read(size)
+        data = zlib.decompress(raw[_HEADER.size:-8], -zlib.MAX_WBITS)
+        crc, length = struct.unpack("<II", raw[-8:])
+        if len(data) != isize or zlib.crc32(data) != crc or length != isize & 0xFFFFFFFF:
+            raise OSError(f"Corrupt gzip member {block} in {self.name}")
+        return data
+
+    def _block(self, block):
+        """Decompressed block; the last one is cached and the next ones read ahead."""
+        if self._last is not None and self._last[0] == block:
+            return self._last[1]
+        future = self._ahead.pop(block, None)
+        data = future.result() if future is not None else self._read_member(block)
+        if self._executor is not None:
+            ahead = {}
+            for later in range(block + 1, min(block + 1 + self.threads, len(self._index))):
+                ahead[later] = self._ahead.pop(later, None) or self._executor.submit(self._read_member, later)
+            for stale in self._ahead.values():
+                stale.cancel()
+            self._ahead = ahead
+        self._last = (block, data)
+        return data
+
+    def readinto(self, buffer):
+        """Read into a writable buffer; returns the number of bytes read."""
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self._position < self.size:
+            block = bisect.bisect_right(self._starts, self._position) - 1
+            data = self._block(block)
+            start = self._position - self._starts[block]
+            count = min(len(data) - start, len(view) - filled)
+            view[filled:filled + count] = data[start:start + count]
+            filled += count
+            self._position += count
+        return filled
+
+    def read(self, size=-1):
+        """Read up to size bytes (all remaining bytes if negative)."""
+        if size is None or size < 0:
+            size = self.size - self._position
+        buffer = bytearray(max(0, min(size, self.size - self._position)))
+        return bytes(buffer[:self.readinto(buffer)])
+
+    def tell(self):
+        """Uncompressed position."""
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move to an uncompressed position; no data is decompressed."""
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise OSError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        self._ahead = {}
+        self._last = None
+        if self._file is not None:
+            self._file.close()
+        super().close()
@@ -0,0 +1,157 @@
+"""
+util_io_timing - Optional timing log of image reads and writes
+
+Setting MICAFLOW_IO_LOG to a file path makes every image read or write that
+is wrapped in io_timer() append one tab-separated row to that file:
+
+    rule    command    operation    path    megabytes    seconds
+
+where command is the micaflow command doing the I/O (e.g. denoise), rule is
+the Snakemake rule running it (MICAFLOW_RULE, set by the pipeline; the
+command outside of it) and megabytes is the size of the file on disk. The
+NIfTI helpers of util_nifti_io and the ANTs reads and writes of the scripts
+are wrapped, so a pipeline run with ``--io-timing`` records the I/O time of
+every rule, and summarize_io_log() totals it per rule, e.g. to compare
+gzipped and uncompressed intermediates (``--intermediate-format``).
+
+Without the environment variable io_timer() only runs the wrapped block.
+Rows are appended with a single write, so commands running in parallel can
+share one log.
+
+>>> from micaflow.scripts.util_io_timing import io_timer
+>>> with io_timer("write", output_path):
+...     ants.image_write(image, output_path)
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Path of the log; I/O is not timed when unset
+IO_LOG_ENV = "MICAFLOW_IO_LOG"
+
+# Snakemake rule running the command, set in the pipeline's shell commands
+RULE_ENV = "MICAFLOW_RULE"
+
+IO_LOG_COLUMNS = ("rule", "command", "operation", "path", "megabytes", "seconds")
+
+
+def command_name():
+    """Name of the running micaflow command, e.g. 'denoise'."""
+    name = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+    if name.endswith(".py"):
+        name = name[:-3]
+    # run_script sets argv[0] to the module name, e.g. micaflow.scripts.denoise
+    return name.rsplit(".", 1)[-1]
+
+
+def log_io(operation, path, seconds):
+    """
+    Append one row to the I/O log, if MICAFLOW_IO_LOG is set.
+
+    Parameters
+    ----------
+    operation : str
+        'read' or 'write'.
+    path : str
+        Image file that was read or written.
+    seconds : float
+        Time taken.
+    """
+    log_path = os.environ.get(IO_LOG_ENV)
+    if not log_path or path is None:
+        return
+    try:
+        megabytes = os.path.getsize(path) / 1e6
+    except OSError:
+        megabytes = float("nan")
+    command = command_name()
+    rule = os.environ.get(RULE_ENV) or command
+    row = (rule, command, operation, os.path.abspath(str(path)), f"{megabytes:.3f}", f"{seconds:.4f}")
+    header = "" if os.path.exists(log_path) else "\t".join(IO_LOG_COLUMNS) + "\n"
+    with open(log_path, "a") as f:
+        f.write(header + "\t".join(row) + "\n")
+
+
+@contextmanager
+def io_timer(operation, path):
+    """
+    Time the enclosed read or write of path and log it (see log_io).
+
+    Parameters
+    ----------
+    operation : str
+        'read' or 'write'.
+    path : str or None
+        Image file; nothing is logged for None (e.g. in-memory images).
+    """
+    if not os.environ.get(IO_LOG_ENV) or path is None:
+        yield
+        return
+    start = time.perf_counter()
+    yield
+    log_io(operation, path, time.perf_counter() - start)
+
+
+def read_io_log(log_path):
+    """
+    Read the rows of an I/O log.
+
+    Parameters
+    ----------
+    log_path : str
+        Log written through MICAFLOW_IO_LOG.
+
+    Returns
+    -------
+    list of dict
+        One dict per row with the keys of IO_LOG_COLUMNS; megabytes and
+        seconds are floats.
+    """
+    rows = []
+    with open(log_path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            # Commands starting together may each have written the header
+            if len(fields) != len(IO_LOG_COLUMNS) or fields[0] == IO_LOG_COLUMNS[0]:
+                continue
+            row = dict(zip(IO_LOG_COLUMNS, fields))
+            row["megabytes"] = float(row["megabytes"])
+            row["seconds"] = float(row["seconds"])
+            rows.append(row)
+    return rows
+
+
+def summarize_io_log(log_path):
+    """
+    Total the logged I/O per rule and operation.
+
+    Parameters
+    ----------
+    log_path : str
+        Log written through MICAFLOW_IO_LOG.
+
+    Returns
+    -------
+    str
+        Table with the command, number of files, megabytes and seconds of
+        each rule's reads and writes, and the overall total.
+    """
+    totals = {}
+    for row in read_io_log(log_path):
+        key = (row["rule"], row["command"], row["operation"])
+        total = totals.setdefault(key, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += row["megabytes"]
+        total[2] += row["seconds"]
+
+    width = max([len("rule")] + [len(rule) for rule, _, _ in totals]) + 2
+    lines = [f"{'rule':<{width}}{'command':<22}{'operation':<11}{'files':>7}{'MB':>11}{'seconds':>10}"]
+    for (rule, command, operation), (files, megabytes, seconds) in sorted(totals.items()):
+        lines.append(f"{rule:<{width}}{command:<22}{operation:<11}{files:>7}{megabytes:>11.1f}{seconds:>10.2f}")
+    files = sum(total[0] for total in totals.values())
+    megabytes = sum(total[1] for total in totals.values())
+    seconds = sum(total[2] for total in totals.values())
+    lines.append(f"{'total':<{width + 33}}{files:>7}{megabytes:>11.1f}{seconds:>10.2f}")
+    return "\n".join(lines)
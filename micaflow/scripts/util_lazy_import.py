@@ -0,0 +1,72 @@
+"""
+util_lazy_import - Deferred imports for heavy optional dependencies
+
+ANTs, PyTorch, TensorFlow, DIPY, nilearn and lamareg each take between a few
+hundred milliseconds and several seconds to import. The micaflow scripts only
+need them once actual processing starts, so printing help, parsing arguments
+or importing a script for its Python API should not pay that cost.
+
+Module-level aliases are declared with lazy_import(); the real import happens
+on first attribute access:
+
+>>> from micaflow.scripts.util_lazy_import import lazy_import
+>>> ants = lazy_import("ants")      # nothing imported yet
+>>> img = ants.image_read("t1w.nii.gz")  # ants is imported here
+
+Names pulled out of submodules (``from dipy.reconst.dti import TensorModel``)
+are imported inside the function that uses them instead.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """
+    Placeholder for a module that is imported on first attribute access.
+
+    Parameters
+    ----------
+    name : str
+        Absolute module name, e.g. ``"ants"`` or ``"tensorflow"``.
+    """
+
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def _load(self):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "not loaded"
+        return f"<lazy module '{self._lazy_name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return a module proxy that defers ``import name`` until it is used.
+
+    Parameters
+    ----------
+    name : str
+        Absolute module name.
+
+    Returns
+    -------
+    LazyModule
+        Proxy forwarding attribute access to the imported module.
+
+    Notes
+    -----
+    - A missing dependency raises ModuleNotFoundError at first use rather
+      than at import of the calling script
+    """
+    return LazyModule(name)
@@ -0,0 +1,707 @@
+"""
+util_nifti_io - Memory-friendly NIfTI reading for the DWI scripts
+
+``nib.load(path).get_fdata()`` returns a float64 copy of the whole image,
+four times the size of the int16 data most scanners write and twice that of
+float32. For a high-resolution multishell DWI series this is several GB per
+subject, before any processing has started.
+
+The helpers in this module read through the image's ``dataobj`` instead:
+
+- read_data() loads the whole image directly as float32 (or any dtype),
+  without a float64 intermediate
+- read_volume() / read_volumes() load only the selected volumes
+- iter_volumes() yields one volume at a time; for NIfTI files the volumes
+  are streamed from disk in a single forward pass (uncompressed files are
+  memory-mapped, gzipped files are decompressed only once)
+- iter_slabs() yields blocks of consecutive slices of all volumes, for
+  voxel-wise processing with bounded memory
+- save_volumes() writes a subset of the volumes to a new file, streaming the
+  stored values one volume at a time, so the on-disk dtype and scaling are
+  kept and the series is never loaded as a whole
+
+probe_image() returns the shape, dtype and geometry of an image from its
+header alone, and same_grid() compares two grids that way, so that scripts
+can detect 3D/4D inputs and validate masks before any voxel data is decoded.
+
+.nii.gz files are written with util_gzip's ParallelGzipWriter (save_nifti()),
+which deflates blocks of the image in parallel threads into a standard
+multi-member gzip file with a member index. Volumes of such files are read
+through that index: read_volume() decompresses only the blocks holding the
+volume, and streamed reads decompress the next blocks in background threads.
+
+Reads and writes of image files are timed to MICAFLOW_IO_LOG when it is set
+(see util_io_timing).
+
+Derived images are written with save_image(), which applies one output
+dtype policy to every script instead of saving whatever the computation
+produced (often float64):
+
+- continuous data keeps the dtype of the input header it is saved with,
+  and is float32 otherwise (float64 is never written)
+- masks are uint8; label maps use the smallest of uint8/int16/int32 that
+  holds their labels
+- setting MICAFLOW_SCALED_INT16=1 stores continuous data as int16 with
+  scl_slope/scl_inter chosen by nibabel, a quarter of the float32 size
+
+save_ants_image() applies the same policy to ANTs masks and label maps, and
+save_labels() converts label maps that external tools wrote as floats.
+
+Intensity scaling (scl_slope / scl_inter) is applied exactly as nibabel does.
+
+>>> from micaflow.scripts.util_nifti_io import iter_volumes, probe_image, read_data, same_grid
+>>> probe_image("dwi.nii.gz").n_volumes       # header only
+>>> same_grid("dwi.nii.gz", "mask.nii.gz")    # spatial shape and affine
+>>> dwi = nib.load("dwi.nii.gz")
+>>> data = read_data(dwi)                     # float32, whole series
+>>> for index, volume in iter_volumes(dwi):   # one 3D float32 volume at a time
+...     process(volume)
+"""
+
+import os
+import tempfile
+import time
+
+import nibabel as nib
+import numpy as np
+from nibabel.fileholders import FileHolder
+from nibabel.openers import ImageOpener
+from nibabel.volumeutils import array_from_file, seek_tell
+
+from micaflow.scripts.util_gzip import (
+    IndexedGzipReader,
+    ParallelGzipWriter,
+    gzip_file,
+    gzip_threads,
+    is_indexed_gzip,
+)
+from micaflow.scripts.util_io_timing import io_timer, log_io
+from micaflow.scripts.util_lazy_import import lazy_import
+
+ants = lazy_import("ants")
+
+# Continuous image data is read as float32 unless a caller asks otherwise
+DEFAULT_DTYPE = np.float32
+
+# Kinds of data save_image() knows a dtype policy for
+OUTPUT_KINDS = ("continuous", "mask", "labels")
+
+# Opt-in for storing continuous outputs as scaled int16
+SCALED_INT16_ENV = "MICAFLOW_SCALED_INT16"
+
+
+def as_image(img):
+    """Return img loaded with nibabel if it is a path, otherwise img itself."""
+    if isinstance(img, nib.spatialimages.SpatialImage):
+        return img
+    return nib.load(img)
+
+
+class ImageInfo:
+    """
+    Shape, data type and geometry of an image, read from its header only.
+
+    No voxel data is decoded; for a .nii.gz file only the header at the
+    start of the stream is decompressed.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it.
+
+    Attributes
+    ----------
+    path : str or None
+        File name, None for in-memory images.
+    shape : tuple of int
+        Image shape.
+    dtype : numpy.dtype
+        On-disk data type.
+    affine : numpy.ndarray
+        4x4 voxel-to-world affine (RAS+).
+    spacing : tuple of float
+        Voxel size along the three spatial axes (mm).
+    origin : numpy.ndarray
+        World coordinates of the first voxel (RAS+).
+    direction : numpy.ndarray
+        3x3 matrix whose columns are the unit directions of the spatial
+        axes (RAS+; ANTs reports the same geometry in LPS+).
+    """
+
+    def __init__(self, img):
+        img = as_image(img)
+        self.path = img.get_filename()
+        self.shape = tuple(int(n) for n in img.shape)
+        self.dtype = np.dtype(img.get_data_dtype())
+        self.affine = np.array(img.affine, dtype=np.float64)
+        linear = self.affine[:3, :3]
+        zooms = np.sqrt((linear ** 2).sum(axis=0))
+        self.spacing = tuple(float(zoom) for zoom in zooms)
+        self.origin = self.affine[:3, 3].copy()
+        self.direction = linear / np.where(zooms > 0, zooms, 1)
+
+    @property
+    def ndim(self):
+        """Number of dimensions."""
+        return len(self.shape)
+
+    @property
+    def n_volumes(self):
+        """Number of volumes along the fourth axis (1 for 3D images)."""
+        return self.shape[3] if len(self.shape) > 3 else 1
+
+    def __repr__(self):
+        spacing = ", ".join(f"{value:.3g}" for value in self.spacing)
+        return f"ImageInfo(shape={self.shape}, dtype={self.dtype}, spacing=({spacing}))"
+
+
+def probe_image(img):
+    """
+    Read the shape, dtype and geometry of an image without its voxel data.
+
+    Parameters
+    ----------
+    img : str, nibabel image or ImageInfo
+        Image or path to it. An ImageInfo is returned unchanged.
+
+    Returns
+    -------
+    ImageInfo
+    """
+    if isinstance(img, ImageInfo):
+        return img
+    return ImageInfo(img)
+
+
+def same_grid(img, other, atol=1e-3):
+    """
+    Whether two images share a voxel grid, compared from their headers.
+
+    The spatial shapes (first three axes) must be equal and the affines
+    equal within atol, so a 4D series and a 3D mask can be on the same grid.
+
+    Parameters
+    ----------
+    img, other : str, nibabel image or ImageInfo
+        Images or paths to them.
+    atol : float, optional
+        Absolute tolerance on the affines (mm), above the float32 rounding
+        of NIfTI header affines. Default: 1e-3.
+
+    Returns
+    -------
+    bool
+    """
+    img, other = probe_image(img), probe_image(other)
+    return img.shape[:3] == other.shape[:3] and np.allclose(img.affine, other.affine, rtol=0, atol=atol)
+
+
+def read_data(img, dtype=DEFAULT_DTYPE):
+    """
+    Read all image data as the given dtype.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it.
+    dtype : numpy dtype, optional
+        Output data type. Default: float32.
+
+    Returns
+    -------
+    numpy.ndarray
+        Scaled image data. The image's data cache is left untouched, so the
+        array is not kept alive by the image object.
+    """
+    img = as_image(img)
+    with io_timer("read", img.get_filename()):
+        if np.issubdtype(dtype, np.floating):
+            return img.get_fdata(dtype=dtype, caching="unchanged")
+        return np.asanyarray(img.dataobj).astype(dtype, copy=False)
+
+
+def _check_volume(index, n_volumes):
+    """Volume index in range(n_volumes); negative indices count from the end."""
+    index = int(index)
+    if not -n_volumes <= index < n_volumes:
+        raise IndexError(f"Volume index {index} is out of range for {n_volumes} volumes")
+    return index % n_volumes
+
+
+def _volume_index(shape, index, axis):
+    """Indexing tuple selecting volume index along axis."""
+    axis %= len(shape)
+    return tuple(index if i == axis else slice(None) for i in range(len(shape)))
+
+
+def read_volume(img, index, axis=3, dtype=DEFAULT_DTYPE):
+    """
+    Read a single volume of a 4D image.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it.
+    index : int
+        Volume index.
+    axis : int, optional
+        Volume axis. Default: 3.
+    dtype : numpy dtype, optional
+        Output data type. Default: float32.
+
+    Returns
+    -------
+    numpy.ndarray
+        The 3D volume.
+    """
+    img = as_image(img)
+    if _is_streamable(img, axis) and is_indexed_gzip(img.dataobj.file_like):
+        # Only the gzip members holding the volume are decompressed
+        raw = [raw for _, raw in iter_raw_volumes(img, [index])][0]
+        return _scaled(raw, img.dataobj, dtype)
+    with io_timer("read", img.get_filename()):
+        return np.asarray(img.dataobj[_volume_index(img.shape, index, axis)]).astype(dtype, copy=False)
+
+
+def read_volumes(img, indices, axis=3, dtype=DEFAULT_DTYPE):
+    """
+    Read a subset of the volumes of a 4D image.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it.
+    indices : sequence of int
+        Volume indices, in output order.
+    axis : int, optional
+        Volume axis. Default: 3.
+    dtype : numpy dtype, optional
+        Output data type. Default: float32.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array with len(indices) volumes along axis.
+    """
+    img = as_image(img)
+    indices = list(indices)
+    shape = list(img.shape)
+    shape[axis] = len(indices)
+    data = np.empty(shape, dtype=dtype)
+
+    wanted = {index: position for position, index in enumerate(indices)}
+    for index, volume in iter_volumes(img, axis=axis, dtype=dtype):
+        if index in wanted:
+            data[_volume_index(shape, wanted[index], axis)] = volume
+    return data
+
+
+def _is_streamable(img, axis=3):
+    """Whether the volumes of img are contiguous blocks of a file on disk."""
+    proxy = img.dataobj
+    return (
+        nib.is_proxy(proxy)
+        and len(img.shape) == 4
+        and axis in (-1, 3)
+        and getattr(proxy, "order", "F") == "F"
+        and hasattr(proxy, "file_like")
+    )
+
+
+def iter_raw_volumes(img, indices=None):
+    """
+    Iterate over volumes of a 4D image file as stored, without scaling.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        4D image on disk with volumes along the last axis.
+    indices : sequence of int, optional
+        Volumes to read, best in increasing order so that gzipped files are
+        decompressed in a single forward pass; negative indices count from
+        the end. Default: all volumes.
+
+    Yields
+    ------
+    tuple
+        (volume index, 3D array in the on-disk dtype). Apply the image's
+        dataobj.slope and dataobj.inter to get intensities.
+
+    Raises
+    ------
+    IndexError
+        If an index is out of range; checked before anything is read.
+    """
+    img = as_image(img)
+    if not _is_streamable(img):
+        raise ValueError("Raw volume streaming needs a 4D image file with volumes along the last axis")
+    proxy = img.dataobj
+    volume_shape = img.shape[:3]
+    volume_bytes = int(np.prod(volume_shape)) * proxy.dtype.itemsize
+    n_volumes = img.shape[3]
+    if indices is None:
+        indices = range(n_volumes)
+    else:
+        indices = [_check_volume(index, n_volumes) for index in indices]
+    if is_indexed_gzip(proxy.file_like):
+        # Decompress the following blocks ahead unless a single volume is read
+        threads = 1 if len(indices) == 1 else gzip_threads()
+        opener = IndexedGzipReader(proxy.file_like, threads=threads)
+    else:
+        opener = ImageOpener(proxy.file_like)
+    # Only the reads are timed, not the caller's work between volumes
+    seconds = 0.0
+    try:
+        with opener as fileobj:
+            for index in indices:
+                start = time.perf_counter()
+                volume = array_from_file(
+                    volume_shape, proxy.dtype, fileobj,
+                    offset=proxy.offset + int(index) * volume_bytes, order="F",
+                )
+                seconds += time.perf_counter() - start
+                yield index, volume
+    finally:
+        log_io("read", img.get_filename(), seconds)
+
+
+def iter_volumes(img, axis=3, dtype=DEFAULT_DTYPE):
+    """
+    Iterate over the volumes of an image.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it. A 3D image yields a single volume.
+    axis : int, optional
+        Volume axis. Default: 3.
+    dtype : numpy dtype, optional
+        Output data type. Default: float32.
+
+    Yields
+    ------
+    tuple
+        (volume index, 3D volume array).
+    """
+    img = as_image(img)
+    if len(img.shape) < 4:
+        yield 0, read_data(img, dtype)
+        return
+
+    if not _is_streamable(img, axis):
+        for index in range(img.shape[axis]):
+            yield index, read_volume(img, index, axis=axis, dtype=dtype)
+        return
+
+    # Fortran-ordered 4D data: every volume is a contiguous block on disk,
+    # so the file is read front to back exactly once
+    for index, raw in iter_raw_volumes(img):
+        yield index, _scaled(raw, img.dataobj, dtype)
+
+
+def _scaled(raw, proxy, dtype):
+    """Apply the proxy's scl_slope / scl_inter to stored values."""
+    volume = raw.astype(dtype)
+    if proxy.slope != 1.0:
+        volume *= proxy.slope
+    if proxy.inter != 0.0:
+        volume += proxy.inter
+    return volume
+
+
+def iter_slabs(img, slab_size=8, axis=2, dtype=DEFAULT_DTYPE):
+    """
+    Iterate over blocks of consecutive slices.
+
+    Each slab holds ``slab_size`` slices along ``axis`` and, for 4D images,
+    all volumes. Only one slab is in memory at a time, which keeps
+    voxel-wise processing (e.g. tensor fitting) bounded in memory. For
+    uncompressed files the slabs come straight from the memory-mapped file.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        Image or path to it.
+    slab_size : int, optional
+        Number of slices per slab. Default: 8.
+    axis : int, optional
+        Spatial axis to split. Default: 2 (z).
+    dtype : numpy dtype, optional
+        Output data type. Default: float32.
+
+    Yields
+    ------
+    tuple
+        (slice object along axis, slab array).
+    """
+    img = as_image(img)
+    seconds = 0.0
+    try:
+        for start in range(0, img.shape[axis], slab_size):
+            slab = slice(start, min(start + slab_size, img.shape[axis]))
+            index = tuple(slab if i == axis else slice(None) for i in range(len(img.shape)))
+            read_start = time.perf_counter()
+            data = np.asarray(img.dataobj[index]).astype(dtype, copy=False)
+            seconds += time.perf_counter() - read_start
+            yield slab, data
+    finally:
+        log_io("read", img.get_filename(), seconds)
+
+
+def save_volumes(img, indices, path, axis=3):
+    """
+    Save selected volumes of a 4D image to a new NIfTI file.
+
+    For NIfTI files on disk the stored values are copied one volume at a
+    time, with the input's data type and scl_slope / scl_inter, so the
+    output holds exactly the input's values and only one volume is in
+    memory. Other images (in-memory data, other layouts) are read as
+    float32 and saved with the input header.
+
+    Parameters
+    ----------
+    img : str or nibabel image
+        4D image or path to it.
+    indices : int or sequence of int
+        Volume index, saved as a 3D image, or indices, saved as a 4D image in
+        the given order. Negative indices count from the end.
+    path : str
+        Output path (.nii or .nii.gz).
+    axis : int, optional
+        Volume axis. Default: 3.
+
+    Returns
+    -------
+    str
+        The output path.
+
+    Raises
+    ------
+    IndexError
+        If an index is out of range; checked before the output is created.
+    """
+    img = as_image(img)
+    single = np.ndim(indices) == 0
+    n_volumes = img.shape[axis]
+    indices = [_check_volume(index, n_volumes) for index in ([indices] if single else indices)]
+    shape = img.shape[:3] if single else img.shape[:3] + (len(indices),)
+
+    streamable = (
+        _is_streamable(img, axis)
+        and isinstance(img, nib.Nifti1Image)
+        and img.header.is_single
+        and str(path).endswith((".nii", ".nii.gz"))
+    )
+    if not streamable:
+        data = read_volume(img, indices[0], axis) if single else read_volumes(img, indices, axis)
+        with io_timer("write", path):
+            save_nifti(nib.Nifti1Image(data, img.affine, img.header), path)
+        return path
+
+    header = img.header.copy()
+    header.set_data_shape(shape)
+    header.set_slope_inter(img.dataobj.slope, img.dataobj.inter)
+    # Let the header place the data right after itself and its extensions
+    header["vox_offset"] = 0
+    seconds = 0.0
+    opener = ParallelGzipWriter(path) if str(path).endswith(".gz") else ImageOpener(path, "wb")
+    with opener as fileobj:
+        header.write_to(fileobj)
+        seek_tell(fileobj, header.get_data_offset(), write0=True)
+        for _, raw in iter_raw_volumes(img, indices):
+            start = time.perf_counter()
+            fileobj.write(np.asarray(raw).tobytes(order="F"))
+            seconds += time.perf_counter() - start
+    log_io("write", path, seconds)
+    return path
+
+
+def output_dtype(data, kind="continuous", header=None, scaled_int16=None):
+    """
+    On-disk data type of a derived image under the output policy.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data to be saved.
+    kind : {'continuous', 'mask', 'labels'}, optional
+        What the data represent. Default: 'continuous'.
+    header : nibabel header, optional
+        Header of the input the data were derived from; its dtype is kept
+        for continuous data (float64 becomes float32).
+    scaled_int16 : bool, optional
+        Store continuous data as int16 with scl_slope/scl_inter.
+        Default: set by the MICAFLOW_SCALED_INT16 environment variable.
+
+    Returns
+    -------
+    numpy.dtype
+    """
+    if kind not in OUTPUT_KINDS:
+        raise ValueError(f"Unknown output kind '{kind}' (choose from {', '.join(OUTPUT_KINDS)})")
+    if kind == "mask":
+        return np.dtype(np.uint8)
+    if kind == "labels":
+        low, high = (data.min(), data.max()) if data.size else (0, 0)
+        for dtype in (np.uint8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return np.dtype(dtype)
+        raise ValueError(f"Labels in [{low}, {high}] do not fit in int32")
+
+    if scaled_int16 is None:
+        scaled_int16 = os.environ.get(SCALED_INT16_ENV, "0") not in ("", "0")
+    if scaled_int16:
+        return np.dtype(np.int16)
+    if header is not None:
+        dtype = header.get_data_dtype()
+    else:
+        dtype = data.dtype
+    if dtype == np.float64 or dtype == bool:
+        return np.dtype(np.float32)
+    return np.dtype(dtype)
+
+
+def save_image(data, affine, path, kind="continuous", header=None, scaled_int16=None,
+               threads=None):
+    """
+    Save a derived image with the output dtype policy (see output_dtype).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Image data.
+    affine : numpy.ndarray
+        4x4 voxel-to-world affine.
+    path : str
+        Output path.
+    kind : {'continuous', 'mask', 'labels'}, optional
+        What the data represent. Masks are saved as data != 0 and label maps
+        are rounded to integers. Default: 'continuous'.
+    header : nibabel header, optional
+        Header of the input the data were derived from. Its metadata and,
+        for continuous data, its dtype are kept.
+    scaled_int16 : bool, optional
+        Store continuous data as int16 with scl_slope/scl_inter. Default: set
+        by the MICAFLOW_SCALED_INT16 environment variable.
+    threads : int, optional
+        Compression threads. Default: see util_gzip.gzip_threads().
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    img = _policy_image(data, affine, kind, header, scaled_int16)
+    with io_timer("write", path):
+        save_nifti(img, path, threads)
+    return path
+
+
+def _policy_image(data, affine, kind="continuous", header=None, scaled_int16=None):
+    """NIfTI image of data cast to its output dtype (see save_image)."""
+    data = np.asanyarray(data)
+    dtype = output_dtype(data, kind, header, scaled_int16)
+    if kind == "mask":
+        data = (data != 0).astype(dtype)
+    elif kind == "labels":
+        data = np.rint(data).astype(dtype) if data.dtype.kind == "f" else data.astype(dtype, copy=False)
+    elif dtype.kind == "f":
+        data = data.astype(dtype, copy=False)
+    # Float data stored as integers are scaled by nibabel (scl_slope/scl_inter)
+    img = nib.Nifti1Image(data, affine, header)
+    img.set_data_dtype(dtype)
+    return img
+
+
+def save_labels(path, threads=None):
+    """
+    Rewrite a mask or label map that another tool saved as floats.
+
+    Parameters
+    ----------
+    path : str
+        Label map to convert in place; integer files are left as they are.
+    threads : int, optional
+        Compression threads. Default: see util_gzip.gzip_threads().
+
+    Returns
+    -------
+    str
+        The path.
+    """
+    if probe_image(path).dtype.kind != "f":
+        return path
+    with io_timer("read", path):
+        img = nib.load(path)
+        data = img.get_fdata(dtype=np.float32)
+    return save_image(data, img.affine, path, kind="labels", header=img.header, threads=threads)
+
+
+def save_nifti(img, path, threads=None):
+    """
+    Save a NIfTI image, compressing .nii.gz files in parallel threads.
+
+    Parameters
+    ----------
+    img : nibabel.Nifti1Image
+        Image to save (other image types are saved with nib.save).
+    path : str
+        Output path.
+    threads : int, optional
+        Compression threads. Default: see util_gzip.gzip_threads().
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    path = str(path)
+    if not (path.endswith(".nii.gz") and isinstance(img, nib.Nifti1Image)):
+        nib.save(img, path)
+        return path
+    with ParallelGzipWriter(path, threads) as fileobj:
+        img.to_file_map({"image": FileHolder(fileobj=fileobj)})
+    return path
+
+
+def save_ants_image(image, path, threads=None, kind="continuous"):
+    """
+    Save an ANTs image, compressing .nii.gz files in parallel threads.
+
+    ITK deflates in a single thread, so the image is written uncompressed
+    next to the output and then compressed with ParallelGzipWriter. ANTs
+    only stores masks and label maps as float or unsigned types, so those
+    are converted to nibabel and saved with the output dtype policy.
+
+    Parameters
+    ----------
+    image : ants.ANTsImage
+        Image to save.
+    path : str
+        Output path.
+    threads : int, optional
+        Compression threads. Default: see util_gzip.gzip_threads().
+    kind : {'continuous', 'mask', 'labels'}, optional
+        What the data represent (see save_image). Default: 'continuous'.
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    path = str(path)
+    if kind != "continuous":
+        img = ants.to_nibabel_nifti(image)
+        return save_nifti(_policy_image(img.dataobj, img.affine, kind, img.header), path, threads)
+    if not path.endswith(".nii.gz"):
+        image.to_file(path)
+        return path
+    fd, uncompressed = tempfile.mkstemp(suffix=".nii", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        image.to_file(uncompressed)
+        gzip_file(uncompressed, path, threads)
+    finally:
+        os.remove(uncompressed)
+    return path
@@ -0,0 +1,172 @@
+"""
+util_patch2self - Native OLS Patch2Self denoising
+
+Patch2Self (Fadnavis et al., 2020) denoises every volume of a DWI series by
+regressing it on all other volumes of the same group (b0 or diffusion
+weighted), voxel by voxel. With DIPY's default patch radius of 0 and the OLS
+model, each held-out fit is a linear regression with intercept on the
+remaining volumes. The fits differ only in which volume is held out.
+
+All of them follow from one matrix. Let C be the centered Gram matrix of
+the group's volumes (n x n) and P = (C + alpha I)^-1. The regression of
+volume j on the others has the coefficients
+
+    beta_ij = -P_ij / P_jj        (i != j)
+
+This is the block (Schur complement) solve of the held-out system, and it
+is exact also with DIPY's ridge term alpha = 1e-10. The whole group is then
+denoised with one matrix product:
+
+    denoised = (X - mean) @ B + mean,   B_ij = beta_ij, B_jj = 0
+
+The Gram matrix is accumulated in float64 from float32 voxel chunks. The
+prediction runs in float32, in chunks of voxels, with the BLAS thread count
+set by ``threads``. The output matches DIPY's version 1 (patch_radius=0,
+model="ols") to float32 precision, including its intercepts: sklearn's
+Ridge(copy_X=False) centers the training data in place, and DIPY then
+predicts from the centered data, which lowers every predicted volume by
+mean @ B_j. ``dipy_intercept=False`` opts out of this and gives the plain
+least-squares predictions above. DIPY's shift_intensity post-processing
+needs no counterpart: the per-volume shift it computes is
+min(denoised) - min(denoised), i.e. zero (DIPY 1.12). DIPY's version 3 fits
+the same models on a random count-sketch of the voxels and is therefore only
+close to it.
+
+>>> from micaflow.scripts.util_patch2self import patch2self_ols
+>>> denoised = patch2self_ols(dwi_data, bvals, b0_threshold=50, threads=4)
+"""
+
+import numpy as np
+
+# Ridge penalty DIPY uses for its "ols" model (sklearn Ridge with alpha=1e-10)
+OLS_ALPHA = 1e-10
+
+# Voxels per chunk when accumulating the Gram matrix and predicting
+CHUNK_VOXELS = 1 << 16
+
+
+def _blas_threads(threads):
+    """Context manager limiting BLAS threads, if threadpoolctl is available."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        import contextlib
+        return contextlib.nullcontext()
+    return threadpool_limits(limits=threads, user_api="blas")
+
+
+def loo_coefficients(X, alpha=OLS_ALPHA, chunk_voxels=CHUNK_VOXELS, dipy_intercept=False):
+    """
+    Leave-one-out regression coefficients of every column on all others.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        (n_voxels, n_volumes) data of one volume group.
+    alpha : float, optional
+        Ridge penalty. Default: 1e-10 (DIPY's OLS).
+    chunk_voxels : int, optional
+        Voxels per chunk for the float64 Gram accumulation.
+    dipy_intercept : bool, optional
+        Return the intercepts DIPY's predictions effectively use (lower by
+        mean @ B) instead of the least-squares ones. Default: False.
+
+    Returns
+    -------
+    tuple
+        (B, intercept): B is (n_volumes, n_volumes) with a zero diagonal,
+        column j holding the coefficients of volume j; intercept is
+        (n_volumes,). The prediction of volume j is X @ B[:, j] + intercept[j].
+    """
+    n_voxels, n = X.shape
+    mean = np.zeros(n)
+    for start in range(0, n_voxels, chunk_voxels):
+        mean += X[start:start + chunk_voxels].sum(axis=0, dtype=np.float64)
+    mean /= n_voxels
+
+    gram = np.zeros((n, n))
+    for start in range(0, n_voxels, chunk_voxels):
+        chunk = X[start:start + chunk_voxels].astype(np.float64) - mean
+        gram += chunk.T @ chunk
+
+    precision = np.linalg.pinv(gram + alpha * np.eye(n), hermitian=True)
+    B = -precision / np.diag(precision)
+    np.fill_diagonal(B, 0)
+    intercept = mean - mean @ B
+    if dipy_intercept:
+        intercept -= mean @ B
+    return B, intercept
+
+
+def patch2self_ols(data, bvals, b0_threshold=50, b0_denoising=False, alpha=OLS_ALPHA,
+                   chunk_voxels=CHUNK_VOXELS, threads=1, dipy_intercept=True,
+                   clip_negative_vals=False):
+    """
+    Denoise a 4D DWI series with OLS Patch2Self (patch radius 0).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        4D series (x, y, z, volumes). Fortran-ordered data (as read by
+        nibabel) is used without a copy.
+    bvals : array-like
+        b-value of every volume.
+    b0_threshold : float, optional
+        Volumes with b <= b0_threshold form the b0 group. Default: 50.
+    b0_denoising : bool, optional
+        Denoise the b0 group as well (needs at least two b0 volumes);
+        otherwise b0 volumes are copied unchanged. Default: False.
+    alpha : float, optional
+        Ridge penalty. Default: 1e-10 (DIPY's OLS).
+    chunk_voxels : int, optional
+        Voxels processed per chunk, bounding temporary memory.
+    threads : int, optional
+        BLAS threads for the prediction products. Default: 1.
+    dipy_intercept : bool, optional
+        Reproduce DIPY's output, whose predicted volumes are offset by a
+        constant each (see the module notes). False gives the least-squares
+        predictions. Default: True.
+    clip_negative_vals : bool, optional
+        Set negative denoised values to 0, as DIPY's option of the same
+        name. Default: False.
+
+    Returns
+    -------
+    numpy.ndarray
+        Float32 denoised series with the shape of data.
+    """
+    if data.ndim != 4:
+        raise ValueError(f"Patch2Self needs a 4D series, got shape {data.shape}")
+    bvals = np.asarray(bvals).ravel()
+    if bvals.size != data.shape[3]:
+        raise ValueError(f"{bvals.size} b-values for {data.shape[3]} volumes")
+
+    n_volumes = data.shape[3]
+    source = data.reshape(-1, n_volumes, order="F")
+    out = np.empty(data.shape, dtype=np.float32, order="F")
+    target = out.reshape(-1, n_volumes, order="F")
+
+    b0_idx = np.flatnonzero(bvals <= b0_threshold)
+    dwi_idx = np.flatnonzero(bvals > b0_threshold)
+    groups = [dwi_idx]
+    if b0_denoising and b0_idx.size > 1:
+        groups.append(b0_idx)
+    else:
+        target[:, b0_idx] = source[:, b0_idx]
+
+    with _blas_threads(threads):
+        for idx in groups:
+            if idx.size < 2:
+                # Nothing to regress on
+                target[:, idx] = source[:, idx]
+                continue
+            X = source[:, idx].astype(np.float32, copy=False)
+            B, intercept = loo_coefficients(X, alpha, chunk_voxels, dipy_intercept)
+            B = B.astype(np.float32)
+            intercept = intercept.astype(np.float32)
+            for start in range(0, X.shape[0], chunk_voxels):
+                rows = slice(start, start + chunk_voxels)
+                target[rows, idx] = X[rows] @ B + intercept
+    if clip_negative_vals:
+        out.clip(min=0, out=out)
+    return out
@@ -0,0 +1,151 @@
+"""
+util_tensor_fit - Chunked diffusion tensor fitting with several metrics per pass
+
+Fits DIPY's TensorModel to a (n_voxels, n_volumes) voxel list (see
+util_voxel_list) in chunks of voxels, optionally in worker processes, and
+derives any set of tensor metrics from the same fit, so that AD, RD or the
+eigenvectors do not require a second fit:
+
+- fa     : fractional anisotropy
+- md     : mean diffusivity (mm²/s)
+- ad     : axial diffusivity, the largest eigenvalue
+- rd     : radial diffusivity, the mean of the two smaller eigenvalues
+- mode   : tensor mode (-1 planar, 0 orthotropic, 1 linear)
+- v1     : principal eigenvector (3 components)
+- tensor : the 6 unique tensor elements in lower-triangular order
+           (Dxx, Dxy, Dyy, Dxz, Dyz, Dzz), as in DIPY and NIfTI
+
+Chunks bound the fit's temporary memory, which is several times the data
+size, and are the unit of work for the process pool. Workers are started
+with the "spawn" method, as in motion_correction, and are limited to one
+BLAS thread each.
+
+>>> from micaflow.scripts.util_tensor_fit import fit_tensor_metrics
+>>> maps = fit_tensor_metrics(X, gtab, ("fa", "md", "v1"), fit_method="ols", workers=4)
+>>> maps["v1"].shape
+(n_voxels, 3)
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+METRICS = ("fa", "md", "ad", "rd", "mode", "v1", "tensor")
+
+# DIPY's names for the supported fit methods
+FIT_METHODS = {"ols": "OLS", "wls": "WLS"}
+
+# Voxels per chunk; the WLS fit needs a few (n_volumes x 7) matrices per voxel
+CHUNK_VOXELS = 1 << 14
+
+
+def _init_worker():
+    """Limit each worker to one BLAS thread; the pool provides the parallelism."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=1, user_api="blas")
+
+
+def fit_chunk(data, gtab, metrics=("fa", "md"), fit_method="wls"):
+    """
+    Fit the tensor model to a block of voxels and compute its metrics.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        (n_voxels, n_volumes) signal.
+    gtab : dipy.core.gradients.GradientTable
+        Gradient table of the volumes.
+    metrics : sequence of str, optional
+        Names from METRICS. Default: ('fa', 'md').
+    fit_method : {'wls', 'ols'}, optional
+        Weighted or ordinary least squares. Default: 'wls'.
+
+    Returns
+    -------
+    dict
+        Metric name -> float32 array of shape (n_voxels,) or (n_voxels, k).
+    """
+    from dipy.reconst.dti import TensorModel, lower_triangular
+
+    tensor_fit = TensorModel(gtab, fit_method=FIT_METHODS[fit_method]).fit(data)
+    maps = {}
+    for name in metrics:
+        if name == "v1":
+            value = tensor_fit.evecs[..., 0]
+        elif name == "tensor":
+            value = lower_triangular(tensor_fit.quadratic_form)
+        else:
+            value = getattr(tensor_fit, name)
+        maps[name] = np.asarray(value, dtype=np.float32)
+    return maps
+
+
+def fit_tensor_metrics(data, gtab, metrics=("fa", "md"), fit_method="wls", workers=1,
+                       chunk_voxels=CHUNK_VOXELS):
+    """
+    Fit the tensor model chunk by chunk and collect the requested metrics.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        (n_voxels, n_volumes) signal, e.g. VoxelList.gather() of a DWI series.
+    gtab : dipy.core.gradients.GradientTable
+        Gradient table of the volumes.
+    metrics : sequence of str, optional
+        Names from METRICS. Default: ('fa', 'md').
+    fit_method : {'wls', 'ols'}, optional
+        Weighted least squares (DIPY's default, more accurate at low SNR) or
+        ordinary least squares (a single linear solve, faster). Default: 'wls'.
+    workers : int, optional
+        Number of worker processes. With 1 (default) the chunks are fitted in
+        the calling process.
+    chunk_voxels : int, optional
+        Voxels per chunk. Default: 16384.
+
+    Returns
+    -------
+    dict
+        Metric name -> float32 array of shape (n_voxels,) or (n_voxels, k).
+    """
+    metrics = tuple(metrics)
+    unknown = [name for name in metrics if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown tensor metrics {unknown} (choose from {', '.join(METRICS)})")
+    if fit_method not in FIT_METHODS:
+        raise ValueError(f"Unknown fit method '{fit_method}' (use {' or '.join(FIT_METHODS)})")
+    if data.ndim != 2:
+        raise ValueError(f"Expected (n_voxels, n_volumes) data, got shape {data.shape}")
+
+    n_voxels = data.shape[0]
+    starts = range(0, n_voxels, chunk_voxels)
+    chunks = (data[start:start + chunk_voxels] for start in starts)
+    maps = {}
+
+    def collect(start, chunk_maps):
+        for name, value in chunk_maps.items():
+            if name not in maps:
+                maps[name] = np.empty((n_voxels,) + value.shape[1:], dtype=np.float32)
+            maps[name][start:start + len(value)] = value
+
+    if workers <= 1 or n_voxels <= chunk_voxels:
+        for start, chunk in zip(starts, chunks):
+            collect(start, fit_chunk(chunk, gtab, metrics, fit_method))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            futures = [executor.submit(fit_chunk, chunk, gtab, metrics, fit_method) for chunk in chunks]
+            for start, future in zip(starts, futures):
+                collect(start, future.result())
+
+    if n_voxels == 0:
+        # DIPY cannot fit an empty array; take the shapes from a single voxel
+        probe = fit_chunk(np.ones((1, data.shape[1])), gtab, metrics, fit_method)
+        maps = {name: value[:0] for name, value in probe.items()}
+    return maps
@@ -0,0 +1,106 @@
+"""
+util_voxel_list - In-mask voxels of a DWI series as a compact matrix
+
+Voxel-wise models (tensor fitting, Patch2Self regression) only need the
+voxels inside the brain, and a typical DWI field of view is 60-70%
+background. VoxelList gathers the in-mask voxels of a 3D or 4D image into a
+(n_voxels, n_volumes) float32 matrix, so that models run on brain voxels
+only and no masked 4D copy of the series is made. Results are scattered
+back onto the image grid afterwards, either into a new array filled with a
+constant or into an existing array whose background is left untouched.
+
+>>> from micaflow.scripts.util_voxel_list import VoxelList
+>>> voxels = VoxelList(mask_data > 0)
+>>> X = voxels.gather(dwi_data)             # (n_voxels, n_volumes) float32
+>>> fa = voxels.scatter(fit(X).fa)          # 3D map, 0 outside the mask
+>>> voxels.scatter(denoise(X), out=dwi_data)  # overwrite in-mask voxels only
+"""
+
+import numpy as np
+
+
+class VoxelList:
+    """
+    Gather and scatter the voxels selected by a 3D mask.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        3D mask (a trailing axis of length 1 is dropped). Non-zero voxels are
+        selected, in the Fortran (NIfTI) order of the grid.
+    """
+
+    def __init__(self, mask):
+        mask = np.asarray(mask)
+        if mask.ndim == 4 and mask.shape[3] == 1:
+            mask = mask[..., 0]
+        if mask.ndim != 3:
+            raise ValueError(f"Mask must be 3D, got shape {mask.shape}")
+        self.shape = mask.shape
+        self.index = np.flatnonzero(mask.ravel(order="F"))
+        self.coords = np.unravel_index(self.index, self.shape, order="F")
+
+    @property
+    def n_voxels(self):
+        """Number of selected voxels."""
+        return self.index.size
+
+    @property
+    def fraction(self):
+        """Fraction of the grid that is selected."""
+        return self.index.size / max(int(np.prod(self.shape)), 1)
+
+    def _check(self, shape):
+        if tuple(shape[:3]) != self.shape:
+            raise ValueError(f"Image shape {tuple(shape)} does not match the mask {self.shape}")
+
+    def gather(self, data, dtype=np.float32):
+        """
+        Collect the selected voxels of a 3D or 4D image.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            3D image or 4D series on the mask's grid.
+        dtype : numpy dtype, optional
+            Output data type. Default: float32.
+
+        Returns
+        -------
+        numpy.ndarray
+            (n_voxels,) for 3D data, (n_voxels, n_volumes) for 4D data.
+        """
+        self._check(data.shape)
+        return data[self.coords].astype(dtype, copy=False)
+
+    def scatter(self, values, fill=0, dtype=None, out=None):
+        """
+        Place per-voxel values back onto the image grid.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            (n_voxels,) or (n_voxels, ...) values, in the order of gather().
+        fill : scalar, optional
+            Value of the unselected voxels of a new array. Default: 0.
+        dtype : numpy dtype, optional
+            Data type of a new array. Default: the dtype of values.
+        out : numpy.ndarray, optional
+            Existing array to write the selected voxels into; its other
+            voxels are left unchanged. fill and dtype are then ignored.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape mask.shape + values.shape[1:].
+        """
+        values = np.asarray(values)
+        if values.shape[0] != self.n_voxels:
+            raise ValueError(f"{values.shape[0]} values for {self.n_voxels} voxels")
+        if out is None:
+            out = np.full(self.shape + values.shape[1:], fill,
+                          dtype=dtype or values.dtype, order="F")
+        else:
+            self._check(out.shape)
+        out[self.coords] = values
+        return out
@@ -1,10 +1,11 @@
 import os
+import json
 import sys
 import pytest
 from unittest.mock import patch, MagicMock
 import subprocess
 # Import the CLI main function
-from micaflow.cli import main as cli_main
+from micaflow.cli import main as cli_main, run_script, run_subject_pipelines
 
 # List of all available commands in the micaflow CLI
 COMMANDS = [
@@ -36,8 +37,10 @@ def test_help_display(command, capsys):
     assert "Help" or "Required models" in out
 
 @pytest.fixture
-def mock_subprocess_run():
+def mock_subprocess_run(monkeypatch):
     """Fixture to mock subprocess.run calls."""
+    # Module commands run in-process by default; force the subprocess path
+    monkeypatch.setenv("MICAFLOW_DISPATCH", "subprocess")
     with patch("subprocess.run") as mock_run:
         mock_process = MagicMock()
         mock_process.returncode = 0
@@ -103,6 +106,56 @@ def test_command_with_optional_flags(command, args, optional_flag, mock_subproce
     assert mock_subprocess_run.call_count == 1
     assert optional_flag in mock_subprocess_run.call_args[0][0]
 
+def test_run_script_in_process(monkeypatch):
+    """Test that module commands call the script's main() without a subprocess."""
+    monkeypatch.delenv("MICAFLOW_DISPATCH", raising=False)
+    fake_script = MagicMock()
+    with patch("importlib.import_module", return_value=fake_script) as mock_import, \
+            patch("subprocess.run") as mock_run:
+        run_script("micaflow.scripts.bet", ["--input", "t1w.nii.gz"])
+
+    mock_import.assert_any_call("micaflow.scripts.bet")
+    fake_script.main.assert_called_once_with(["--input", "t1w.nii.gz"])
+    assert mock_run.call_count == 0
+
+@pytest.mark.parametrize("exit_code,should_raise", [(0, False), (None, False), (1, True), (2, True)])
+def test_run_script_exit_codes(exit_code, should_raise, monkeypatch):
+    """Test that a script's sys.exit status is reported like a failed subprocess."""
+    monkeypatch.delenv("MICAFLOW_DISPATCH", raising=False)
+    fake_script = MagicMock()
+    fake_script.main.side_effect = SystemExit(exit_code)
+    with patch("importlib.import_module", return_value=fake_script):
+        if should_raise:
+            with pytest.raises(subprocess.CalledProcessError) as excinfo:
+                run_script("micaflow.scripts.normalize", ["--input", "img.nii.gz"])
+            assert excinfo.value.returncode == exit_code
+        else:
+            run_script("micaflow.scripts.normalize", ["--input", "img.nii.gz"])
+
+def test_run_script_exception(monkeypatch):
+    """Test that an exception raised by a script is reported like a failed subprocess."""
+    monkeypatch.delenv("MICAFLOW_DISPATCH", raising=False)
+    fake_script = MagicMock()
+    fake_script.main.side_effect = FileNotFoundError("t1w.nii.gz")
+    with patch("importlib.import_module", return_value=fake_script):
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            run_script("micaflow.scripts.bet", ["--input", "t1w.nii.gz"])
+    assert excinfo.value.returncode == 1
+    assert isinstance(excinfo.value.__cause__, FileNotFoundError)
+
+def test_run_script_restores_argv(monkeypatch):
+    """Test that sys.argv is swapped for the script and restored afterwards."""
+    monkeypatch.delenv("MICAFLOW_DISPATCH", raising=False)
+    seen_argv = []
+    fake_script = MagicMock()
+    fake_script.main.side_effect = lambda argv: seen_argv.append(list(sys.argv))
+    original_argv = list(sys.argv)
+    with patch("importlib.import_module", return_value=fake_script):
+        run_script("micaflow.scripts.motion_correction", ["--threads", "4"])
+
+    assert seen_argv == [["micaflow.scripts.motion_correction", "--threads", "4"]]
+    assert sys.argv == original_argv
+
 def test_pipeline_defaults(mock_subprocess_run):
     """Test that the pipeline command accepts the required arguments."""
     with patch("sys.argv", [
@@ -159,4 +212,93 @@ def test_pipeline_with_dwi(mock_subprocess_run):
     assert "--dwi-file" in mock_subprocess_run.call_args[0][0]
     assert "--bval-file" in mock_subprocess_run.call_args[0][0]
     assert "--bvec-file" in mock_subprocess_run.call_args[0][0]
-    assert "--inverse-dwi-file" in mock_subprocess_run.call_args[0][0]
\ No newline at end of file
+    assert "--inverse-dwi-file" in mock_subprocess_run.call_args[0][0]
+
+def test_run_subject_pipelines_parallel(capsys):
+    """Test that concurrent subject pipelines report status and prefix their output."""
+    jobs = [
+        {"label": "sub-01", "cmd": [sys.executable, "-c", "print('hello from 01')"]},
+        {"label": "sub-02", "cmd": [sys.executable, "-c", "import sys; sys.exit(3)"]},
+        {"label": "sub-03", "cmd": [sys.executable, "-c", "print('hello from 03')"]},
+    ]
+
+    results = list(run_subject_pipelines(jobs, parallel_subjects=2))
+
+    statuses = {job["label"]: status for job, status, _, _, _ in results}
+    assert statuses == {"sub-01": "success", "sub-02": "failed", "sub-03": "success"}
+    out, _ = capsys.readouterr()
+    assert "[sub-01] hello from 01" in out
+    assert "[sub-03] hello from 03" in out
+    assert "[3/3]" in out
+
+@pytest.mark.parametrize("parallel_subjects", [1, 2])
+def test_run_subject_pipelines_isolates_errors(parallel_subjects):
+    """Test that a job that cannot start is reported as failed without stopping the others."""
+    jobs = [
+        {"label": "sub-01", "cmd": ["/nonexistent/micaflow", "pipeline"]},
+        {"label": "sub-02", "cmd": [sys.executable, "-c", "print('hello from 02')"]},
+    ]
+
+    results = {job["label"]: (status, error) for job, status, error, _, _
+               in run_subject_pipelines(jobs, parallel_subjects=parallel_subjects)}
+
+    assert results["sub-01"][0] == "failed"
+    assert results["sub-01"][1].startswith("FileNotFoundError")
+    assert results["sub-02"] == ("success", None)
+
+def test_bids_total_cores_split_between_subjects(tmp_path, capsys):
+    """Test that --total-cores is divided between --parallel-subjects pipelines."""
+    for sub in ["sub-01", "sub-02"]:
+        anat = tmp_path / "bids" / sub / "anat"
+        anat.mkdir(parents=True)
+        (anat / f"{sub}_T1w.nii.gz").touch()
+
+    cmd = [
+        "micaflow", "bids",
+        "--bids-dir", str(tmp_path / "bids"),
+        "--output-dir", str(tmp_path / "derivatives"),
+        "--parallel-subjects", "2",
+        "--total-cores", "8",
+        "--dry-run"
+    ]
+    with patch("sys.argv", cmd), patch("micaflow.cli.check_and_download_models"):
+        cli_main()
+
+    out, _ = capsys.readouterr()
+    dry_runs = [line for line in out.splitlines() if line.startswith("Dry run:")]
+    assert len(dry_runs) == 2
+    assert all("--cores 4" in line for line in dry_runs)
+
+def test_bids_single_dag_writes_manifest(tmp_path):
+    """Test that --single-dag runs one snakemake process over a subject manifest."""
+    for sub in ["sub-01", "sub-02"]:
+        anat = tmp_path / "bids" / sub / "ses-01" / "anat"
+        anat.mkdir(parents=True)
+        (anat / f"{sub}_ses-01_T1w.nii.gz").touch()
+
+    output_dir = tmp_path / "derivatives"
+    cmd = [
+        "micaflow", "bids",
+        "--bids-dir", str(tmp_path / "bids"),
+        "--output-dir", str(output_dir),
+        "--single-dag",
+        "--parallel-subjects", "2",
+        "--total-cores", "8"
+    ]
+    with patch("sys.argv", cmd), patch("micaflow.cli.check_and_download_models"), \
+         patch("micaflow.cli.subprocess.run") as mock_run:
+        cli_main()
+
+    mock_run.assert_called_once()
+    snakemake_cmd = mock_run.call_args[0][0]
+    assert snakemake_cmd[2].endswith("Snakefile_multi")
+    assert "subject_threads=4" in snakemake_cmd
+    assert snakemake_cmd[snakemake_cmd.index("--cores") + 1] == "8"
+
+    manifest = (output_dir / "micaflow_subjects.tsv").read_text().splitlines()
+    assert manifest[0].split("\t")[:3] == ["subject", "session", "t1w_file"]
+    assert sorted(row.split("\t")[0] for row in manifest[1:]) == ["sub-01", "sub-02"]
+
+    with open(output_dir / "micaflow_runs_summary.json") as f:
+        summary = json.load(f)
+    assert [run["status"] for run in summary] == ["success", "success"]
@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+import numpy as np
+import nibabel as nib
+from unittest.mock import patch, MagicMock
+
+from micaflow.cli import run_script
+from micaflow import daemon as micaflow_daemon
+from micaflow.daemon import get_socket_path, private_dir, submit_job
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="micaflow serve requires fork")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    """Start a micaflow daemon without preloading and yield its socket path."""
+    socket_path = str(tmp_path / "micaflow.sock")
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    proc = subprocess.Popen(
+        [sys.executable, "-c",
+         f"from micaflow.daemon import serve; serve({socket_path!r}, preload_modules=False)"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None or time.time() > deadline:
+            proc.kill()
+            pytest.fail("micaflow daemon did not start")
+        time.sleep(0.05)
+    yield socket_path
+    proc.terminate()
+    proc.wait(timeout=30)
+    assert not os.path.exists(socket_path)
+
+def test_submit_job_without_daemon(tmp_path):
+    """Test that submit_job reports a missing daemon instead of failing."""
+    assert submit_job("micaflow.scripts.normalize", ["--help"], str(tmp_path / "none.sock")) is None
+
+def test_daemon_runs_job_in_client_cwd(daemon, tmp_path, monkeypatch):
+    """Test that a job runs with the client's working directory and reports success."""
+    data = np.random.default_rng(0).random((8, 8, 8)).astype(np.float32)
+    nib.save(nib.Nifti1Image(data, np.eye(4)), str(tmp_path / "t1w.nii.gz"))
+    monkeypatch.chdir(tmp_path)
+
+    returncode = submit_job(
+        "micaflow.scripts.normalize", ["--input", "t1w.nii.gz", "--output", "norm.nii.gz"], daemon
+    )
+
+    assert returncode == 0
+    assert (tmp_path / "norm.nii.gz").exists()
+
+def test_daemon_reports_job_failure(daemon, tmp_path, monkeypatch):
+    """Test that a script's non-zero exit status is returned to the client."""
+    monkeypatch.chdir(tmp_path)
+    returncode = submit_job(
+        "micaflow.scripts.normalize", ["--input", "missing.nii.gz", "--output", "x.nii.gz"], daemon
+    )
+    assert returncode == 1
+
+def test_client_refuses_socket_of_another_user(daemon, tmp_path, monkeypatch, capsys):
+    """Test that nothing is sent to a socket held by another user."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(micaflow_daemon, "peer_uid", lambda sock: os.getuid() + 1)
+    returncode = submit_job(
+        "micaflow.scripts.normalize", ["--input", "missing.nii.gz", "--output", "x.nii.gz"], daemon
+    )
+    assert returncode is None
+    assert "another user" in capsys.readouterr().err
+
+def test_default_socket_path(tmp_path, monkeypatch):
+    """Test that the default socket lives in the runtime dir or a per-user directory."""
+    monkeypatch.delenv("MICAFLOW_DAEMON_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert get_socket_path() == str(tmp_path / "micaflow.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert os.path.basename(os.path.dirname(get_socket_path())) == f"micaflow-{os.getuid()}"
+
+def test_private_dir(tmp_path):
+    """Test that the socket directory is created 0700 and open directories are refused."""
+    private_dir(str(tmp_path / "sockets"), create=True)
+    assert (tmp_path / "sockets").stat().st_mode & 0o777 == 0o700
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared").chmod(0o777)
+    with pytest.raises(RuntimeError):
+        private_dir(str(tmp_path / "shared"))
+    (tmp_path / "link").symlink_to(tmp_path / "sockets")
+    with pytest.raises(RuntimeError):
+        private_dir(str(tmp_path / "link"))
+
+def test_daemon_rejects_unknown_modules(daemon):
+    """Test that only micaflow script modules can be run through the daemon."""
+    assert submit_job("os", ["--help"], daemon) == 1
+
+def test_job_threads():
+    """Test that a job's thread budget comes from --threads, else OMP_NUM_THREADS."""
+    job = {"args": ["--input", "x", "--threads", "3"], "env": {"OMP_NUM_THREADS": "8"}}
+    assert micaflow_daemon.job_threads(job) == 3
+    assert micaflow_daemon.job_threads({"args": [], "env": {"OMP_NUM_THREADS": "8"}}) == 8
+    assert micaflow_daemon.job_threads({"args": ["--threads"], "env": {}}) is None
+
+def test_limit_threads_after_fork():
+    """Test that a forked job resizes the pools its parent already created."""
+    torch = pytest.importorskip("torch")
+    threadpoolctl = pytest.importorskip("threadpoolctl")
+    torch.set_num_threads(4)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        micaflow_daemon.limit_threads(2)
+        blas = {info["num_threads"] for info in threadpoolctl.threadpool_info()}
+        ok = torch.get_num_threads() == 2 and blas <= {2} and os.environ["OMP_NUM_THREADS"] == "2"
+        os.write(write, b"1" if ok else b"0")
+        os._exit(0)
+    os.close(write)
+    result = os.read(read, 1)
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert result == b"1"
+    assert torch.get_num_threads() == 4
+
+def test_silent_client_does_not_block_daemon(daemon, tmp_path, monkeypatch):
+    """Test that a client that connects and sends nothing times out."""
+    import socket
+
+    monkeypatch.chdir(tmp_path)
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    silent.connect(daemon)
+    try:
+        start = time.time()
+        returncode = submit_job(
+            "micaflow.scripts.normalize", ["--input", "missing.nii.gz", "--output", "x.nii.gz"], daemon
+        )
+        assert returncode == 1
+        assert time.time() - start < micaflow_daemon.REQUEST_TIMEOUT + 20
+        assert b"returncode" in silent.recv(4096)
+    finally:
+        silent.close()
+
+def test_via_daemon_falls_back_to_local_run(tmp_path, monkeypatch):
+    """Test that daemon dispatch runs the script locally when no daemon is listening."""
+    monkeypatch.setenv("MICAFLOW_DISPATCH", "daemon")
+    monkeypatch.setenv("MICAFLOW_DAEMON_SOCKET", str(tmp_path / "none.sock"))
+    fake_script = MagicMock()
+    with patch("importlib.import_module", return_value=fake_script):
+        run_script("micaflow.scripts.bet", ["--input", "t1w.nii.gz"])
+    fake_script.main.assert_called_once_with(["--input", "t1w.nii.gz"])
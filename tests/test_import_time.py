@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+
+from micaflow.cli import SCRIPT_MODULES
+
+# Dependencies that must only be imported once a command starts processing
+HEAVY_MODULES = ["ants", "torch", "tensorflow", "dipy", "nilearn", "lamareg", "EPI_MRI"]
+
+# Wall-clock budget for `micaflow bet --help`, including interpreter start-up
+BET_HELP_BUDGET_SECONDS = 1.5
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(args, **kwargs):
+    """Run a fresh interpreter from the repository root."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return subprocess.run(
+        [sys.executable] + args, cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, timeout=60, **kwargs
+    )
+
+
+def slowest_imports(importtime_log, count=10):
+    """Return the `count` largest cumulative entries of a -X importtime log."""
+    entries = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative_us), name.strip()))
+    entries.sort(reverse=True)
+    return "\n".join(f"{us / 1e6:8.3f}s  {name}" for us, name in entries[:count])
+
+
+@pytest.mark.parametrize("module_name", sorted(set(SCRIPT_MODULES.values())))
+def test_script_import_is_lightweight(module_name):
+    """Test that importing a script does not import any heavy dependency."""
+    code = (
+        f"import sys, {module_name}\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = run_python(["-c", code])
+    assert result.returncode == 0, result.stderr
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    assert loaded == [], f"{module_name} imports {loaded} at module level"
+
+
+def test_bet_help_within_budget():
+    """Test that `micaflow bet --help` stays within its wall-clock budget."""
+    start = time.perf_counter()
+    result = run_python(["-m", "micaflow.cli", "bet", "--help"])
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+
+    if elapsed > BET_HELP_BUDGET_SECONDS:
+        profile = run_python(["-X", "importtime", "-m", "micaflow.cli", "bet", "--help"])
+        pytest.fail(
+            f"`micaflow bet --help` took {elapsed:.2f}s "
+            f"(budget {BET_HELP_BUDGET_SECONDS:.2f}s). Slowest imports:\n"
+            f"{slowest_imports(profile.stderr)}"
+        )
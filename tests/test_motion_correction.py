@@ -0,0 +1,108 @@
+import pytest
+import numpy as np
+import scipy.io
+
+from micaflow.scripts.motion_correction import (
+    read_itk_affine, register_volumes, save_transform_archive,
+)
+
+
+class TestReadItkAffine:
+    """Test suite for reading ANTs affine transform files."""
+
+    @pytest.mark.parametrize("key,dtype", [
+        ("AffineTransform_float_3_3", np.float32),
+        ("AffineTransform_double_3_3", np.float64),
+    ])
+    def test_matrix_and_centered_translation(self, tmp_path, key, dtype):
+        """Test that single and double precision transforms give the same 4x4 matrix."""
+        matrix = np.array([[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 2.0]])
+        translation = np.array([1.0, 2.0, 3.0])
+        center = np.array([10.0, -5.0, 4.0])
+        path = str(tmp_path / "transform.mat")
+        scipy.io.savemat(path, {
+            key: np.concatenate([matrix.ravel(), translation]).astype(dtype)[:, None],
+            "fixed": center.astype(dtype)[:, None],
+        })
+
+        affine = read_itk_affine(path)
+
+        np.testing.assert_allclose(affine[:3, :3], matrix)
+        point = np.array([3.0, 7.0, -1.0])
+        expected = matrix @ (point - center) + center + translation
+        np.testing.assert_allclose(affine[:3, :3] @ point + affine[:3, 3], expected, rtol=1e-6)
+        np.testing.assert_array_equal(affine[3], [0, 0, 0, 1])
+
+    def test_missing_parameters(self, tmp_path):
+        """Test that a file without affine parameters raises a clear error."""
+        path = str(tmp_path / "transform.mat")
+        scipy.io.savemat(path, {"fixed": np.zeros((3, 1))})
+        with pytest.raises(ValueError, match="No 3D affine transform"):
+            read_itk_affine(path)
+
+
+class TestSaveTransformArchive:
+    """Test suite for the per-volume transform archive."""
+
+    @pytest.fixture
+    def affines(self):
+        rng = np.random.default_rng(0)
+        affines = np.tile(np.eye(4), (5, 1, 1))
+        affines[:, :3, :] += rng.normal(scale=0.1, size=(5, 3, 4))
+        affines[2] = np.nan  # volume without a linear transform
+        return affines
+
+    def test_npy_round_trip(self, tmp_path, affines):
+        """Test that a .npy archive reads back the exact affines."""
+        path = str(tmp_path / "transforms.npy")
+        save_transform_archive(path, affines)
+        np.testing.assert_array_equal(np.load(path), affines)
+
+    @pytest.mark.parametrize("suffix", [".h5", ".hdf5"])
+    def test_hdf5_round_trip(self, tmp_path, affines, suffix):
+        """Test that an HDF5 archive holds the exact affines and their convention."""
+        h5py = pytest.importorskip("h5py")
+        path = str(tmp_path / f"transforms{suffix}")
+        save_transform_archive(path, affines)
+        with h5py.File(path, "r") as f:
+            np.testing.assert_array_equal(f["affines"][()], affines)
+            assert "LPS" in f["affines"].attrs["convention"]
+
+    def test_unsupported_extension(self, tmp_path, affines):
+        """Test that an unknown archive extension raises a clear error."""
+        with pytest.raises(ValueError, match="Unsupported transform archive format"):
+            save_transform_archive(str(tmp_path / "transforms.txt"), affines)
+
+
+def _synthetic_series(count=3, shape=(24, 24, 20)):
+    """Yield (index, fixed, moving) with a smooth blob shifted by a voxel per index."""
+    grid = np.indices(shape).astype(np.float32)
+    center = (np.array(shape, dtype=np.float32) - 1) / 2
+    fixed = np.exp(-sum(((g - c) / 5.0) ** 2 for g, c in zip(grid, center))) * 100.0
+    fixed += np.exp(-sum(((g - c - 4) / 3.0) ** 2 for g, c in zip(grid, center))) * 50.0
+    for i in range(count):
+        yield i, fixed, np.roll(fixed, i + 1, axis=i % 3)
+
+
+class TestRegisterVolumes:
+    """Test suite for registering a series of volumes in worker processes."""
+
+    def test_workers_match_serial(self, tmp_path, monkeypatch):
+        """Test that registering with two workers gives the serial results for every volume."""
+        # Fix the metric sampling; spawned workers inherit the environment
+        monkeypatch.setenv("ANTS_RANDOM_SEED", "42")
+        monkeypatch.setenv("ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS", "1")
+        geometry = ((0.0, 0.0, 0.0), (2.0, 2.0, 2.0), np.eye(3))
+        serial = {i: (warped, affine) for i, warped, affine in
+                  register_volumes(_synthetic_series(), geometry, str(tmp_path), workers=1)}
+        parallel = {i: (warped, affine) for i, warped, affine in
+                    register_volumes(_synthetic_series(), geometry, str(tmp_path),
+                                     workers=2, itk_threads=1)}
+
+        assert sorted(parallel) == sorted(serial) == [0, 1, 2]
+        for i, (warped, affine) in serial.items():
+            assert parallel[i][0].shape == warped.shape
+            np.testing.assert_allclose(parallel[i][0], warped, atol=1e-4)
+            np.testing.assert_allclose(parallel[i][1], affine, atol=1e-6)
+        # The scratch directories are removed in the workers as well
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,107 @@
+import pytest
+import numpy as np
+import nibabel as nib
+import torch
+
+from micaflow.scripts.SDC import make_data_object, run, run_gauss_newton
+
+
+class TestMakeDataObject:
+    """Test suite for building PyHySCO data objects from arrays."""
+
+    @pytest.mark.parametrize("shape", [(10, 12, 8), (10, 12, 8, 3)])
+    @pytest.mark.parametrize("pe_dim", [1, 2])
+    def test_matches_file_based_data_object(self, tmp_path, shape, pe_dim):
+        """Test that the in-memory object equals DataObject built from NIfTI files."""
+        from EPI_MRI.EPIMRIDistortionCorrection import DataObject
+
+        rng = np.random.default_rng(0)
+        affine = np.diag([1.5, 2.0, 2.5, 1.0])
+        im1 = rng.random(shape, dtype=np.float32) * 100
+        im2 = rng.random(shape, dtype=np.float32) * 100
+        paths = [str(tmp_path / "im1.nii.gz"), str(tmp_path / "im2.nii.gz")]
+        for image, path in zip((im1, im2), paths):
+            nib.save(nib.Nifti1Image(image, affine), path)
+
+        expected = DataObject(paths[0], paths[1], pe_dim)
+        data = make_data_object(im1, im2, affine, pe_dim)
+
+        assert data.p == expected.p
+        for name in ("omega", "m", "h", "im1", "im2"):
+            assert torch.equal(getattr(data, name), getattr(expected, name)), name
+        for name in ("I1", "I2"):
+            for attribute, value in vars(getattr(expected, name)).items():
+                if torch.is_tensor(value):
+                    assert torch.equal(getattr(getattr(data, name), attribute), value), (name, attribute)
+
+    def test_unsupported_phase_encoding_dimension(self):
+        """Test that phase encoding along the slice axis is rejected."""
+        image = np.zeros((4, 4, 4), dtype=np.float32)
+        with pytest.raises(ValueError):
+            make_data_object(image, image, np.eye(4), 3)
+
+
+class TestRunGaussNewton:
+    """Test suite for the Gauss-Newton driver of the field estimation."""
+
+    @staticmethod
+    def optimizer(path):
+        """Build a small PyHySCO problem from a shifted blob pair."""
+        from EPI_MRI.EPIMRIDistortionCorrection import (
+            EPIMRIDistortionCorrection, JacobiCG, myAvg1D, myDiff1D, myLaplacian1D,
+        )
+        from optimization.GaussNewton import GaussNewton
+
+        grid = np.stack(np.meshgrid(*[np.arange(n, dtype=np.float64) for n in (14, 16, 10)], indexing="ij"))
+        blob = lambda shift: 100 * np.exp(-((grid[0] - 7) ** 2 + (grid[1] - 8 - shift) ** 2
+                                            + (grid[2] - 5) ** 2) / 12)
+        data = make_data_object(blob(1.0), blob(-1.0), np.eye(4), 2)
+        loss_func = EPIMRIDistortionCorrection(
+            data, 300, 1e-4, averaging_operator=myAvg1D, derivative_operator=myDiff1D,
+            regularizer=myLaplacian1D, PC=JacobiCG,
+        )
+        return GaussNewton(loss_func, max_iter=30, path=str(path)), loss_func.initialize(blur_result=True)
+
+    def test_default_is_library_run(self, tmp_path):
+        """Test that without rel_tol the library's run_correction is used unchanged."""
+        opt, B0 = self.optimizer(tmp_path / "a")
+        expected = opt.run_correction(B0)
+        opt, B0 = self.optimizer(tmp_path / "b")
+        iterations = run_gauss_newton(opt, B0)
+        assert torch.equal(opt.Bc, expected)
+        assert iterations == opt.log.history[-1]["iteration"] > 0
+
+    def test_zero_rel_tol_reproduces_library_stops(self, tmp_path):
+        """Test that the custom loop keeps PyHySCO's stop criteria."""
+        opt, B0 = self.optimizer(tmp_path / "a")
+        expected = opt.run_correction(B0)
+        expected_iterations = opt.log.history[-1]["iteration"]
+        opt, B0 = self.optimizer(tmp_path / "b")
+        assert run_gauss_newton(opt, B0, rel_tol=0.0) == expected_iterations
+        torch.testing.assert_close(opt.Bc, expected)
+
+        opt, B0 = self.optimizer(tmp_path / "c")
+        assert run_gauss_newton(opt, B0, rel_tol=0.5) <= expected_iterations
+
+
+class TestRun:
+    """Test suite for the SDC entry point."""
+
+    def test_4d_input(self, tmp_path):
+        """Test that a 3D field is estimated on one volume and applied to all of them."""
+        grid = np.stack(np.meshgrid(*[np.arange(n, dtype=np.float64) for n in (16, 20, 12)], indexing="ij"))
+        blob = lambda shift: 100 * np.exp(-((grid[0] - 8) ** 2 + (grid[1] - 10 - shift) ** 2
+                                            + (grid[2] - 6) ** 2) / 16)
+        paths = []
+        for name, shift in (("ap.nii.gz", 1.0), ("pa.nii.gz", -1.0)):
+            series = np.stack([blob(shift) * scale for scale in (1.0, 0.5)], axis=-1)
+            paths.append(str(tmp_path / name))
+            nib.save(nib.Nifti1Image(series.astype(np.float32), np.eye(4)), paths[-1])
+        output, warp = str(tmp_path / "corrected.nii.gz"), str(tmp_path / "warp.nii.gz")
+
+        run(paths[0], paths[1], output, warp, direction_channel=1, max_iter=5)
+
+        assert nib.load(output).shape == (16, 20, 12, 2)
+        assert nib.load(warp).shape == (16, 20, 12)
+        with pytest.raises(ValueError):
+            run(paths[0], paths[1], output, warp, direction_channel=2)
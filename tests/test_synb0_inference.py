@@ -0,0 +1,147 @@
+import math
+
+import pytest
+import torch
+
+from micaflow.scripts.synb0_DISCO.inference import (
+    gaussian_weights,
+    sliding_window,
+    tile_size_for_budget,
+)
+
+
+class TestSlidingWindow:
+    """Test suite for tiled inference with Gaussian blending."""
+
+    def test_pointwise_forward_is_reproduced(self):
+        """Test that blending tiles of a voxel-wise forward recovers the full output."""
+        img_data = torch.rand(1, 2, 24, 32, 16)
+        forward = lambda x: x[:, :1] * 2 - x[:, 1:]
+        tiled = sliding_window(forward, img_data, tile_size=16, overlap=0.25)
+        torch.testing.assert_close(tiled, forward(img_data))
+
+    def test_leading_axes_are_kept(self):
+        """Test that stacked ensemble outputs keep their leading axes."""
+        img_data = torch.rand(1, 2, 16, 16, 16)
+        forward = lambda x: torch.stack([x[:, :1], x[:, 1:]])
+        tiled = sliding_window(forward, img_data, tile_size=8)
+        assert tiled.shape == (2, 1, 1, 16, 16, 16)
+        torch.testing.assert_close(tiled, forward(img_data))
+
+    def test_invalid_overlap(self):
+        """Test that an overlap of 1 or more is rejected."""
+        with pytest.raises(ValueError):
+            sliding_window(lambda x: x, torch.rand(1, 2, 8, 8, 8), tile_size=8, overlap=1.0)
+
+    def test_gaussian_weights_peak_at_center(self):
+        """Test that the blending weights are largest in the tile center."""
+        weights = gaussian_weights((8, 16, 8))
+        assert weights.shape == (8, 16, 8)
+        assert weights.max() == 1.0 and weights.min() > 0
+        assert weights[4, 8, 4] > weights[0, 0, 0]
+
+
+class TestTileSizeForBudget:
+    """Test suite for memory-budget tile sizing."""
+
+    def test_whole_volume_fits(self):
+        """Test that no tiling is chosen when the volume fits the budget."""
+        assert tile_size_for_budget(10000, (80, 96, 80)) is None
+
+    def test_tile_fits_budget(self):
+        """Test that the chosen tile is a multiple of 8 and fits the budget."""
+        tile = tile_size_for_budget(500, (80, 96, 80))
+        assert all(t % 8 == 0 and t <= s for t, s in zip(tile, (80, 96, 80)))
+        assert math.prod(tile) * 2500 <= 500 * 1024 ** 2
+        assert math.prod(tile_size_for_budget(500, (80, 96, 80), n_models=5)) < math.prod(tile)
+
+
+class TestBackends:
+    """Test suite for exported inference backends."""
+
+    def test_torchscript_export_matches_eager(self, tmp_path):
+        """Test that the cached TorchScript fold reproduces the eager model."""
+        from micaflow.scripts.synb0_DISCO.backends import cache_path, load_backend
+        from micaflow.scripts.synb0_DISCO.model import UNet3D
+
+        torch.manual_seed(0)
+        model_path = str(tmp_path / "fold.pth")
+        torch.save(UNet3D(2, 1).state_dict(), model_path)
+        device = torch.device("cpu")
+
+        scripted = load_backend(model_path, device, "torchscript", cache_dir=str(tmp_path))
+        assert (tmp_path / "synb0").exists()
+        assert cache_path(model_path, "torchscript", str(tmp_path)) != cache_path(
+            model_path, "torchscript", str(tmp_path), channels_last=True
+        )
+
+        x = torch.rand(1, 2, 16, 24, 16)
+        with torch.no_grad():
+            torch.testing.assert_close(scripted(x), load_backend(model_path, device)(x))
+
+    def test_preloaded_weights(self, tmp_path, monkeypatch):
+        """Test that preloaded folds are built without reading the weight file again."""
+        from micaflow.scripts.synb0_DISCO import backends
+        from micaflow.scripts.synb0_DISCO.model import UNet3D
+
+        monkeypatch.setattr(backends, "_WEIGHTS", {})
+        torch.manual_seed(0)
+        model_path = str(tmp_path / "fold.pth")
+        torch.save(UNet3D(2, 1).state_dict(), model_path)
+        expected = backends.load_model(model_path, "cpu").state_dict()
+
+        backends.preload_weights([model_path])
+        monkeypatch.setattr(torch, "load", lambda *args, **kwargs: pytest.fail("weights reloaded"))
+        for name, value in backends.load_model(model_path, "cpu").state_dict().items():
+            torch.testing.assert_close(value, expected[name])
+
+    def test_unknown_backend(self, tmp_path):
+        """Test that an unknown backend name is rejected."""
+        from micaflow.scripts.synb0_DISCO.backends import load_backend
+
+        with pytest.raises(ValueError):
+            load_backend(str(tmp_path / "fold.pth"), torch.device("cpu"), "tensorrt")
+
+
+class TestEnsembleInference:
+    """Test suite for the resident-fold ensemble."""
+
+    @pytest.fixture
+    def folds(self, tmp_path):
+        """Write a T1w / b0 pair and three random UNet3D folds."""
+        import nibabel as nib
+        import numpy as np
+        from micaflow.scripts.synb0_DISCO.model import UNet3D
+
+        rng = np.random.default_rng(0)
+        for name in ("t1.nii.gz", "b0.nii.gz"):
+            data = (rng.random((13, 14, 15)) * 200).astype(np.float32)
+            nib.save(nib.Nifti1Image(data, np.eye(4)), str(tmp_path / name))
+        torch.manual_seed(0)
+        paths = []
+        for fold in range(3):
+            paths.append(str(tmp_path / f"fold{fold}.pth"))
+            torch.save(UNet3D(2, 1).state_dict(), paths[-1])
+        return str(tmp_path / "t1.nii.gz"), str(tmp_path / "b0.nii.gz"), paths
+
+    @pytest.mark.parametrize("batch_size", [1, 2, 3])
+    def test_matches_per_fold_average(self, folds, batch_size):
+        """Test that the ensemble equals loading each fold and averaging its output."""
+        import numpy as np
+        from micaflow.scripts.synb0_DISCO import util
+        from micaflow.scripts.synb0_DISCO.backends import load_model
+        from micaflow.scripts.synb0_DISCO.ensemble import EnsembleInference
+        from micaflow.scripts.synb0_DISCO.inference import inference
+
+        t1_path, b0_path, paths = folds
+        device = torch.device("cpu")
+        expected = np.mean([
+            util.torch2nii(inference(t1_path, b0_path, load_model(path, device), device).cpu().numpy())
+            for path in paths
+        ], axis=0)
+
+        ensemble = EnsembleInference(paths, device, batch_size=batch_size)
+        predicted = ensemble.predict(t1_path, b0_path)
+        assert predicted.shape == expected.shape == (13, 14, 15, 1)
+        assert len(ensemble.timings) == -(-len(paths) // batch_size)
+        np.testing.assert_allclose(predicted, expected, rtol=1e-4, atol=1e-3)
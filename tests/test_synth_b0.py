@@ -0,0 +1,86 @@
+import pytest
+import numpy as np
+
+from micaflow.scripts.synth_b0 import compose_transform_chain
+
+ants = pytest.importorskip("ants")
+
+
+def _affine_file(path, angle, axis, translation, scale=(1.0, 1.0, 1.0), center=(24.0, 24.0, 24.0)):
+    """Write an ITK affine rotating by angle (degrees) about axis, then scaling and translating."""
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    i, j = [k for k in range(3) if k != axis]
+    matrix = np.eye(3)
+    matrix[[i, i, j, j], [i, j, i, j]] = c, -s, s, c
+    matrix = np.diag(scale) @ matrix
+    transform = ants.create_ants_transform(
+        transform_type="AffineTransform", dimension=3, matrix=matrix,
+        translation=translation, center=center,
+    )
+    ants.write_transform(transform, path)
+    return path
+
+
+class TestComposeTransformChain:
+    """Test suite for composing the synth_b0 correction chain into one field."""
+
+    @pytest.fixture
+    def chain(self, tmp_path):
+        """DWI and T1 grids, a smooth DWI volume and the transforms of the correction chain."""
+        dwi = ants.from_numpy(np.zeros((24, 24, 24), dtype=np.float32), spacing=(2.0, 2.0, 2.0))
+        t1 = ants.from_numpy(np.zeros((40, 40, 40), dtype=np.float32),
+                             origin=(-6.0, -6.0, -6.0), spacing=(1.5, 1.5, 1.5))
+        points = np.stack(np.meshgrid(*[np.arange(24) * 2.0] * 3, indexing="ij"), axis=-1)
+        blobs = (np.exp(-np.sum((points - [22.0, 26.0, 24.0]) ** 2, axis=-1) / 80.0) * 100
+                 + np.exp(-np.sum((points - [30.0, 18.0, 20.0]) ** 2, axis=-1) / 30.0) * 60)
+        volume = dwi.new_image_like(blobs.astype(np.float32))
+
+        # Smooth displacement along one axis on the T1 grid, like the PE warp
+        t1_points = np.stack(np.meshgrid(*[np.arange(40) * 1.5 - 6.0] * 3, indexing="ij"), axis=-1)
+        displacement = np.zeros(t1_points.shape, dtype=np.float32)
+        displacement[..., 1] = 2.0 * np.sin(t1_points[..., 0] / 15.0)
+        warp = str(tmp_path / "warp.nii.gz")
+        ants.image_write(ants.from_numpy(displacement, origin=t1.origin, spacing=t1.spacing,
+                                         has_components=True), warp)
+
+        distortion_affine = _affine_file(str(tmp_path / "pe_affine.mat"), 8.0, 2, (1.5, -2.0, 0.5),
+                                         scale=(1.05, 0.95, 1.0))
+        b0_to_t1_affine = _affine_file(str(tmp_path / "b0_to_t1.mat"), 12.0, 0, (-3.0, 1.0, 2.0))
+        return dwi, t1, volume, [distortion_affine, warp, b0_to_t1_affine], b0_to_t1_affine
+
+    @staticmethod
+    def _two_step(dwi, t1, volume, transformlist, b0_to_t1_affine):
+        """Resample into T1 space through the distortion chain, then back onto the DWI grid."""
+        in_t1 = ants.apply_transforms(fixed=t1, moving=volume, transformlist=transformlist,
+                                      interpolator="bSpline")
+        return ants.apply_transforms(fixed=dwi, moving=in_t1, transformlist=[b0_to_t1_affine],
+                                     whichtoinvert=[True], interpolator="bSpline").numpy()
+
+    @staticmethod
+    def _composed(tmp_path, dwi, volume, transformlist, whichtoinvert):
+        field = compose_transform_chain(dwi, transformlist, whichtoinvert,
+                                        str(tmp_path / "composed_"))
+        return ants.apply_transforms(fixed=dwi, moving=volume, transformlist=[field],
+                                     interpolator="bSpline").numpy()
+
+    def test_matches_two_step_chain(self, tmp_path, chain):
+        """Test that the composed field matches the two resampling steps within interpolation error."""
+        dwi, t1, volume, transformlist, b0_to_t1_affine = chain
+        two_step = self._two_step(dwi, t1, volume, transformlist, b0_to_t1_affine)
+        composed = self._composed(tmp_path, dwi, volume, [b0_to_t1_affine] + transformlist,
+                                  [True] + [False] * len(transformlist))
+
+        peak = volume.numpy().max()
+        error = np.abs(composed - two_step)[3:-3, 3:-3, 3:-3]
+        assert error.max() < 0.005 * peak
+        assert error.mean() < 0.0005 * peak
+
+    def test_transform_order_matters(self, tmp_path, chain):
+        """Test that the chain is not commutative, so a wrong order would be caught."""
+        dwi, t1, volume, transformlist, b0_to_t1_affine = chain
+        two_step = self._two_step(dwi, t1, volume, transformlist, b0_to_t1_affine)
+        swapped = self._composed(tmp_path, dwi, volume, [b0_to_t1_affine] + transformlist[::-1],
+                                 [True, False, False, False])
+
+        peak = volume.numpy().max()
+        assert np.abs(swapped - two_step)[3:-3, 3:-3, 3:-3].max() > 0.05 * peak
@@ -0,0 +1,128 @@
+import gzip
+
+import pytest
+import numpy as np
+import nibabel as nib
+
+from micaflow.scripts.util_gzip import (
+    IndexedGzipReader,
+    ParallelGzipWriter,
+    gzip_file,
+    gzip_threads,
+    is_indexed_gzip,
+    read_member_index,
+)
+from micaflow.scripts.util_nifti_io import iter_volumes, read_volume, save_nifti
+
+
+@pytest.fixture
+def payload():
+    """Return compressible bytes spanning several small blocks."""
+    return np.random.default_rng(0).integers(0, 50, 100_000, dtype=np.int16).tobytes()
+
+
+class TestParallelGzipWriter:
+    """Test suite for the multi-member parallel gzip writer."""
+
+    @pytest.mark.parametrize("threads", [1, 3])
+    def test_output_is_standard_gzip(self, payload, tmp_path, threads):
+        """Test that uneven writes give a gzip file any reader decompresses."""
+        path = tmp_path / "data.gz"
+        with ParallelGzipWriter(path, threads=threads, block_size=16_384) as f:
+            for start in range(0, len(payload), 7_000):
+                f.write(payload[start:start + 7_000])
+            assert f.tell() == len(payload)
+        assert gzip.decompress(path.read_bytes()) == payload
+
+        index = read_member_index(path)
+        assert len(index) == -(-len(payload) // 16_384)
+        assert [entry[2] for entry in index] == list(range(0, len(payload), 16_384))
+
+    def test_empty_stream_and_seek(self, tmp_path):
+        """Test that an empty file is valid gzip and only no-op seeks are allowed."""
+        path = tmp_path / "empty.gz"
+        with ParallelGzipWriter(path) as f:
+            f.seek(0)
+            with pytest.raises(OSError):
+                f.seek(10)
+        assert gzip.decompress(path.read_bytes()) == b""
+        assert is_indexed_gzip(path)
+
+    def test_gzip_file(self, payload, tmp_path):
+        """Test compressing an existing file."""
+        source = tmp_path / "data.bin"
+        source.write_bytes(payload)
+        gzip_file(source, tmp_path / "data.bin.gz", threads=2, block_size=10_000)
+        assert gzip.decompress((tmp_path / "data.bin.gz").read_bytes()) == payload
+
+    def test_thread_count(self, monkeypatch):
+        """Test that the count is explicit, else MICAFLOW_GZIP_THREADS, else 1."""
+        monkeypatch.delenv("MICAFLOW_GZIP_THREADS", raising=False)
+        monkeypatch.setenv("OMP_NUM_THREADS", "6")
+        monkeypatch.setattr("os.cpu_count", lambda: 6)
+        assert gzip_threads() == 1
+        assert gzip_threads(4) == 4
+        monkeypatch.setenv("MICAFLOW_GZIP_THREADS", "3")
+        assert gzip_threads() == 3
+        assert gzip_threads(2) == 2
+
+
+class TestIndexedGzipReader:
+    """Test suite for random access through the member index."""
+
+    @pytest.mark.parametrize("threads", [1, 2])
+    def test_random_and_sequential_reads(self, payload, tmp_path, threads):
+        """Test that seeks and reads across block boundaries return the right bytes."""
+        path = tmp_path / "data.gz"
+        with ParallelGzipWriter(path, block_size=16_384) as f:
+            f.write(payload)
+        with IndexedGzipReader(path, threads=threads) as f:
+            for start, size in [(150_000, 40_000), (3, 10), (16_380, 8), (199_990, 100)]:
+                f.seek(start)
+                assert f.read(size) == payload[start:start + size]
+            f.seek(0)
+            assert f.read() == payload
+
+    def test_plain_gzip_is_not_indexed(self, payload, tmp_path):
+        """Test that files of other gzip writers are recognised and rejected."""
+        path = tmp_path / "plain.gz"
+        path.write_bytes(gzip.compress(payload))
+        assert not is_indexed_gzip(path)
+        assert read_member_index(path) is None
+        with pytest.raises(ValueError):
+            IndexedGzipReader(path)
+
+
+class TestParallelNifti:
+    """Test suite for NIfTI files written through the parallel writer."""
+
+    def test_save_and_read_volumes(self, tmp_path):
+        """Test that nibabel reads the file and volume reads use the index."""
+        data = np.random.default_rng(0).random((9, 8, 7, 5)) * 1000
+        img = nib.Nifti1Image(data, np.eye(4))
+        img.set_data_dtype(np.int16)
+        path = str(tmp_path / "dwi.nii.gz")
+        save_nifti(img, path, threads=2)
+
+        assert is_indexed_gzip(path)
+        loaded = nib.load(path)
+        expected = loaded.get_fdata()
+        np.testing.assert_allclose(expected, data, atol=loaded.dataobj.slope)
+        np.testing.assert_allclose(read_volume(path, 3), expected[..., 3], rtol=1e-6, atol=1e-3)
+        for index, volume in iter_volumes(path):
+            np.testing.assert_allclose(volume, expected[..., index], rtol=1e-6, atol=1e-3)
+
+    @pytest.mark.parametrize("shape", [(9, 8, 7, 5), (2, 2, 2, 3)])
+    def test_negative_and_last_volume(self, tmp_path, shape):
+        """Test that negative indices count from the end and out-of-range ones are rejected."""
+        data = np.random.default_rng(0).random(shape).astype(np.float32)
+        path = str(tmp_path / "dwi.nii.gz")
+        save_nifti(nib.Nifti1Image(data, np.eye(4)), path)
+
+        assert is_indexed_gzip(path)
+        np.testing.assert_array_equal(read_volume(path, -1), data[..., -1])
+        np.testing.assert_array_equal(read_volume(path, shape[3] - 1), data[..., -1])
+        np.testing.assert_array_equal(read_volume(path, -shape[3]), data[..., 0])
+        for index in (shape[3], -shape[3] - 1):
+            with pytest.raises(IndexError):
+                read_volume(path, index)
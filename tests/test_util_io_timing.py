@@ -0,0 +1,60 @@
+import numpy as np
+import nibabel as nib
+
+from micaflow.scripts.util_io_timing import IO_LOG_ENV, RULE_ENV, io_timer, read_io_log, summarize_io_log
+from micaflow.scripts.util_nifti_io import iter_volumes, read_data, save_image
+
+
+class TestIOTiming:
+    """Test suite for the optional image I/O timing log."""
+
+    def test_disabled_without_environment(self, tmp_path, monkeypatch):
+        """Test that nothing is logged when MICAFLOW_IO_LOG is unset."""
+        monkeypatch.delenv(IO_LOG_ENV, raising=False)
+        path = str(tmp_path / "image.nii")
+        with io_timer("write", path):
+            save_image(np.ones((4, 4, 4)), np.eye(4), path)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["image.nii"]
+
+    def test_nifti_helpers_are_logged(self, tmp_path, monkeypatch):
+        """Test that reads and writes through util_nifti_io append rows to the log."""
+        log = tmp_path / "io.tsv"
+        monkeypatch.setenv(IO_LOG_ENV, str(log))
+        monkeypatch.delenv(RULE_ENV, raising=False)
+        path = str(tmp_path / "dwi.nii.gz")
+        save_image(np.random.default_rng(0).random((5, 6, 7, 3)), np.eye(4), path)
+        read_data(path)
+        for _ in iter_volumes(nib.load(path)):
+            pass
+
+        rows = read_io_log(log)
+        assert [row["operation"] for row in rows] == ["write", "read", "read"]
+        assert all(row["rule"] == row["command"] for row in rows)
+        assert all(row["path"] == path for row in rows)
+        size = (tmp_path / "dwi.nii.gz").stat().st_size / 1e6
+        assert all(abs(row["megabytes"] - size) < 1e-3 and row["seconds"] >= 0 for row in rows)
+
+    def test_rule_from_environment(self, tmp_path, monkeypatch):
+        """Test that rows are keyed by the Snakemake rule the pipeline sets."""
+        log = tmp_path / "io.tsv"
+        monkeypatch.setenv(IO_LOG_ENV, str(log))
+        monkeypatch.setenv(RULE_ENV, "apply_warp_t1w_to_mni")
+        save_image(np.ones((4, 4, 4)), np.eye(4), str(tmp_path / "image.nii"))
+        assert read_io_log(log)[0]["rule"] == "apply_warp_t1w_to_mni"
+
+    def test_summary_totals_per_rule(self, tmp_path, monkeypatch):
+        """Test that the summary totals files per rule and skips repeated headers."""
+        log = tmp_path / "io.tsv"
+        log.write_text(
+            "rule\tcommand\toperation\tpath\tmegabytes\tseconds\n"
+            "denoise\tdenoise\tread\t/a.nii.gz\t10.0\t1.0\n"
+            "rule\tcommand\toperation\tpath\tmegabytes\tseconds\n"
+            "denoise\tdenoise\tread\t/b.nii.gz\t5.0\t0.5\n"
+            "bet_t1w\tbet\twrite\t/c.nii\t2.0\t0.25\n"
+            "bet_flair\tbet\twrite\t/d.nii\t1.0\t0.5\n"
+        )
+        lines = summarize_io_log(log).splitlines()
+        assert lines[1].split() == ["bet_flair", "bet", "write", "1", "1.0", "0.50"]
+        assert lines[2].split() == ["bet_t1w", "bet", "write", "1", "2.0", "0.25"]
+        assert lines[3].split() == ["denoise", "denoise", "read", "2", "15.0", "1.50"]
+        assert lines[-1].split() == ["total", "4", "18.0", "2.25"]
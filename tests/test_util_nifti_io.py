@@ -0,0 +1,246 @@
+import pytest
+import numpy as np
+import nibabel as nib
+
+from micaflow.scripts.util_nifti_io import (
+    iter_slabs,
+    iter_volumes,
+    probe_image,
+    read_data,
+    read_volume,
+    read_volumes,
+    same_grid,
+    save_ants_image,
+    save_image,
+    save_labels,
+    save_volumes,
+)
+
+
+@pytest.fixture(params=["dwi.nii", "dwi.nii.gz"])
+def scaled_dwi(request, tmp_path):
+    """Write a scaled int16 4D image and return its path and float64 data."""
+    data = np.random.default_rng(0).random((5, 6, 7, 4)) * 1000
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.set_data_dtype(np.int16)
+    path = str(tmp_path / request.param)
+    nib.save(img, path)
+    return path, nib.load(path).get_fdata()
+
+
+class TestReadData:
+    """Test suite for whole-image and per-volume reads."""
+
+    def test_read_data_defaults_to_float32(self, scaled_dwi):
+        """Test that read_data returns scaled float32 data without caching it."""
+        path, expected = scaled_dwi
+        img = nib.load(path)
+        data = read_data(img)
+        assert data.dtype == np.float32
+        np.testing.assert_allclose(data, expected, rtol=1e-6, atol=1e-3)
+        assert not img.in_memory
+
+    def test_read_volume_and_volumes(self, scaled_dwi):
+        """Test that single and selected volumes match the full data."""
+        path, expected = scaled_dwi
+        np.testing.assert_allclose(read_volume(path, 2), expected[..., 2], rtol=1e-6, atol=1e-3)
+        np.testing.assert_allclose(read_volume(path, 1, axis=0), expected[1], rtol=1e-6, atol=1e-3)
+        np.testing.assert_allclose(
+            read_volumes(path, [3, 0], axis=-1), expected[..., [3, 0]], rtol=1e-6, atol=1e-3
+        )
+
+
+class TestProbeImage:
+    """Test suite for header-only probing and grid comparison."""
+
+    def test_probe_reads_header_geometry(self, scaled_dwi):
+        """Test shape, dtype, spacing and direction of a probed image."""
+        path, _ = scaled_dwi
+        info = probe_image(path)
+        assert info.path == path
+        assert info.shape == (5, 6, 7, 4) and info.ndim == 4 and info.n_volumes == 4
+        assert info.dtype == np.int16
+        assert info.spacing == (1.0, 1.0, 1.0)
+        np.testing.assert_array_equal(info.direction, np.eye(3))
+        assert probe_image(info) is info
+
+    def test_oblique_geometry(self):
+        """Test that spacing and direction are separated in oblique affines."""
+        rotation = np.array([[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+        affine = np.eye(4)
+        affine[:3, :3] = rotation * [2.0, 2.5, 3.0]
+        affine[:3, 3] = [-90, 10, 5]
+        info = probe_image(nib.Nifti1Image(np.zeros((4, 4, 4), np.uint8), affine))
+        assert info.n_volumes == 1 and info.path is None
+        np.testing.assert_allclose(info.spacing, [2.0, 2.5, 3.0])
+        np.testing.assert_allclose(info.direction, rotation)
+        np.testing.assert_array_equal(info.origin, [-90, 10, 5])
+
+    def test_same_grid(self, scaled_dwi, tmp_path):
+        """Test that a 3D mask matches a 4D series on the same grid only."""
+        path, _ = scaled_dwi
+        mask = str(tmp_path / "mask.nii.gz")
+        nib.save(nib.Nifti1Image(np.ones((5, 6, 7), np.uint8), np.eye(4)), mask)
+        assert same_grid(path, mask)
+
+        shifted = np.eye(4)
+        shifted[0, 3] = 0.5
+        assert not same_grid(path, nib.Nifti1Image(np.ones((5, 6, 7), np.uint8), shifted))
+        assert not same_grid(path, nib.Nifti1Image(np.ones((5, 6, 8), np.uint8), np.eye(4)))
+
+
+class TestIteration:
+    """Test suite for streamed volume and slab iteration."""
+
+    def test_iter_volumes_streams_every_volume(self, scaled_dwi):
+        """Test that iter_volumes yields each scaled volume in order."""
+        path, expected = scaled_dwi
+        volumes = list(iter_volumes(path))
+        assert [index for index, _ in volumes] == [0, 1, 2, 3]
+        for index, volume in volumes:
+            assert volume.dtype == np.float32
+            np.testing.assert_allclose(volume, expected[..., index], rtol=1e-6, atol=1e-3)
+
+    def test_iter_volumes_3d_image(self, tmp_path):
+        """Test that a 3D image is yielded as a single volume."""
+        path = str(tmp_path / "b0.nii.gz")
+        nib.save(nib.Nifti1Image(np.ones((3, 3, 3), dtype=np.int16), np.eye(4)), path)
+        volumes = list(iter_volumes(path))
+        assert len(volumes) == 1 and volumes[0][1].shape == (3, 3, 3)
+
+    def test_iter_slabs_covers_image(self, scaled_dwi):
+        """Test that slabs tile the slice axis and include all volumes."""
+        path, expected = scaled_dwi
+        slabs = list(iter_slabs(path, slab_size=3))
+        assert [s for s, _ in slabs] == [slice(0, 3), slice(3, 6), slice(6, 7)]
+        for s, slab in slabs:
+            np.testing.assert_allclose(slab, expected[:, :, s], rtol=1e-6, atol=1e-3)
+
+
+class TestSaveVolumes:
+    """Test suite for writing volume subsets."""
+
+    def test_streamed_subset_keeps_dtype_and_scaling(self, scaled_dwi, tmp_path):
+        """Test that saved volumes keep the stored values, dtype and scaling."""
+        path, expected = scaled_dwi
+        out = save_volumes(path, [0, 2, 3], str(tmp_path / "subset.nii.gz"))
+        saved, source = nib.load(out), nib.load(path)
+        assert saved.shape == (5, 6, 7, 3)
+        assert saved.get_data_dtype() == np.int16
+        assert (saved.dataobj.slope, saved.dataobj.inter) == (source.dataobj.slope, source.dataobj.inter)
+        np.testing.assert_array_equal(saved.get_fdata(), expected[..., [0, 2, 3]])
+        np.testing.assert_array_equal(saved.affine, source.affine)
+
+    def test_single_index_saves_3d(self, scaled_dwi, tmp_path):
+        """Test that a single index is saved as a 3D volume."""
+        path, expected = scaled_dwi
+        saved = nib.load(save_volumes(path, 1, str(tmp_path / "b0.nii")))
+        assert saved.shape == (5, 6, 7)
+        np.testing.assert_array_equal(saved.get_fdata(), expected[..., 1])
+
+    def test_negative_indices_match_read_volume(self, scaled_dwi, tmp_path):
+        """Test that negative indices select the same volumes as read_volume."""
+        path, expected = scaled_dwi
+        saved = nib.load(save_volumes(path, -1, str(tmp_path / "last.nii.gz")))
+        np.testing.assert_array_equal(saved.get_fdata(), expected[..., -1])
+        np.testing.assert_allclose(saved.get_fdata(), read_volume(path, -1), rtol=1e-6)
+        saved = nib.load(save_volumes(path, [-1, 0], str(tmp_path / "pair.nii.gz")))
+        np.testing.assert_array_equal(saved.get_fdata(), expected[..., [3, 0]])
+
+    @pytest.mark.parametrize("indices", [4, -5, [0, 4]])
+    def test_out_of_range_index(self, scaled_dwi, tmp_path, indices):
+        """Test that out-of-range indices are rejected before any output is written."""
+        path, _ = scaled_dwi
+        out = tmp_path / "bad.nii.gz"
+        with pytest.raises(IndexError):
+            save_volumes(path, indices, str(out))
+        assert not out.exists()
+
+    def test_in_memory_image(self, tmp_path):
+        """Test that in-memory images are saved through nibabel."""
+        data = np.arange(3 * 3 * 3 * 2, dtype=np.float32).reshape(3, 3, 3, 2)
+        saved = nib.load(save_volumes(nib.Nifti1Image(data, np.eye(4)), [1], str(tmp_path / "v.nii.gz")))
+        np.testing.assert_array_equal(saved.get_fdata(), data[..., [1]])
+
+
+class TestSaveImage:
+    """Test suite for the output dtype policy."""
+
+    def test_continuous_is_float32(self, tmp_path, monkeypatch):
+        """Test that float64 data without a reference header are saved as float32."""
+        monkeypatch.delenv("MICAFLOW_SCALED_INT16", raising=False)
+        data = np.random.default_rng(0).random((4, 4, 4))
+        saved = nib.load(save_image(data, np.eye(4), str(tmp_path / "map.nii.gz")))
+        assert saved.get_data_dtype() == np.float32
+        np.testing.assert_allclose(saved.get_fdata(), data, rtol=1e-6)
+
+    def test_continuous_keeps_header_dtype(self, scaled_dwi, tmp_path, monkeypatch):
+        """Test that data derived from an input keep the input's dtype."""
+        monkeypatch.delenv("MICAFLOW_SCALED_INT16", raising=False)
+        path, expected = scaled_dwi
+        source = nib.load(path)
+        saved = nib.load(save_image(read_data(source), source.affine, str(tmp_path / "out.nii.gz"),
+                                    header=source.header))
+        assert saved.get_data_dtype() == np.int16
+        np.testing.assert_allclose(saved.get_fdata(), expected, atol=source.dataobj.slope)
+
+    def test_mask_and_labels(self, tmp_path):
+        """Test that masks are uint8 and labels use the smallest integer type."""
+        data = np.zeros((3, 3, 3))
+        data[0, 0, 0], data[1, 1, 1] = 2.0, 300.0
+        mask = nib.load(save_image(data, np.eye(4), str(tmp_path / "mask.nii.gz"), kind="mask"))
+        assert mask.get_data_dtype() == np.uint8
+        np.testing.assert_array_equal(mask.get_fdata(), data != 0)
+        labels = nib.load(save_image(data, np.eye(4), str(tmp_path / "labels.nii.gz"), kind="labels"))
+        assert labels.get_data_dtype() == np.int16
+        np.testing.assert_array_equal(labels.get_fdata(), data)
+        small = nib.load(save_image(data.clip(0, 3), np.eye(4), str(tmp_path / "small.nii.gz"), kind="labels"))
+        assert small.get_data_dtype() == np.uint8
+
+    def test_save_labels(self, tmp_path):
+        """Test that a label map saved as floats is rewritten as integers."""
+        data = np.arange(27, dtype=np.float32).reshape(3, 3, 3)
+        affine = np.diag([2.0, 2.0, 2.0, 1.0])
+        path = str(tmp_path / "seg.nii.gz")
+        nib.save(nib.Nifti1Image(data, affine), path)
+        save_labels(path)
+        labels = nib.load(path)
+        assert labels.get_data_dtype() == np.uint8
+        np.testing.assert_array_equal(labels.get_fdata(), data)
+        np.testing.assert_array_equal(labels.affine, affine)
+
+    def test_save_labels_keeps_integer_maps(self, tmp_path, monkeypatch):
+        """Test that an integer label map is neither decoded nor rewritten."""
+        path = str(tmp_path / "seg.nii.gz")
+        nib.save(nib.Nifti1Image(np.ones((3, 3, 3), dtype=np.int32), np.eye(4)), path)
+        before = (tmp_path / "seg.nii.gz").stat().st_mtime_ns
+        monkeypatch.setattr(nib.Nifti1Image, "get_fdata", None)
+        assert save_labels(path) == path
+        assert (tmp_path / "seg.nii.gz").stat().st_mtime_ns == before
+
+    @pytest.mark.parametrize("name", ["seg.nii", "seg.nii.gz"])
+    def test_ants_labels(self, tmp_path, name):
+        """Test that ANTs label maps are saved as integers on the ANTs grid."""
+        ants = pytest.importorskip("ants")
+        data = np.zeros((4, 5, 6), dtype=np.float32)
+        data[1, 2, 3], data[2, 3, 4] = 4.0, 1000.0
+        image = ants.from_numpy(data, origin=(1.0, 2.0, 3.0), spacing=(1.5, 1.0, 2.0))
+        image.to_file(str(tmp_path / "reference.nii"))
+        labels = nib.load(save_ants_image(image, str(tmp_path / name), kind="labels"))
+        assert labels.get_data_dtype() == np.int16
+        np.testing.assert_array_equal(labels.get_fdata(), data)
+        np.testing.assert_allclose(labels.affine, nib.load(str(tmp_path / "reference.nii")).affine)
+
+    def test_opt_in_scaled_int16(self, tmp_path, monkeypatch):
+        """Test that MICAFLOW_SCALED_INT16 stores continuous data as scaled int16."""
+        monkeypatch.setenv("MICAFLOW_SCALED_INT16", "1")
+        data = np.random.default_rng(0).random((4, 4, 4)) * 1e-3
+        saved = nib.load(save_image(data, np.eye(4), str(tmp_path / "md.nii.gz")))
+        assert saved.get_data_dtype() == np.int16
+        assert saved.dataobj.slope != 1.0
+        np.testing.assert_allclose(saved.get_fdata(), data, atol=data.max() / 30000)
+
+    def test_unknown_kind(self, tmp_path):
+        """Test that unknown output kinds are rejected."""
+        with pytest.raises(ValueError):
+            save_image(np.zeros((2, 2, 2)), np.eye(4), str(tmp_path / "x.nii"), kind="probability")
@@ -0,0 +1,84 @@
+import pytest
+import numpy as np
+
+from micaflow.scripts.util_patch2self import loo_coefficients, patch2self_ols
+
+
+@pytest.fixture
+def series():
+    """Return a small correlated 4D series with two b0 and six DWI volumes."""
+    rng = np.random.default_rng(0)
+    shape = (9, 8, 7)
+    signal = rng.random(shape + (1,)) * 1000
+    data = signal * rng.uniform(0.3, 1.0, 8) + rng.normal(0, 20, shape + (8,))
+    bvals = np.array([0, 1000, 1000, 5, 1000, 2000, 2000, 1000])
+    return np.asfortranarray(data.astype(np.float32)), bvals
+
+
+def reference_fit(X, j):
+    """Fit volume j on the other volumes with an intercept by least squares."""
+    others = np.delete(X, j, axis=1).astype(np.float64)
+    design = np.column_stack([others, np.ones(len(X))])
+    coef = np.linalg.lstsq(design, X[:, j].astype(np.float64), rcond=None)[0]
+    return design @ coef
+
+
+class TestPatch2SelfOLS:
+    """Test suite for the shared-Gram OLS Patch2Self."""
+
+    def test_coefficients_match_least_squares(self, series):
+        """Test that every leave-one-out fit equals a separate regression."""
+        data, _ = series
+        X = data.reshape(-1, data.shape[3], order="F")
+        B, intercept = loo_coefficients(X, chunk_voxels=100)
+        for j in range(X.shape[1]):
+            np.testing.assert_allclose(X @ B[:, j] + intercept[j], reference_fit(X, j), rtol=1e-4, atol=1e-2)
+
+    def test_denoises_dwi_and_copies_b0(self, series):
+        """Test that DWI volumes are predicted and b0 volumes left unchanged."""
+        data, bvals = series
+        denoised = patch2self_ols(data, bvals, chunk_voxels=100, threads=2, dipy_intercept=False)
+        assert denoised.dtype == np.float32 and denoised.shape == data.shape
+        np.testing.assert_array_equal(denoised[..., [0, 3]], data[..., [0, 3]])
+
+        dwi = np.flatnonzero(bvals > 50)
+        X = data[..., dwi].reshape(-1, dwi.size, order="F")
+        for k, j in enumerate(dwi):
+            expected = reference_fit(X, k).reshape(data.shape[:3], order="F")
+            np.testing.assert_allclose(denoised[..., j], expected, rtol=1e-4, atol=1e-2)
+
+    def test_b0_denoising(self, series):
+        """Test that b0 volumes are predicted from each other when requested."""
+        data, bvals = series
+        denoised = patch2self_ols(data, bvals, b0_denoising=True, dipy_intercept=False)
+        X = data[..., [0, 3]].reshape(-1, 2, order="F")
+        expected = reference_fit(X, 0).reshape(data.shape[:3], order="F")
+        np.testing.assert_allclose(denoised[..., 0], expected, rtol=1e-4, atol=1e-2)
+
+    @pytest.mark.parametrize("b0_denoising", [False, True])
+    @pytest.mark.parametrize("clip_negative_vals", [False, True])
+    def test_matches_dipy(self, b0_denoising, clip_negative_vals):
+        """Test that the output equals DIPY's version 1 OLS Patch2Self."""
+        dipy_patch2self = pytest.importorskip("dipy.denoise.patch2self")
+        pytest.importorskip("sklearn")
+        rng = np.random.default_rng(0)
+        bvals = np.array([0, 0, 0] + [1000] * 13 + [2000] * 14)
+        signal = rng.random((20, 20, 10, 1)) * 100 + 100
+        decay = np.exp(-bvals * rng.uniform(0.5e-3, 1.5e-3, bvals.size))
+        data = (signal * decay + rng.normal(0, 10, signal.shape[:3] + (bvals.size,))).astype(np.float32)
+
+        expected = dipy_patch2self.patch2self(
+            data, bvals, model="ols", b0_threshold=50, b0_denoising=b0_denoising,
+            shift_intensity=not clip_negative_vals, clip_negative_vals=clip_negative_vals, version=1,
+        )
+        denoised = patch2self_ols(data, bvals, b0_threshold=50, b0_denoising=b0_denoising,
+                                  clip_negative_vals=clip_negative_vals)
+        np.testing.assert_allclose(denoised, expected, rtol=0, atol=1e-2)
+
+    def test_invalid_input(self, series):
+        """Test that non-4D data and mismatched b-values are rejected."""
+        data, bvals = series
+        with pytest.raises(ValueError):
+            patch2self_ols(data[..., 0], bvals)
+        with pytest.raises(ValueError):
+            patch2self_ols(data, bvals[:-1])
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+
+from micaflow.scripts.util_tensor_fit import fit_tensor_metrics
+
+
+def synthetic_tensors(n_voxels=50, seed=0):
+    """Return noise-free signals of random prolate tensors with known eigen-decomposition."""
+    from dipy.core.gradients import gradient_table
+
+    rng = np.random.default_rng(seed)
+    bvecs = rng.standard_normal((31, 3))
+    bvecs /= np.linalg.norm(bvecs, axis=1, keepdims=True)
+    bvecs[0] = 0
+    bvals = np.r_[0, np.full(30, 1000.0)]
+    gtab = gradient_table(bvals, bvecs=bvecs)
+
+    evals = np.column_stack([rng.uniform(1.2e-3, 1.8e-3, n_voxels),
+                             np.full(n_voxels, 0.4e-3), np.full(n_voxels, 0.3e-3)])
+    rotations = np.linalg.qr(rng.standard_normal((n_voxels, 3, 3)))[0]
+    tensors = rotations @ (evals[:, :, None] * np.swapaxes(rotations, 1, 2))
+    signal = 1000 * np.exp(-bvals * np.einsum("gi,nij,gj->ng", bvecs, tensors, bvecs))
+    return signal.astype(np.float32), gtab, evals, rotations[:, :, 0], tensors
+
+
+class TestFitTensorMetrics:
+    """Test suite for the chunked multi-metric tensor fit."""
+
+    @pytest.mark.parametrize("fit_method", ["wls", "ols"])
+    def test_recovers_known_tensors(self, fit_method):
+        """Test that all metrics match the generating tensors."""
+        signal, gtab, evals, v1, tensors = synthetic_tensors()
+        maps = fit_tensor_metrics(signal, gtab, ("fa", "md", "ad", "rd", "mode", "v1", "tensor"),
+                                  fit_method=fit_method, chunk_voxels=16)
+
+        md = evals.mean(axis=1)
+        fa = np.sqrt(1.5 * ((evals - md[:, None]) ** 2).sum(axis=1) / (evals ** 2).sum(axis=1))
+        np.testing.assert_allclose(maps["fa"], fa, atol=1e-4)
+        np.testing.assert_allclose(maps["md"], md, rtol=1e-4)
+        np.testing.assert_allclose(maps["ad"], evals[:, 0], rtol=1e-4)
+        np.testing.assert_allclose(maps["rd"], evals[:, 1:].mean(axis=1), rtol=1e-4)
+        assert maps["mode"].shape == (len(signal),)
+        np.testing.assert_allclose(np.abs((maps["v1"] * v1).sum(axis=1)), 1, atol=1e-4)
+        lower = tensors[:, [0, 1, 1, 2, 2, 2], [0, 0, 1, 0, 1, 2]]
+        np.testing.assert_allclose(maps["tensor"], lower, atol=1e-7)
+        assert all(value.dtype == np.float32 for value in maps.values())
+
+    def test_workers_match_single_process(self):
+        """Test that fitting chunks in worker processes gives the same maps."""
+        signal, gtab, *_ = synthetic_tensors()
+        single = fit_tensor_metrics(signal, gtab, ("fa", "v1"), chunk_voxels=16)
+        pooled = fit_tensor_metrics(signal, gtab, ("fa", "v1"), workers=2, chunk_voxels=16)
+        for name in single:
+            np.testing.assert_array_equal(pooled[name], single[name])
+
+    def test_empty_and_invalid_input(self):
+        """Test empty voxel lists and rejection of unknown options."""
+        signal, gtab, *_ = synthetic_tensors()
+        maps = fit_tensor_metrics(signal[:0], gtab, ("fa", "v1"))
+        assert maps["fa"].shape == (0,) and maps["v1"].shape == (0, 3)
+        with pytest.raises(ValueError):
+            fit_tensor_metrics(signal, gtab, ("fa", "kurtosis"))
+        with pytest.raises(ValueError):
+            fit_tensor_metrics(signal, gtab, fit_method="nlls")
@@ -0,0 +1,60 @@
+import pytest
+import numpy as np
+
+from micaflow.scripts.util_voxel_list import VoxelList
+
+
+@pytest.fixture
+def mask_and_series():
+    """Return a random 3D mask and a Fortran-ordered 4D series on its grid."""
+    rng = np.random.default_rng(0)
+    shape = (7, 6, 5)
+    mask = rng.random(shape) < 0.4
+    series = np.asfortranarray(rng.random(shape + (4,)) * 100)
+    return mask, series
+
+
+class TestVoxelList:
+    """Test suite for gathering and scattering in-mask voxels."""
+
+    def test_gather_selects_mask_voxels(self, mask_and_series):
+        """Test that gathered rows are the in-mask voxels in NIfTI order."""
+        mask, series = mask_and_series
+        voxels = VoxelList(mask)
+        X = voxels.gather(series)
+        assert X.dtype == np.float32 and X.shape == (mask.sum(), 4)
+        expected = series.reshape(-1, 4, order="F")[mask.ravel(order="F")]
+        np.testing.assert_allclose(X, expected, rtol=1e-6)
+        assert voxels.gather(series[..., 0]).shape == (mask.sum(),)
+        assert voxels.fraction == pytest.approx(mask.mean())
+
+    def test_scatter_round_trip(self, mask_and_series):
+        """Test that scattering gathered values restores the masked image."""
+        mask, series = mask_and_series
+        voxels = VoxelList(mask)
+        restored = voxels.scatter(voxels.gather(series, dtype=series.dtype))
+        np.testing.assert_array_equal(restored, series * mask[..., None])
+
+        filled = voxels.scatter(np.ones(voxels.n_voxels), fill=-1, dtype=np.int16)
+        assert filled.dtype == np.int16
+        np.testing.assert_array_equal(filled, np.where(mask, 1, -1))
+
+    def test_scatter_into_existing_array(self, mask_and_series):
+        """Test that scattering into out leaves voxels outside the mask unchanged."""
+        mask, series = mask_and_series
+        voxels = VoxelList(mask)
+        out = series.copy()
+        voxels.scatter(np.zeros((voxels.n_voxels, 4)), out=out)
+        np.testing.assert_array_equal(out[mask], 0)
+        np.testing.assert_array_equal(out[~mask], series[~mask])
+
+    def test_shape_mismatch(self, mask_and_series):
+        """Test that images and values not matching the mask are rejected."""
+        mask, _ = mask_and_series
+        voxels = VoxelList(mask[..., None])
+        with pytest.raises(ValueError):
+            voxels.gather(np.zeros((4, 4, 4, 2)))
+        with pytest.raises(ValueError):
+            voxels.scatter(np.zeros(voxels.n_voxels + 1))
+        with pytest.raises(ValueError):
+            VoxelList(np.zeros((4, 4)))